@@ -1,21 +1,116 @@
 from __future__ import annotations
-import os, time, requests
+import os, time, json, random, asyncio, logging, threading, requests
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple, Union
 from dotenv import load_dotenv
 
+from http_pool import get_session
+from circuit_breaker import get_breaker
+from ratelimit import llm_slot
+
 load_dotenv()
 
-OPENROUTER_API = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
+# Сколько запросов к OpenRouter одновременно держим «в полёте» при пакетных вызовах
+MAX_IN_FLIGHT = int(os.getenv("OPENROUTER_MAX_IN_FLIGHT", "8"))
+
+# Повторы при 429/500/502/503: экспоненциальная пауза со случайным разбросом (full jitter),
+# для 429 — не меньше Retry-After. Таймауты (504) не повторяем: они и так стоили timeout_s.
+RETRY_ATTEMPTS = max(1, int(os.getenv("OPENROUTER_RETRY_ATTEMPTS", "3")))   # 0 и меньше — одна попытка
+RETRY_BASE_S = float(os.getenv("OPENROUTER_RETRY_BASE_S", "0.5"))
+RETRY_MAX_S = float(os.getenv("OPENROUTER_RETRY_MAX_S", "8"))
+RETRY_STATUSES = {429, 500, 502, 503}
+# Ошибки, которые считает circuit breaker модели (429 — это лимит, а не отказ модели)
+BREAKER_STATUSES = {500, 502, 503, 504}
+
+log = logging.getLogger(__name__)
+RETRY_STATS = {"retries": 0, "retry_after_honoured": 0, "gave_up": 0, "short_circuited": 0}
+_stats_lock = threading.Lock()
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        RETRY_STATS[name] += 1
+
 @dataclass
 class OpenRouterError(Exception):
     status: int
     msg: str
+    retry_after: float | None = None  # из заголовка Retry-After (для 429)
     def __str__(self) -> str:
         return f"[{self.status}] {self.msg}"
 
+class CircuitOpenError(OpenRouterError):
+    """Модель недавно падала раз за разом — запрос отклонён без похода в сеть."""
+
+class RateLimitedError(OpenRouterError):
+    """Исчерпано общее ведро запросов к OpenRouter (ratelimit.py) — в сеть не ходили."""
+
+def _take_llm_slot() -> None:
+    wait = llm_slot()
+    if wait:
+        raise RateLimitedError(429, f"Сейчас слишком много вопросов к моделям, повторите через "
+                                    f"{wait:.0f} с.", wait)
+
+def _retry_after(r: requests.Response) -> float | None:
+    try:
+        return float(r.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+def _backoff_s(attempt: int, e: OpenRouterError) -> float:
+    delay = random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * 2 ** attempt))
+    if e.retry_after is not None:
+        delay = max(delay, e.retry_after)
+    return delay
+
+def _guarded(model: str, call, attempts: int | None = None):
+    """
+    Вызов к модели через её circuit breaker и с повторами (до attempts попыток,
+    по умолчанию RETRY_ATTEMPTS). Пока breaker открыт, сразу бросает CircuitOpenError (503).
+    Каждая попытка берёт токен общего ведра (ratelimit.llm_slot); не дождались — RateLimitedError.
+    """
+    breaker = get_breaker(model)
+    attempts = max(1, attempts or RETRY_ATTEMPTS)
+    for attempt in range(attempts):
+        if not breaker.allow():
+            _count("short_circuited")
+            raise CircuitOpenError(503, f"Модель {model} временно недоступна, повторите через "
+                                        f"{breaker.retry_in():.0f} с.")
+        try:
+            _take_llm_slot()
+        except Exception:
+            breaker.release()  # до модели не дошли: пробный вызов half_open достанется следующему
+            raise
+        try:
+            result = call()
+        except OpenRouterError as e:
+            if e.status in BREAKER_STATUSES:
+                breaker.on_failure()
+            else:
+                breaker.on_success()  # 4xx/429: модель ответила, значит она жива
+            if e.status not in RETRY_STATUSES or attempt + 1 >= attempts:
+                if e.status in RETRY_STATUSES:
+                    _count("gave_up")
+                raise
+            if e.retry_after is not None and e.retry_after > RETRY_MAX_S:
+                _count("gave_up")
+                raise  # ждать дольше, чем готов пользователь, смысла нет
+            delay = _backoff_s(attempt, e)
+            _count("retries")
+            if e.retry_after is not None:
+                _count("retry_after_honoured")
+            log.info("OpenRouter %s: %s, повтор %d через %.2f с", model, e, attempt + 1, delay)
+            time.sleep(delay)
+            continue
+        except Exception:
+            breaker.on_failure()
+            raise
+        breaker.on_success()
+        return result
+
 def _friendly(status: int) -> str:
     """Возвращает понятные сообщения об ошибках для пользователя"""
     error_messages = {
@@ -32,11 +127,21 @@ def _friendly(status: int) -> str:
     }
     return error_messages.get(status, "Сервис недоступен. Повторите попытку позже.")
 
+def _stream_error_status(error) -> int:
+    """HTTP-код из ошибки в SSE-потоке; code бывает строкой («rate_limit») или отсутствует — тогда 500."""
+    code = error.get("code") if isinstance(error, dict) else None
+    try:
+        status = int(code)
+    except (TypeError, ValueError):
+        return 500
+    return status if 100 <= status <= 599 else 500
+
 def chat_once(messages: List[Dict], *,
               model: str,
               temperature: float = 0.2,
               max_tokens: int = 400,
-              timeout_s: int = 30) -> Tuple[str, int]:
+              timeout_s: int = 30,
+              attempts: int | None = None) -> Tuple[str, int]:
     """
     Реальный запрос к OpenRouter API с обработкой ошибок 500, 502, 503, 504
     """
@@ -56,26 +161,166 @@ def chat_once(messages: List[Dict], *,
     }
     
     t0 = time.perf_counter()
-    
+    text = _guarded(model, lambda: _post_once(payload, headers, timeout_s), attempts)
+    return text, int((time.perf_counter() - t0) * 1000)
+
+def _post_once(payload: Dict, headers: Dict, timeout_s: int) -> str:
     try:
-        r = requests.post(OPENROUTER_API, json=payload, headers=headers, timeout=timeout_s)
-        dt_ms = int((time.perf_counter() - t0) * 1000)
+        # keep-alive сессия из пула: без нового TCP+TLS handshake на каждый вопрос
+        r = get_session().post(OPENROUTER_API, json=payload, headers=headers, timeout=timeout_s)
         
         # Обработка HTTP ошибок включая 5xx (задание 3)
         if r.status_code // 100 != 2:
-            raise OpenRouterError(r.status_code, _friendly(r.status_code))
+            raise OpenRouterError(r.status_code, _friendly(r.status_code), _retry_after(r))
         
         try:
             data = r.json()
-            text = data["choices"][0]["message"]["content"]
+            return data["choices"][0]["message"]["content"]
         except Exception:
             raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.")
         
-        return text, dt_ms
-        
+    except OpenRouterError:
+        raise
     except requests.exceptions.Timeout:
         raise OpenRouterError(504, "Ошибка 504 — сервер не ответил вовремя. Повторите попытку.")
     except requests.exceptions.ConnectionError:
         raise OpenRouterError(503, "Ошибка 503 — сервис временно недоступен. Подождите немного.")
     except Exception as e:
-        raise OpenRouterError(500, f"Внутренняя ошибка: {str(e)}")
\ No newline at end of file
+        raise OpenRouterError(500, f"Внутренняя ошибка: {str(e)}")
+
+
+# ---------- потоковый режим (stream: true, Server-Sent Events) ----------
+class ChatStream:
+    """
+    Итератор по кускам ответа модели. Запрос уже отправлен и код ответа проверен
+    в chat_stream(), поэтому ошибки 4xx/5xx приходят до первого куска.
+
+    После первого куска доступен ttft_ms (time to first token),
+    после окончания — total_ms и text (весь ответ).
+    """
+
+    def __init__(self, response: requests.Response, t0: float) -> None:
+        self._r = response
+        self._t0 = t0
+        self.ttft_ms: int | None = None
+        self.total_ms: int | None = None
+        self._parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for line in self._r.iter_lines(decode_unicode=False):
+                # SSE: «data: {...}», комментарии «: OPENROUTER PROCESSING», пустые строки
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if "error" in chunk:
+                    status = _stream_error_status(chunk["error"])
+                    raise OpenRouterError(status, _friendly(status))
+                try:
+                    delta = chunk["choices"][0].get("delta", {}).get("content") or ""
+                except (KeyError, IndexError):
+                    raise OpenRouterError(500, "Неожиданная структура ответа OpenRouter.")
+                if not delta:
+                    continue
+                if self.ttft_ms is None:
+                    self.ttft_ms = int((time.perf_counter() - self._t0) * 1000)
+                self._parts.append(delta)
+                yield delta
+        except requests.exceptions.Timeout:
+            raise OpenRouterError(504, "Ошибка 504 — сервер не ответил вовремя. Повторите попытку.")
+        except requests.exceptions.ConnectionError:
+            raise OpenRouterError(503, "Ошибка 503 — сервис временно недоступен. Подождите немного.")
+        finally:
+            self.total_ms = int((time.perf_counter() - self._t0) * 1000)
+            self._r.close()
+
+def chat_stream(messages: List[Dict], *,
+                model: str,
+                temperature: float = 0.2,
+                max_tokens: int = 400,
+                timeout_s: int = 30,
+                attempts: int | None = None) -> ChatStream:
+    """Как chat_once, но с stream: true — ответ читается кусками по мере генерации."""
+    if not OPENROUTER_API_KEY:
+        raise OpenRouterError(401, "Отсутствует OPENROUTER_API_KEY (.env).")
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True,
+    }
+    t0 = time.perf_counter()
+
+    def _open() -> requests.Response:
+        try:
+            # timeout здесь — на соединение и на паузу между кусками, а не на весь ответ
+            r = get_session().post(OPENROUTER_API, json=payload, headers=headers, timeout=timeout_s, stream=True)
+        except requests.exceptions.Timeout:
+            raise OpenRouterError(504, "Ошибка 504 — сервер не ответил вовремя. Повторите попытку.")
+        except requests.exceptions.ConnectionError:
+            raise OpenRouterError(503, "Ошибка 503 — сервис временно недоступен. Подождите немного.")
+        if r.status_code // 100 != 2:
+            r.close()
+            raise OpenRouterError(r.status_code, _friendly(r.status_code), _retry_after(r))
+        return r
+
+    # breaker и повторы — только до начала ответа: оборванный стрим повторять некуда
+    return ChatStream(_guarded(model, _open, attempts), t0)
+
+
+ChatResult = Union[Tuple[str, int], OpenRouterError]
+
+def _chat_safe(job: Dict) -> ChatResult:
+    try:
+        return chat_once(**job)
+    except OpenRouterError as e:
+        return e
+
+def chat_many(jobs: List[Dict], *, max_in_flight: int = MAX_IN_FLIGHT) -> List[ChatResult]:
+    """
+    Параллельно выполняет несколько запросов (job = kwargs для chat_once, включая messages).
+    Возвращает результаты в том же порядке: (text, dt_ms) или OpenRouterError.
+    """
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(jobs)), thread_name_prefix="openrouter") as pool:
+        return list(pool.map(_chat_safe, jobs))
+
+# ---------- asyncio-вариант ----------
+# Отдельной async HTTP-библиотеки в зависимостях нет, поэтому запрос выполняется
+# в пуле потоков через ту же keep-alive сессию, а семафор ограничивает число
+# одновременных запросов.
+
+async def achat_once(messages: List[Dict], *, semaphore: asyncio.Semaphore | None = None, **kwargs) -> Tuple[str, int]:
+    if semaphore is None:
+        return await asyncio.to_thread(chat_once, messages, **kwargs)
+    async with semaphore:
+        return await asyncio.to_thread(chat_once, messages, **kwargs)
+
+async def achat_many(jobs: List[Dict], *, max_in_flight: int = MAX_IN_FLIGHT) -> List[ChatResult]:
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def _one(job: Dict) -> ChatResult:
+        job = dict(job)
+        try:
+            return await achat_once(job.pop("messages"), semaphore=semaphore, **job)
+        except OpenRouterError as e:
+            return e
+
+    return list(await asyncio.gather(*(_one(j) for j in jobs)))
@@ -0,0 +1,77 @@
+"""
+bench_breaker.py — модель «лежит»: сколько ждёт пользователь без circuit breaker
+и с ним, и как повторы с Retry-After переживают короткую полосу 429.
+
+Запуск из корня репозитория:
+    python -m bench.bench_breaker [запросов] [задержка_ошибки_мс]
+"""
+
+from __future__ import annotations
+import logging
+import os
+import sys
+import time
+
+from bench.stub_openrouter import start_stub
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+FAIL_MS = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+server, url = start_stub(models={
+    "down": {"delay_ms": FAIL_MS, "status": 503},
+    "limited": {"delay_ms": 20, "status": 429},
+    "flaky": {"delay_ms": 50, "error_rate": 0.3},
+})
+os.environ.update(OPENROUTER_API_URL=url, OPENROUTER_API_KEY="stub", RATE_LIMIT_LLM="off",
+                  CB_RESET_TIMEOUT_S="60", OPENROUTER_RETRY_BASE_S="0.05")
+
+import ai_client  # noqa: E402
+from ai_client import OpenRouterError  # noqa: E402
+from circuit_breaker import get_breaker  # noqa: E402
+
+logging.getLogger("ai_client").setLevel(logging.ERROR)
+logging.getLogger("circuit_breaker").setLevel(logging.ERROR)
+MSGS = [{"role": "user", "content": "вопрос"}]
+
+
+def ask(model: str) -> tuple[float, str]:
+    t0 = time.perf_counter()
+    try:
+        ai_client.chat_once(MSGS, model=model)
+        outcome = "ok"
+    except OpenRouterError as e:
+        outcome = type(e).__name__
+    return (time.perf_counter() - t0) * 1000, outcome
+
+
+def series(label: str, model: str, n: int = N) -> None:
+    before = server.requests
+    results = [ask(model) for _ in range(n)]
+    ms = sorted(r[0] for r in results)
+    outcomes: dict[str, int] = {}
+    for _, o in results:
+        outcomes[o] = outcomes.get(o, 0) + 1
+    print(f"{label:>22}: p50 {ms[len(ms) // 2]:.0f} мс, макс. {ms[-1]:.0f} мс, всего {sum(ms) / 1000:.1f} с, "
+          f"запросов к заглушке {server.requests - before}, исходы {outcomes}")
+
+
+def main() -> None:
+    print(f"{N} вопросов подряд; «down» отвечает 503 через {FAIL_MS} мс")
+    ai_client.RETRY_ATTEMPTS = 1
+    get_breaker("down").failure_threshold = 10 ** 9
+    series("без breaker и повторов", "down")
+
+    ai_client.RETRY_ATTEMPTS = 3
+    get_breaker("down").failure_threshold = 5
+    get_breaker("down").on_success()
+    series("breaker + повторы", "down")
+    print("  состояние:", get_breaker("down").stats())
+
+    series("flaky (30% 503)", "flaky")
+    series("429, Retry-After: 1", "limited", 3)
+    print("  повторы:", ai_client.RETRY_STATS)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
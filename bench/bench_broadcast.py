@@ -0,0 +1,96 @@
+"""
+bench_broadcast.py — рассылка на фейковом Bot API: прежний последовательный цикл
+(send + mark_sent_today на каждого) против broadcast.Broadcaster.
+
+Фейковый send_message спит latency_ms и изредка отвечает 429 с retry_after.
+Лимит Broadcaster поднят (--rate), чтобы видеть потолок самого пайплайна;
+с rate=30 он упрётся ровно в лимит Telegram.
+
+Запуск из корня репозитория:
+    python -m bench.bench_broadcast [пользователей] [latency_ms] [rate]
+"""
+
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 40
+RATE = float(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+os.environ.setdefault("TOKEN", "bench:token")
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_bc_"), "bench.db")
+
+import db2  # noqa: E402
+from broadcast import Broadcaster  # noqa: E402
+
+
+class FakeApiError(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Too Many Requests")
+        self.error_code = 429
+        self.result_json = {"parameters": {"retry_after": retry_after}}
+
+
+class FakeBot:
+    def __init__(self, flood_rate: float = 0.002) -> None:
+        self.flood_rate = flood_rate
+        self.delivered = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        time.sleep(LATENCY_MS / 1000)
+        if random.random() < self.flood_rate:
+            raise FakeApiError(retry_after=1)
+        with self._lock:
+            self.delivered += 1
+
+
+def _seed(today: str, hour: int) -> None:
+    db2.init_db()
+    with db2._connect() as conn:
+        conn.execute("UPDATE users SET last_sent_date = NULL")
+        conn.executemany(
+            "INSERT OR REPLACE INTO users(user_id, sign, notify_hour, subscribed) VALUES (?, 'лев', ?, 1)",
+            [(uid, hour) for uid in range(1, USERS + 1)],
+        )
+
+
+def legacy(bot: FakeBot, today: str, hour: int) -> float:
+    t0 = time.perf_counter()
+    for u in db2.list_due_users(today, hour):
+        try:
+            bot.send_message(u["user_id"], "текст")
+        except Exception:
+            pass
+        db2.mark_sent_today(u["user_id"], today)
+    return time.perf_counter() - t0
+
+
+def pipeline(bot: FakeBot, today: str, hour: int):
+    b = Broadcaster(lambda uid, txt: bot.send_message(uid, txt),
+                    on_done=lambda ids: db2.mark_sent_many(ids, today), rate=RATE, workers=16)
+    return b.run((u["user_id"], "текст") for u in db2.iter_due_users(today, hour))
+
+
+def main() -> None:
+    today, hour = "2026-01-01", 9
+    _seed(today, hour)
+    bot = FakeBot()
+    dt = legacy(bot, today, hour)
+    print(f"последовательно: {USERS} за {dt:.1f} с = {USERS / dt:.0f} msg/s")
+
+    _seed(today, hour)
+    bot = FakeBot()
+    st = pipeline(bot, today, hour)
+    left = len(db2.list_due_users(today, hour))
+    print(f"Broadcaster:     {st.sent} за {st.elapsed_s:.1f} с = {st.per_sec:.0f} msg/s "
+          f"(rate={RATE:g}, повторов после 429: {st.retried}, не отмечено: {left})")
+
+
+if __name__ == "__main__":
+    main()
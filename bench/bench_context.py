@@ -0,0 +1,56 @@
+"""
+bench_context.py — сборка контекста с историей: время не должно расти с длиной истории.
+
+Запуск из корня репозитория:
+    python -m bench.bench_context [реплик_в_истории] [бюджет_токенов]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_context_"), "bench.db")
+
+import db  # noqa: E402
+from conversation import HistoryPruner, estimate_tokens, with_history  # noqa: E402
+
+TURNS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+BUDGET = int(sys.argv[2]) if len(sys.argv) > 2 else 1500
+USER, CHARACTER = 1, 1
+REPEAT = 200
+
+
+def fill(n: int) -> None:
+    for i in range(0, n, 2):
+        q = f"Вопрос номер {i}: расскажи что-нибудь о звёздах и планетах, пожалуйста"
+        a = f"Ответ {i}: " + "звёзды светят, планеты вращаются. " * 8
+        db.add_turns(USER, CHARACTER, [("user", q, estimate_tokens(q)), ("assistant", a, estimate_tokens(a))])
+
+
+def measure(label: str) -> None:
+    base = db._build_message(USER, "Что было в начале?")
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        msgs = with_history(base, USER, CHARACTER, budget=BUDGET)
+    ms = (time.perf_counter() - t0) * 1000 / REPEAT
+    tokens = sum(estimate_tokens(m["content"]) for m in msgs)
+    print(f"{label:>28}: сборка {ms:.3f} мс, сообщений {len(msgs)}, ~{tokens} токенов из {BUDGET}")
+
+
+def main() -> None:
+    db.init_db()
+    for n in (100, TURNS):
+        with db._connect() as conn:
+            conn.execute("DELETE FROM conversation_turns")
+        fill(n)
+        measure(f"история {n} реплик")
+    t0 = time.perf_counter()
+    result = HistoryPruner().prune_once()
+    print(f"чистка: {result} за {(time.perf_counter() - t0) * 1000:.0f} мс")
+    measure("после чистки (с выжимкой)")
+
+
+if __name__ == "__main__":
+    main()
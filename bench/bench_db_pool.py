@@ -0,0 +1,59 @@
+"""
+bench_db_pool.py — ops/sec для add_note, list_notes, get_active_model:
+старое «новое соединение на каждый вызов» против пула sqlite_pool.
+
+Запуск из корня репозитория:
+    python -m bench.bench_db_pool [N]
+Работает на временной БД, bot.db не трогает.
+"""
+
+from __future__ import annotations
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_db_")
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+
+import db  # noqa: E402  (DB_PATH должен быть задан до импорта)
+import sqlite_pool  # noqa: E402
+
+
+def _legacy_connect():
+    conn = sqlite3.connect(db.DB_PATH, timeout=5.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def _ops_per_sec(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return n / (time.perf_counter() - t0)
+
+
+def run(n: int) -> None:
+    db.init_db()
+    cases = {
+        "add_note": lambda i: db.add_note(1, f"заметка {i}"),
+        "list_notes": lambda i: db.list_notes(1),
+        "get_active_model": lambda i: db.get_active_model(),
+    }
+    pooled_connect = db._connect
+    print(f"{'операция':<18}{'до, оп/с':>12}{'после, оп/с':>14}{'x':>8}")
+    for name, fn in cases.items():
+        db._connect = _legacy_connect
+        before = _ops_per_sec(fn, n)
+        db._connect = pooled_connect
+        after = _ops_per_sec(fn, n)
+        print(f"{name:<18}{before:>12.0f}{after:>14.0f}{after / before:>8.1f}")
+    sqlite_pool.close_all()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
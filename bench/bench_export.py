@@ -0,0 +1,85 @@
+"""
+bench_export.py — потоковый экспорт заметок (note_export.export_notes): время и
+пиковая память на 1M заметок одного пользователя во всех форматах, с gzip и без.
+
+Для сравнения — прежний способ: все строки в памяти (list) и один большой текст.
+Пиковая память меряется tracemalloc (только Python-объекты); он же замедляет прогон.
+
+Запуск из корня репозитория:
+    python -m bench.bench_export [заметок]      # по умолчанию 1000000
+Работает на временной БД, bot.db не трогает.
+"""
+
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_tmp = tempfile.mkdtemp(prefix="bench_export_")
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+
+import db  # noqa: E402
+from note_export import export_notes  # noqa: E402
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+USER = 1
+WORDS = "купить молоко хлеб встреча завтра позвонить маме отчёт по проекту тренировка книга идея".split()
+
+
+def _fill(total: int) -> None:
+    rnd = random.Random(42)
+    conn = db._connect()
+    batch = []
+    for i in range(total):
+        batch.append((USER if i % 10 else 2, " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 15)))))
+        if len(batch) == 20_000:
+            with conn:
+                conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)", batch)
+            batch.clear()
+    if batch:
+        with conn:
+            conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)", batch)
+
+
+def _measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _old_way():
+    rows = list(db.iter_notes(USER, 10 ** 9))   # как раньше: всё сразу
+    text = "".join(f"Заметка #{r['id']}:\n{r['text']}\n" + "-" * 30 + "\n" for r in rows)
+    return len(text.encode("utf-8")), len(rows)
+
+
+def main() -> None:
+    db.init_db()
+    t0 = time.perf_counter()
+    _fill(N)
+    print(f"БД: {N} заметок ({db.count_notes(USER)} у пользователя) за {time.perf_counter() - t0:.1f} с\n")
+
+    print(f"{'вариант':<22}{'заметок':>10}{'размер, МБ':>12}{'время, с':>10}{'пик памяти, МБ':>16}")
+    (size, count), elapsed, peak = _measure(_old_way)
+    print(f"{'всё в памяти (txt)':<22}{count:>10}{size / 1e6:>12.1f}{elapsed:>10.2f}{peak / 1e6:>16.1f}")
+    for fmt in ("txt", "jsonl", "csv"):
+        for compress in (False, True):
+            def run():
+                f, _, count = export_notes(USER, fmt, compress=compress, limit_bytes=None)
+                with f:
+                    f.seek(0, os.SEEK_END)
+                    return f.tell(), count
+            (size, count), elapsed, peak = _measure(run)
+            name = fmt + (" + gzip" if compress else "")
+            print(f"{name:<22}{count:>10}{size / 1e6:>12.1f}{elapsed:>10.2f}{peak / 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
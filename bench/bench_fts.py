@@ -0,0 +1,80 @@
+"""
+bench_fts.py — поиск по заметкам: FTS5 (db.find_notes) против прежнего LIKE '%q%'.
+
+Запуск из корня репозитория:
+    python -m bench.bench_fts [размеры...]      # по умолчанию 1000 100000 1000000
+Работает на временной БД, bot.db не трогает.
+"""
+
+from __future__ import annotations
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_fts_")
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+
+import db  # noqa: E402
+
+USERS = 10
+COMMON = (
+    "купить молоко хлеб встреча завтра позвонить маме отчёт по проекту заметка "
+    "тренировка книга фильм идея подарок врач запись оплатить счёт машина ремонт"
+).split()
+_SYL = ["ка", "ро", "ми", "ле", "ну", "то", "за", "сти", "пра", "вед", "мор", "лин"]
+_rnd = random.Random(7)
+RARE = sorted({"".join(_rnd.choice(_SYL) for _ in range(3)) for _ in range(20_000)})
+# частые слова, редкие слова, префикс и запрос без совпадений
+QUERIES = ["молоко", "встреча завтра", RARE[100], RARE[1500] + " " + RARE[1600], "заме", "несуществующееслово"]
+
+
+def _fill(total: int) -> None:
+    rnd = random.Random(42)
+    conn = db._connect()
+    have = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+    batch = []
+    for i in range(have, total):
+        words = [rnd.choice(COMMON) for _ in range(rnd.randint(2, 8))]
+        words += [rnd.choice(RARE) for _ in range(rnd.randint(1, 4))]
+        text = " ".join(words)
+        batch.append((i % USERS, text))
+        if len(batch) == 10_000:
+            with conn:
+                conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)", batch)
+            batch.clear()
+    if batch:
+        with conn:
+            conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)", batch)
+
+
+def _legacy_like(user_id: int, query: str, limit: int = 50):
+    with db._connect() as conn:
+        return conn.execute(
+            """SELECT id, text, created_at FROM notes
+            WHERE user_id = ? AND text LIKE ? ORDER BY id DESC LIMIT ?""",
+            (user_id, f"%{query}%", limit),
+        ).fetchall()
+
+
+def _avg_ms(fn, query: str, repeats: int = 20) -> float:
+    t0 = time.perf_counter()
+    for i in range(repeats):
+        fn(i % USERS, query)
+    return (time.perf_counter() - t0) * 1000 / repeats
+
+
+def run(sizes: list[int]) -> None:
+    db.init_db()
+    print(f"{'заметок':>10}  {'запрос':<28}{'LIKE, мс':>10}{'FTS5, мс':>10}")
+    for n in sorted(sizes):
+        _fill(n)
+        for q in QUERIES:
+            like = _avg_ms(_legacy_like, q)
+            fts = _avg_ms(db.find_notes, q)
+            print(f"{n:>10}  {q[:27]:<28}{like:>10.2f}{fts:>10.2f}")
+
+
+if __name__ == "__main__":
+    run([int(a) for a in sys.argv[1:]] or [1_000, 100_000, 1_000_000])
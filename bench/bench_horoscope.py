@@ -0,0 +1,37 @@
+"""
+bench_horoscope.py — CPU на текст гороскопа в рассылке на 100k получателей:
+make_daily_text на каждого (было) против таблицы daily_text (стало).
+
+Запуск из корня репозитория:
+    python -m bench.bench_horoscope [получателей]
+"""
+
+from __future__ import annotations
+import sys
+import time
+from datetime import date
+
+from horoscope import CANON_SIGNS, daily_text, make_daily_text, precompute
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+
+def _run(fn) -> float:
+    today = date.today()
+    t0 = time.process_time()
+    for i in range(N):
+        fn(CANON_SIGNS[i % 12], today)
+    return time.process_time() - t0
+
+
+if __name__ == "__main__":
+    before = _run(make_daily_text)
+    t0 = time.process_time()
+    precompute(date.today(), days_ahead=1)
+    pre = time.process_time() - t0
+    after = _run(daily_text)
+    print(f"получателей: {N}")
+    print(f"make_daily_text: {before:.3f} с CPU, {before / N * 1e6:.2f} мкс/сообщение")
+    print(f"precompute (24 текста): {pre * 1000:.2f} мс")
+    print(f"daily_text:      {after:.3f} с CPU, {after / N * 1e6:.2f} мкс/сообщение")
+    assert all(daily_text(s, date.today()) == make_daily_text(s, date.today()) for s in CANON_SIGNS)
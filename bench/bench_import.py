@@ -0,0 +1,80 @@
+"""
+bench_import.py — пропускная способность записи заметок: db.add_note по одной
+(транзакция и fsync на каждую) против db.add_notes_bulk (executemany пачками)
+и полный путь миграции notes.json (note_journal.read_notes + add_notes_bulk).
+
+Запуск из корня репозитория:
+    python -m bench.bench_import [заметок]      # по умолчанию 100000
+Работает на временной БД, bot.db не трогает. add_note по одной меряется на
+первых 5000 заметках — дальше скорость та же, а ждать долго.
+"""
+
+from __future__ import annotations
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_import_")
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+
+import db  # noqa: E402
+from note_journal import read_notes  # noqa: E402
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+SINGLE_N = min(N, 5000)
+WORDS = "купить молоко хлеб встреча завтра позвонить маме отчёт по проекту тренировка книга идея".split()
+
+
+def _texts(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    return [f"{i} " + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 12))) for i in range(n)]
+
+
+def _row(name: str, n: int, elapsed: float) -> None:
+    print(f"{name:<34}{n:>9}{elapsed:>10.2f}{n / elapsed:>14.0f}")
+
+
+def main() -> None:
+    db.init_db()
+    print(f"{'вариант':<34}{'заметок':>9}{'время, с':>10}{'заметок/с':>14}")
+
+    texts = _texts(SINGLE_N, 1)
+    t0 = time.perf_counter()
+    for text in texts:
+        db.add_note(1, text)
+    _row("add_note по одной", SINGLE_N, time.perf_counter() - t0)
+
+    texts = _texts(N, 2)
+    t0 = time.perf_counter()
+    stats = db.add_notes_bulk(2, texts, dedupe=False)
+    _row("add_notes_bulk без дедупликации", stats["inserted"], time.perf_counter() - t0)
+
+    texts = _texts(N, 3)
+    t0 = time.perf_counter()
+    stats = db.add_notes_bulk(3, texts)
+    _row("add_notes_bulk с дедупликацией", stats["inserted"], time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    stats = db.add_notes_bulk(3, texts)
+    _row("повторный импорт (всё — повторы)", stats["duplicates"], time.perf_counter() - t0)
+
+    # notes.json: половина в снапшоте, половина — в журнале, как у работающего бота
+    path = os.path.join(_tmp, "notes.json")
+    texts = _texts(N, 4)
+    half = N // 2
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"notes": {str(i + 1): t for i, t in enumerate(texts[:half])}, "counter": half + 1}, f,
+                  ensure_ascii=False)
+    with open(path + ".log", "w", encoding="utf-8") as f:
+        for i, t in enumerate(texts[half:], half + 1):
+            f.write(json.dumps({"op": "set", "id": i, "text": t}, ensure_ascii=False) + "\n")
+    t0 = time.perf_counter()
+    stats = db.add_notes_bulk(4, [t for _, t in sorted(read_notes(path).items())])
+    _row("миграция notes.json", stats["inserted"], time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    main()
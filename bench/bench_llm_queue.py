@@ -0,0 +1,114 @@
+"""
+bench_llm_queue.py — вопросы к LLM в потоках-обработчиках TeleBot против llm_queue.
+
+Пул обработчиков как у TeleBot (2 потока). Один пользователь задаёт много вопросов,
+ещё несколько — по одному, параллельно идут быстрые команды вроде /note_add.
+Меряем, сколько ждут быстрые команды и вопросы «лёгких» пользователей.
+
+Запуск из корня репозитория:
+    python -m bench.bench_llm_queue [задержка_модели_мс] [вопросов_от_активного]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from bench.stub_openrouter import start_stub
+
+DELAY_MS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+HEAVY = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+LIGHT_USERS = 4
+FAST_CMDS = 10
+HANDLER_THREADS = 2
+
+server, url = start_stub(delay_ms=DELAY_MS)
+os.environ.update(
+    OPENROUTER_API_URL=url,
+    OPENROUTER_API_KEY="stub",
+    RATE_LIMIT_LLM="off",
+    LLM_CACHE_PATH=os.path.join(tempfile.mkdtemp(prefix="bench_llm_queue_"), "cache.db"),
+)
+
+from llm_queue import LLMJobQueue  # noqa: E402
+from stream_reply import reply_queued, reply_streaming  # noqa: E402
+
+
+class FakeBot:
+    """reply_to / edit_message_text без сети; запоминает время последней правки по сообщению."""
+
+    def __init__(self) -> None:
+        self.done_at: dict[int, float] = {}
+        self.owner: dict[int, int] = {}
+        self._next_id = 0
+
+    def reply_to(self, message, text, **kwargs):
+        self._next_id += 1
+        self.owner[self._next_id] = message.from_user.id
+        return SimpleNamespace(chat=SimpleNamespace(id=message.chat.id), message_id=self._next_id)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        if "⏱" in text:
+            self.done_at[message_id] = time.perf_counter()
+
+
+def _message(user_id: int, n: int):
+    return SimpleNamespace(chat=SimpleNamespace(id=user_id), from_user=SimpleNamespace(id=user_id),
+                           text=f"вопрос {n}")
+
+
+def scenario(queued: bool) -> None:
+    bot = FakeBot()
+    jobs = LLMJobQueue(workers=4, max_depth=1000, max_per_user=1000)
+    handlers = ThreadPoolExecutor(max_workers=HANDLER_THREADS)
+    fast_ms: list[float] = []
+    t0 = time.perf_counter()
+
+    def ask(user_id: int, n: int) -> None:
+        msgs = [{"role": "user", "content": f"{user_id} {n}"}]
+        kw = dict(model="m", footer=lambda lat: f"⏱ {lat}", temperature=0.9)
+        if queued:
+            reply_queued(bot, jobs, _message(user_id, n), msgs, **kw)
+        else:
+            reply_streaming(bot, _message(user_id, n), msgs, **kw)
+
+    def note_add(submitted: float) -> None:
+        fast_ms.append((time.perf_counter() - submitted) * 1000)
+
+    futures = [handlers.submit(ask, 1, i) for i in range(HEAVY)]
+    light_started = time.perf_counter()
+    futures += [handlers.submit(ask, 100 + u, 0) for u in range(LIGHT_USERS)]
+    for _ in range(FAST_CMDS):
+        futures.append(handlers.submit(note_add, time.perf_counter()))
+        time.sleep(0.01)
+    for f in futures:
+        f.result()
+    while len(bot.done_at) < HEAVY + LIGHT_USERS:
+        time.sleep(0.01)
+    handlers.shutdown()
+    jobs.stop()
+
+    light_ms = [(t - light_started) * 1000 for i, t in bot.done_at.items() if bot.owner[i] != 1]
+    extra = ""
+    if queued:
+        st = jobs.stats()
+        extra = f", ожидание в очереди p50 {st['wait_ms_p50']:.0f} мс / p99 {st['wait_ms_p99']:.0f} мс"
+    total = (time.perf_counter() - t0) * 1000
+    print(f"{'llm_queue' if queued else 'в обработчиках':>15}: быстрые команды ждут "
+          f"макс. {max(fast_ms):.0f} мс, ответы лёгким пользователям через "
+          f"{min(light_ms):.0f}–{max(light_ms):.0f} мс, всё за {total:.0f} мс{extra}")
+
+
+def main() -> None:
+    print(f"модель отвечает за {DELAY_MS} мс; активный пользователь: {HEAVY} вопросов, "
+          f"лёгких: {LIGHT_USERS}, быстрых команд: {FAST_CMDS}, потоков TeleBot: {HANDLER_THREADS}")
+    scenario(queued=False)
+    scenario(queued=True)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+bench_openrouter.py — пропускная способность и p50/p99 клиента OpenRouter
+на локальной заглушке: requests.post на каждый вызов против keep-alive сессии,
+последовательно и с параллельной отправкой (chat_many / achat_many).
+
+Запуск из корня репозитория:
+    python -m bench.bench_openrouter [N] [задержка_мс]
+"""
+
+from __future__ import annotations
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from bench.stub_openrouter import start_stub
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+DELAY_MS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+server, url = start_stub(delay_ms=DELAY_MS)
+os.environ["OPENROUTER_API_URL"] = url
+os.environ["OPENROUTER_API_KEY"] = "stub"
+os.environ["RATE_LIMIT_LLM"] = "off"
+
+import requests  # noqa: E402
+import ai_client  # noqa: E402
+
+MSGS = [{"role": "user", "content": "привет"}]
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _report(name: str, latencies: list[float], total_s: float, conns: int) -> None:
+    print(f"{name:<28}{len(latencies) / total_s:>10.1f}{statistics.median(latencies):>10.1f}"
+          f"{_pct(latencies, 0.99):>10.1f}{conns:>10}")
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def _legacy_call() -> None:
+    r = requests.post(url, json={"model": "m", "messages": MSGS}, timeout=30)
+    r.json()["choices"][0]["message"]["content"]
+
+
+def _measure(name: str, fn) -> None:
+    before = server.connections
+    t0 = time.perf_counter()
+    lat = fn()
+    _report(name, lat, time.perf_counter() - t0, server.connections - before)
+
+
+def _sequential(call) -> list[float]:
+    return [_timed(call) for _ in range(N)]
+
+
+def _fan_out_sync() -> list[float]:
+    lat: list[float] = []
+
+    def job():
+        t0 = time.perf_counter()
+        ai_client.chat_once(MSGS, model="m")
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=ai_client.MAX_IN_FLIGHT) as pool:
+        list(pool.map(lambda _: job(), range(N)))
+    return lat
+
+
+def _fan_out_async() -> list[float]:
+    async def main() -> list[float]:
+        sem = asyncio.Semaphore(ai_client.MAX_IN_FLIGHT)
+
+        async def one() -> float:
+            t0 = time.perf_counter()
+            await ai_client.achat_once(MSGS, model="m", semaphore=sem)
+            return (time.perf_counter() - t0) * 1000
+
+        return list(await asyncio.gather(*(one() for _ in range(N))))
+
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    print(f"N={N}, задержка заглушки {DELAY_MS} мс, MAX_IN_FLIGHT={ai_client.MAX_IN_FLIGHT}")
+    print(f"{'режим':<28}{'req/s':>10}{'p50, мс':>10}{'p99, мс':>10}{'TCP':>10}")
+    _measure("requests.post (было)", lambda: _sequential(_legacy_call))
+    _measure("session, последовательно", lambda: _sequential(lambda: ai_client.chat_once(MSGS, model="m")))
+    _measure("session, потоки", _fan_out_sync)
+    _measure("session, asyncio", _fan_out_async)
+    t0 = time.perf_counter()
+    results = ai_client.chat_many([{"messages": MSGS, "model": "m"}] * N)
+    print(f"chat_many: {len(results)} ответов за {(time.perf_counter() - t0) * 1000:.0f} мс")
+    server.shutdown()
@@ -0,0 +1,79 @@
+"""
+bench_ratelimit.py — цена проверки лимитов (ratelimit.py) на апдейт и что они дают.
+
+1) Микросекунды на RateLimitMiddleware.pre_process_message: пропущенное сообщение
+   (каждый раз новый пользователь — ведро создаётся), пропущенное у «своего»
+   пользователя и отклонённое (спам /ask_model) — в памяти и с RATE_LIMIT_DB_PATH.
+2) Всплеск спама: SPAMMERS пользователей шлют по BURST /ask_model подряд —
+   сколько из них дошло бы до OpenRouter без лимитов и с лимитами по умолчанию.
+
+Запуск из корня репозитория:
+    python -m bench.bench_ratelimit [сообщений на замер]     # по умолчанию 100000
+Работает на временной БД.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+
+from telebot import types
+
+from ratelimit import RateLimiter, RateLimitMiddleware
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+SPAMMERS = 50
+BURST = 20
+
+
+class _QuietBot:
+    """Вместо TeleBot: «подождите N с» никуда не отправляется."""
+
+    def reply_to(self, message, text):
+        pass
+
+
+def _message(user_id: int, text: str) -> types.Message:
+    return types.Message.de_json({
+        "message_id": 1, "date": 0, "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+    })
+
+
+def _us_per_update(mw: RateLimitMiddleware, messages) -> float:
+    t0 = time.perf_counter()
+    for m in messages:
+        mw.pre_process_message(m, {})
+    return (time.perf_counter() - t0) / len(messages) * 1e6
+
+
+def _row(name: str, limiter: RateLimiter) -> None:
+    mw = RateLimitMiddleware(_QuietBot(), limiter)
+    fresh = _us_per_update(mw, [_message(i, "/notes") for i in range(N)])
+    known = _us_per_update(mw, [_message(i % 1000, "/notes") for i in range(N)])
+    spam = _us_per_update(mw, [_message(42, "/ask_model привет") for _ in range(N)])
+    st = limiter.stats()
+    print(f"{name:<22}{fresh:>12.1f}{known:>12.1f}{spam:>12.1f}{st['keys']:>9}{st['rejected']:>11}")
+
+
+def main() -> None:
+    tmp = tempfile.mkdtemp(prefix="bench_ratelimit_")
+    print(f"{N} сообщений на замер, мкс на апдейт\n")
+    print(f"{'лимиты':<22}{'новый':>12}{'знакомый':>12}{'отказ':>12}{'ведер':>9}{'отказов':>11}")
+    _row("в памяти", RateLimiter(user=(1e9, 1e9)))
+    _row("в памяти + SQLite", RateLimiter(user=(1e9, 1e9), db_path=os.path.join(tmp, "rate.db")))
+
+    limiter = RateLimiter()
+    mw = RateLimitMiddleware(_QuietBot(), limiter)
+    passed = sum(mw.pre_process_message(_message(u, "/ask_model вопрос"), {}) is None
+                 for u in range(SPAMMERS) for _ in range(BURST))
+    print(f"\nВсплеск: {SPAMMERS} пользователей × {BURST} /ask_model подряд")
+    print(f"  до OpenRouter без лимитов: {SPAMMERS * BURST}, с лимитами: {passed} "
+          f"(ask_model = {limiter.limits['ask_model'][1]:.0f} за "
+          f"{limiter.limits['ask_model'][1] / limiter.limits['ask_model'][0]:.0f} с на пользователя)")
+
+
+if __name__ == "__main__":
+    main()
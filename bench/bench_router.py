@@ -0,0 +1,79 @@
+"""
+bench_router.py — model_router против одной активной модели на заглушке OpenRouter,
+где модели ведут себя по-разному: активная иногда отвечает очень долго и сыплет 503,
+одна запасная быстрая, другая всегда 429.
+
+Запуск из корня репозитория:
+    python -m bench.bench_router [запросов]
+"""
+
+from __future__ import annotations
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.stub_openrouter import start_stub
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+MODELS = {
+    "active":  {"delay_ms": 300, "error_rate": 0.15, "tail_rate": 0.1, "tail_ms": 4000},
+    "fast":    {"delay_ms": 200},
+    "limited": {"delay_ms": 50, "status": 429},
+    "slow":    {"delay_ms": 1500},
+}
+server, url = start_stub(models=MODELS)
+os.environ.update(OPENROUTER_API_URL=url, OPENROUTER_API_KEY="stub", ROUTER_COOLDOWN_S="2",
+                  RATE_LIMIT_LLM="off")
+
+from ai_client import OpenRouterError, chat_once  # noqa: E402
+from model_router import ModelRouter  # noqa: E402
+
+MSGS = [{"role": "user", "content": "вопрос"}]
+logging.getLogger("model_router").setLevel(logging.ERROR)
+
+
+def run(label: str, call) -> None:
+    lat: list[float] = []
+    errors = 0
+
+    def one(_):
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            call()
+        except OpenRouterError:
+            errors += 1
+            return
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    before = server.requests
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(one, range(N)))
+    lat.sort()
+    p = lambda q: lat[min(len(lat) - 1, int(len(lat) * q))] if lat else 0  # noqa: E731
+    print(f"{label:>14}: ошибок {errors}/{N}, p50 {p(0.5):.0f} мс, p95 {p(0.95):.0f} мс, "
+          f"p99 {p(0.99):.0f} мс, запросов к OpenRouter {server.requests - before}")
+
+
+def main() -> None:
+    print(f"{N} вопросов по 8 параллельно; модели заглушки: {MODELS}")
+    run("только active", lambda: chat_once(MSGS, model="active"))
+
+    router = ModelRouter(lambda: list(MODELS), hedge=False)
+    run("fallback", lambda: router.chat(MSGS, preferred="active"))
+    print("                счётчики:", router.counters)
+
+    router = ModelRouter(lambda: list(MODELS), hedge=True, hedge_min_ms=500)
+    run("fallback+hedge", lambda: router.chat(MSGS, preferred="active"))
+    print("                счётчики:", router.counters)
+    for key, h in router.health().items():
+        print(f"  {key:>8}: {h['requests']} запросов, ошибок {h['error_rate']:.0%}, "
+              f"p50 {h['p50_ms'] or 0:.0f} мс, p95 {h['p95_ms'] or 0:.0f} мс")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+bench_singleflight.py — N пользователей одновременно задают один и тот же вопрос.
+Сравнивает chat_once на каждого с llm_cache.cached_chat_once (склейка запросов):
+сколько запросов дошло до заглушки OpenRouter и сколько ждал каждый.
+
+Запуск из корня репозитория:
+    python -m bench.bench_singleflight [пользователей] [задержка_мс]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.stub_openrouter import start_stub
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+DELAY_MS = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+
+server, url = start_stub(delay_ms=DELAY_MS)
+os.environ.update(
+    OPENROUTER_API_URL=url,
+    OPENROUTER_API_KEY="stub",
+    RATE_LIMIT_LLM="off",
+    LLM_CACHE_PATH=os.path.join(tempfile.mkdtemp(prefix="bench_singleflight_"), "cache.db"),
+)
+
+import ai_client  # noqa: E402
+import llm_cache  # noqa: E402
+
+# temperature выше порога кэша: выигрыш только от склейки, не от кэша
+MSGS = [{"role": "user", "content": "Что такое single flight?"}]
+KW = dict(model="m", temperature=0.9, max_tokens=200)
+
+
+def run(label: str, fn) -> None:
+    before = server.requests
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=N) as pool:
+        waits = list(pool.map(lambda _: fn(), range(N)))
+    total = (time.perf_counter() - t0) * 1000
+    print(f"{label:>18}: запросов к OpenRouter {server.requests - before:>3}, "
+          f"ожидание макс. {max(waits):.0f} мс, всё за {total:.0f} мс")
+
+
+def plain() -> float:
+    t0 = time.perf_counter()
+    ai_client.chat_once(MSGS, **KW)
+    return (time.perf_counter() - t0) * 1000
+
+
+def coalesced() -> float:
+    t0 = time.perf_counter()
+    llm_cache.cached_chat_once(MSGS, **KW)
+    return (time.perf_counter() - t0) * 1000
+
+
+def main() -> None:
+    print(f"{N} одновременных одинаковых вопросов, модель отвечает за {DELAY_MS} мс")
+    run("chat_once", plain)
+    run("cached_chat_once", coalesced)
+    print("склеено:", llm_cache.flights.stats())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+bench_state_store.py — хранилище шагов register_next_step_handler (state_store.py)
+против стандартного MemoryHandlerBackend TeleBot.
+
+1) «Брошенные» диалоги: N пользователей нажимают «Сумма» и не отвечают. Стандартный
+   бэкенд растёт без предела, MemoryStateStore держит не больше max_entries.
+2) Цена одного входящего сообщения: get_handlers() вызывается на каждое, даже когда
+   шагов нет (промах), плюс полный цикл «зарегистрировать шаг — получить его».
+
+Запуск из корня репозитория:
+    python -m bench.bench_state_store [брошенных диалогов]     # по умолчанию 200000
+Работает на временной БД.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from telebot import Handler
+from telebot.handler_backends import MemoryHandlerBackend
+
+from state_store import MemoryStateStore, SQLiteStateStore, StepHandlerBackend
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+OPS = 20_000
+CAP = 10_000
+
+
+def on_sum_numbers(message) -> None:   # как в main.py: шаг — функция уровня модуля
+    pass
+
+
+def _abandoned(backend) -> tuple[float, float]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for chat_id in range(N):
+        backend.register_handler(chat_id, Handler(on_sum_numbers))
+    elapsed = time.perf_counter() - t0
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, size
+
+
+def _per_message_us(backend) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    for i in range(OPS):
+        backend.get_handlers(10_000_000 + i)          # шага нет — обычное сообщение
+    miss = (time.perf_counter() - t0) / OPS * 1e6
+    t0 = time.perf_counter()
+    for i in range(OPS):
+        backend.register_handler(i, Handler(on_sum_numbers))
+        backend.get_handlers(i)
+    cycle = (time.perf_counter() - t0) / OPS * 1e6
+    return miss, cycle
+
+
+def main() -> None:
+    tmp = tempfile.mkdtemp(prefix="bench_state_")
+    backends = {
+        "TeleBot MemoryHandlerBackend": lambda: MemoryHandlerBackend(),
+        f"MemoryStateStore (cap {CAP})": lambda: StepHandlerBackend(MemoryStateStore(max_entries=CAP)),
+        f"SQLiteStateStore (cap {CAP})": lambda: StepHandlerBackend(
+            SQLiteStateStore(os.path.join(tmp, f"state{time.monotonic_ns()}.db"), max_entries=CAP)),
+    }
+    print(f"{N} брошенных диалогов; цена на сообщение — среднее по {OPS}\n")
+    print(f"{'бэкенд':<32}{'запись, с':>10}{'память, МБ':>12}{'живых':>9}{'промах, мкс':>13}{'шаг, мкс':>10}")
+    for name, make in backends.items():
+        backend = make()
+        elapsed, size = _abandoned(backend)
+        store = getattr(backend, "store", None)
+        if store is not None:
+            store.purge_expired()
+            live = store.stats()["live"]
+        else:
+            live = len(backend.handlers)
+        miss, cycle = _per_message_us(make())
+        print(f"{name:<32}{elapsed:>10.2f}{size / 1e6:>12.1f}{live:>9}{miss:>13.1f}{cycle:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+bench_stream.py — потоковый ответ против обычного на локальной SSE-заглушке:
+время до первого токена (TTFT), полное время и число правок сообщения.
+
+Запуск из корня репозитория:
+    python -m bench.bench_stream [слов_в_ответе] [пауза_между_кусками_мс]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bench.stub_openrouter import start_stub
+
+WORDS = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+CHUNK_MS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+server, url = start_stub(delay_ms=300, models={"m": {"chunk_delay_ms": CHUNK_MS}})
+os.environ.update(
+    OPENROUTER_API_URL=url,
+    OPENROUTER_API_KEY="stub",
+    RATE_LIMIT_LLM="off",
+    LLM_CACHE_PATH=os.path.join(tempfile.mkdtemp(prefix="bench_stream_"), "cache.db"),
+)
+
+import ai_client  # noqa: E402
+from stream_reply import reply_streaming  # noqa: E402
+
+
+class FakeBot:
+    """Минимум TeleBot: reply_to и edit_message_text с отметками времени."""
+
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()
+        self.events: list[tuple[float, str, str]] = []
+
+    def _log(self, kind: str, text: str) -> None:
+        self.events.append(((time.perf_counter() - self.t0) * 1000, kind, text))
+
+    def reply_to(self, message, text, **kwargs):
+        self._log("send", text)
+        return SimpleNamespace(chat=SimpleNamespace(id=1), message_id=len(self.events))
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self._log("edit", text)
+
+
+def main() -> None:
+    question = " ".join(f"слово{i}" for i in range(WORDS))
+    msgs = [{"role": "user", "content": question}]
+
+    t0 = time.perf_counter()
+    ai_client.chat_once(msgs, model="m")
+    full_ms = (time.perf_counter() - t0) * 1000
+    print(f"chat_once: пользователь ждёт {full_ms:.0f} мс до любого текста")
+
+    bot = FakeBot()
+    reply_streaming(bot, SimpleNamespace(), msgs, model="m", footer=lambda lat: f"⏱ {lat}", temperature=0.9)
+    first_text = next(t for t, kind, text in bot.events if kind == "edit")
+    edits = sum(1 for _, kind, _ in bot.events if kind == "edit")
+    print(f"стрим: заглушка через {bot.events[0][0]:.0f} мс, первый текст через {first_text:.0f} мс, "
+          f"конец через {bot.events[-1][0]:.0f} мс, правок: {edits}")
+    print("подпись:", bot.events[-1][2].rsplit("\n", 1)[-1])
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
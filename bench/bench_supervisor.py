@@ -0,0 +1,48 @@
+"""
+bench_supervisor.py — пропускная способность (апдейтов/с) бота под supervisor.py
+в зависимости от числа процессов N, против обычного одного процесса.
+
+Прогон — bench.loadtest: заглушка Bot API, много пользователей шлют команды
+заметок main2 (без LLM, чтобы мерить сам бот, а не очередь к модели). Два режима:
+  - api 0 мс — упор в процессор (GIL): выигрыш есть, только если ядер больше одного;
+  - api 20 мс — ответы Bot API с сетевой задержкой: у каждого процесса свой пул
+    потоков-обработчиков TeleBot, поэтому N процессов ждут сеть параллельно.
+
+Запуск из корня репозитория:
+    python -m bench.bench_supervisor [пользователей] [команд на пользователя]   # по умолчанию 100 × 20
+"""
+
+from __future__ import annotations
+import os
+import sys
+
+from bench.loadtest import run
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+OPS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+WORKERS = (0, 1, 2, 4)
+
+MIX = [
+    (4, lambda rnd, u: f"/note_add заметка {u}-{rnd.randrange(10_000)} купить молоко"),
+    (3, lambda rnd, u: f"/note_find {rnd.choice(['молоко', 'заметка', 'хлеб'])}"),
+    (2, lambda rnd, u: "/note_list"),
+    (1, lambda rnd, u: "/note_count"),
+    (1, lambda rnd, u: "/whoami"),
+]
+
+
+def main() -> None:
+    print(f"ядер: {os.cpu_count()}, {USERS} пользователей × {OPS} команд\n")
+    print(f"{'api, мс':>8}{'процессы':>10}{'апдейтов/с':>12}{'p50, мс':>10}{'p95, мс':>10}{'timeout':>9}{'память, МБ':>12}")
+    for api_delay in (0, 20):
+        for workers in WORKERS:
+            r = run("main2", USERS, OPS, llm_delay_ms=0, api_delay_ms=api_delay, timeout_s=30.0,
+                    seed=1, workers=workers, mix=MIX)
+            t = r["total"]
+            name = str(workers) if workers else "без sup."
+            print(f"{api_delay:>8}{name:>10}{r['throughput_ops_s']:>12.1f}{t['p50_ms']:>10.1f}{t['p95_ms']:>10.1f}"
+                  f"{t['timeouts']:>9}{(r['rss_peak_kb'] or 0) / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_webhook.py — нагрузочный тест webhook-режима (runner.WebhookServer):
+синтетические апдейты POST-ятся на локальный сервер, бот без обращений к сети.
+Считает updates/sec и время ожидания апдейта в очереди.
+
+Запуск из корня репозитория:
+    python -m bench.bench_webhook [апдейтов] [клиентов] [работа_хендлера_мс]
+"""
+
+from __future__ import annotations
+import http.client
+import json
+import sys
+import threading
+import time
+
+import telebot
+
+from runner import WebhookServer
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CLIENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+WORK_MS = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+SECRET = "bench-secret"
+
+bot = telebot.TeleBot("1:bench", threaded=False)
+handled = 0
+handled_lock = threading.Lock()
+
+
+@bot.message_handler(commands=["note_add"])
+def _handler(message) -> None:
+    global handled
+    time.sleep(WORK_MS / 1000)
+    with handled_lock:
+        handled += 1
+
+
+def _update(i: int) -> bytes:
+    return json.dumps({
+        "update_id": i,
+        "message": {
+            "message_id": i, "date": int(time.time()), "text": f"/note_add заметка {i}",
+            "chat": {"id": 1000 + i % 500, "type": "private"},
+            "from": {"id": 1000 + i % 500, "is_bot": False, "first_name": "u"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 9}],
+        },
+    }).encode("utf-8")
+
+
+def _client(port: int, ids: range, codes: dict) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for i in ids:
+        conn.request("POST", "/telegram", body=_update(i),
+                     headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": SECRET})
+        r = conn.getresponse()
+        r.read()
+        codes[r.status] = codes.get(r.status, 0) + 1
+    conn.close()
+
+
+def main() -> None:
+    server = WebhookServer(bot, host="127.0.0.1", port=0, path="/telegram", secret=SECRET,
+                           queue_size=1000, workers=4)
+    server.start_workers()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    codes: dict[int, int] = {}
+    per = N // CLIENTS
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=_client, args=(port, range(c * per, (c + 1) * per), codes))
+               for c in range(CLIENTS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    while server.stats["processed"] < codes.get(200, 0):
+        time.sleep(0.01)
+    dt = time.perf_counter() - t0
+    st = server.stats
+    print(f"апдейтов: {per * CLIENTS}, клиентов: {CLIENTS}, работа хендлера: {WORK_MS} мс")
+    print(f"ответы: {codes}")
+    print(f"обработано: {handled} за {dt:.2f} с = {handled / dt:.0f} updates/s")
+    print(f"среднее ожидание в очереди: {st['wait_ms_total'] / max(1, st['processed']):.2f} мс")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+loadtest.py — офлайн нагрузочный тест бота целиком: настоящий main2.py / main3.py
+в отдельном процессе, вместо api.telegram.org — заглушка Bot API (stub_telegram),
+вместо OpenRouter — stub_openrouter. Сеть и токены не нужны, можно гонять в CI.
+
+N пользователей параллельно шлют команды из набора (у каждого бота — свой),
+каждый следующий запрос — после ответа на предыдущий. Задержка команды — от
+появления апдейта в getUpdates до ответа бота в этот чат (для LLM-команд — до
+финального сообщения с «⏱»). В конце — пропускная способность, p50/p95/p99
+по командам и в целом и пиковая память процесса бота (VmHWM).
+
+Запуск из корня репозитория:
+    python -m bench.loadtest main2 --users 20 --ops 10
+    python -m bench.loadtest main2 --workers 4       # через supervisor.py, 4 процесса
+    python -m bench.loadtest main3 --users 50 --ops 20 --json --max-p95-ms 500
+
+--max-p95-ms: если общий p95 выше порога (или были таймауты), код выхода 1 —
+удобно как проверка регрессий в CI.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from bench.stub_openrouter import start_stub as start_openrouter
+from bench.stub_telegram import start_stub as start_telegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LLM_DONE = ("⏱", "Ошибка", "ошибка")   # финальный ответ LLM-команды: футер или текст ошибки
+
+Mix = List[Tuple[int, Callable[[random.Random, int], str]]]   # (вес, генератор текста команды)
+
+MIXES: Dict[str, Mix] = {
+    "main2": [
+        (4, lambda rnd, u: f"/note_add заметка {u}-{rnd.randrange(10_000)} купить молоко"),
+        (3, lambda rnd, u: f"/note_find {rnd.choice(['молоко', 'заметка', 'хлеб'])}"),
+        (2, lambda rnd, u: "/note_list"),
+        (1, lambda rnd, u: "/note_count"),
+        (1, lambda rnd, u: "/whoami"),
+        (2, lambda rnd, u: f"/ask вопрос {rnd.randrange(50)} про погоду"),
+        (1, lambda rnd, u: f"/ask_model 2 вопрос {rnd.randrange(50)} коротко"),
+    ],
+    "main3": [
+        (2, lambda rnd, u: f"/set_sign {rnd.choice(['овен', 'лев', 'дева', 'рыбы'])}"),
+        (5, lambda rnd, u: "/today"),
+        (3, lambda rnd, u: "/me"),
+        (1, lambda rnd, u: "/subscribe"),
+        (1, lambda rnd, u: f"/set_time {rnd.randrange(24)}"),
+        (1, lambda rnd, u: "/signs"),
+    ],
+}
+LLM_COMMANDS = {"/ask", "/ask_model", "/ask_random", "/sofia"}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def _peak_rss_kb(pid: int) -> int | None:
+    """VmHWM процесса и всех его потомков (воркеры supervisor.py), КБ."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="ascii") as f:
+            children = [int(c) for c in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return peak + sum(_peak_rss_kb(c) or 0 for c in children)
+
+
+def _start_bot(bot: str, tg_url: str, or_url: str, workdir: str, workers: int = 0) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "TOKEN": "123456:loadtest",
+        "TELEGRAM_API_URL": tg_url,
+        "OPENROUTER_API_URL": or_url,
+        "OPENROUTER_API_KEY": "stub",
+        "DB_PATH": os.path.join(workdir, f"{bot}.db"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "BOT_MODE": "polling",
+        "METRICS_PORT": "0",
+        "LOG_LEVEL": "WARNING",
+        "PYTHONPATH": ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "SUPERVISOR_POLL_TIMEOUT_S": "1",
+        # меряем пропускную способность, а не лимиты ratelimit.py
+        "RATE_LIMITS": "",
+        "RATE_LIMIT_USER": "off",
+        "RATE_LIMIT_LLM": "off",
+    }
+    cmd = [sys.executable, os.path.join(ROOT, f"{bot}.py")]
+    if workers:
+        cmd = [sys.executable, os.path.join(ROOT, "supervisor.py"), bot, "--workers", str(workers)]
+    with open(os.path.join(workdir, "bot.log"), "wb") as log:   # не PIPE: при большом логе бот встал бы на write
+        return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=log)
+
+
+def run(bot: str, users: int, ops: int, *, llm_delay_ms: int, api_delay_ms: int,
+        timeout_s: float, seed: int, workers: int = 0, mix: Mix | None = None) -> dict:
+    """workers > 0 — бот под supervisor.py с таким числом процессов; mix — свой набор команд."""
+    tg, tg_url = start_telegram(api_delay_ms=api_delay_ms)
+    openrouter, or_url = start_openrouter(delay_ms=llm_delay_ms)
+    workdir = tempfile.mkdtemp(prefix=f"loadtest-{bot}-")
+    proc = _start_bot(bot, tg_url, or_url, workdir, workers)
+    try:
+        if not tg.polling.wait(30) or proc.poll() is not None:
+            with open(os.path.join(workdir, "bot.log"), encoding="utf-8", errors="replace") as f:
+                err = f.read()
+            raise RuntimeError(f"{bot} не начал polling за 30 с\n{err[-2000:]}")
+        rss_start = _peak_rss_kb(proc.pid)
+
+        weights, makers = zip(*(mix or MIXES[bot]))
+        latencies: Dict[str, List[float]] = {}
+        timeouts: Dict[str, int] = {}
+        lock = threading.Lock()
+
+        def user(u: int) -> None:
+            rnd = random.Random(seed * 100_003 + u)
+            chat_id = 10_000 + u
+            for _ in range(ops):
+                text = rnd.choices(makers, weights)[0](rnd, u)
+                command = text.split(maxsplit=1)[0]
+                if command in LLM_COMMANDS:
+                    done = lambda m: any(mark in m["text"] for mark in LLM_DONE)
+                else:
+                    done = lambda m: m["method"] in ("sendMessage", "sendDocument")
+                t0 = time.perf_counter()
+                tg.inject(chat_id, text)
+                reply = tg.wait_for(chat_id, t0, done, timeout_s)
+                with lock:
+                    if reply is None:
+                        timeouts[command] = timeouts.get(command, 0) + 1
+                    else:
+                        latencies.setdefault(command, []).append(reply["t"] - t0)
+
+        threads = [threading.Thread(target=user, args=(u,), daemon=True) for u in range(users)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        rss_peak = _peak_rss_kb(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        tg.shutdown()
+        openrouter.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if rss_peak is None:   # не Linux: пик по всем завершённым дочерним процессам
+        rss_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    def row(values: List[float], command: str | None) -> dict:
+        return {
+            "count": len(values),
+            "timeouts": sum(timeouts.values()) if command is None else timeouts.get(command, 0),
+            "p50_ms": _percentile(values, 0.50) * 1000,
+            "p95_ms": _percentile(values, 0.95) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+        }
+
+    all_values = [v for values in latencies.values() for v in values]
+    return {
+        "bot": bot,
+        "workers": workers,
+        "users": users,
+        "ops_per_user": ops,
+        "elapsed_s": elapsed,
+        "throughput_ops_s": len(all_values) / elapsed if elapsed else 0.0,
+        "total": row(all_values, None),
+        "commands": {c: row(latencies.get(c, []), c) for c in sorted(set(latencies) | set(timeouts))},
+        "rss_start_kb": rss_start,
+        "rss_peak_kb": rss_peak,
+        "telegram_calls": dict(tg.calls),
+        "openrouter_requests": openrouter.requests,
+    }
+
+
+def _print_report(r: dict) -> None:
+    procs = f" ({r['workers']} процессов)" if r["workers"] else ""
+    print(f"{r['bot']}{procs}: {r['users']} пользователей × {r['ops_per_user']} команд за {r['elapsed_s']:.2f} с "
+          f"→ {r['throughput_ops_s']:.1f} команд/с")
+    print(f"{'команда':<14}{'n':>6}{'timeout':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, c in [*r["commands"].items(), ("ВСЕГО", r["total"])]:
+        print(f"{name:<14}{c['count']:>6}{c['timeouts']:>9}{c['p50_ms']:>10.1f}{c['p95_ms']:>10.1f}{c['p99_ms']:>10.1f}")
+    print(f"память бота: старт {r['rss_start_kb'] or 0} КБ, пик {r['rss_peak_kb']} КБ")
+    print(f"вызовы Bot API: {r['telegram_calls']}; запросов к OpenRouter: {r['openrouter_requests']}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Офлайн нагрузочный тест main2/main3")
+    ap.add_argument("bot", choices=sorted(MIXES))
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--ops", type=int, default=10, help="команд на пользователя")
+    ap.add_argument("--llm-delay-ms", type=int, default=100, help="задержка ответа stub OpenRouter")
+    ap.add_argument("--api-delay-ms", type=int, default=0, help="задержка методов stub Bot API")
+    ap.add_argument("--timeout-s", type=float, default=30.0, help="ожидание ответа на одну команду")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--workers", type=int, default=0, help="запустить через supervisor.py с N процессами")
+    ap.add_argument("--json", action="store_true", help="отчёт одной строкой JSON")
+    ap.add_argument("--max-p95-ms", type=float, default=None, help="порог для CI: выше — код выхода 1")
+    args = ap.parse_args()
+
+    r = run(args.bot, args.users, args.ops, llm_delay_ms=args.llm_delay_ms, api_delay_ms=args.api_delay_ms,
+            timeout_s=args.timeout_s, seed=args.seed, workers=args.workers)
+    if args.json:
+        print(json.dumps(r, ensure_ascii=False))
+    else:
+        _print_report(r)
+
+    failed = r["total"]["timeouts"] > 0
+    if args.max_p95_ms is not None and r["total"]["p95_ms"] > args.max_p95_ms:
+        failed = True
+    if failed:
+        print(f"FAIL: p95 {r['total']['p95_ms']:.1f} мс (порог {args.max_p95_ms}), "
+              f"таймаутов {r['total']['timeouts']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
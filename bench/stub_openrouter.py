@@ -0,0 +1,109 @@
+"""
+stub_openrouter.py — локальная заглушка OpenRouter /api/v1/chat/completions.
+
+Отвечает JSON в формате OpenRouter после заданной задержки, а при "stream": true —
+потоком SSE (по слову на кусок, пауза chunk_delay_ms; без стрима та же пауза
+на каждое слово добавляется к задержке целиком). Поведение можно задать
+для каждой модели: задержка, код ответа, доля ошибок.
+
+    server, url = start_stub(delay_ms=50)
+    ...
+    server.shutdown()
+"""
+
+from __future__ import annotations
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOpenRouter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, *, delay_ms: int = 50, models: dict | None = None) -> None:
+        super().__init__(addr, _Handler)
+        self.delay_ms = delay_ms
+        # models: {"model-key": {"delay_ms": 500, "status": 503, "error_rate": 0.3, "chunk_delay_ms": 20,
+        #                        "tail_rate": 0.1, "tail_ms": 3000}}  — tail: доля ответов с задержкой tail_ms
+        self.models = models or {}
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def behaviour(self, model: str) -> dict:
+        return {"delay_ms": self.delay_ms, "status": 200, "error_rate": 0.0, "chunk_delay_ms": 0,
+                "tail_rate": 0.0, "tail_ms": 0, **self.models.get(model, {})}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict | None = None) -> None:
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.server._lock:
+            self.server.requests += 1
+        b = self.server.behaviour(payload.get("model", ""))
+        slow = random.random() < b["tail_rate"]
+        time.sleep((b["tail_ms"] if slow else b["delay_ms"]) / 1000)
+        status = b["status"]
+        if status == 200 and random.random() < b["error_rate"]:
+            status = 503
+        if status != 200:
+            self._send(status, {"error": {"code": status, "message": "stub error"}},
+                       {"Retry-After": "1"} if status == 429 else None)
+            return
+        question = payload["messages"][-1]["content"]
+        if payload.get("stream"):
+            self._stream(f"stub: {question}", b["chunk_delay_ms"])
+            return
+        time.sleep(b["chunk_delay_ms"] * len(f"stub: {question}".split(" ")) / 1000)
+        self._send(200, {
+            "model": payload.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": f"stub: {question}"}}],
+        })
+
+    def _chunk(self, raw: bytes) -> None:
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, text: str, chunk_delay_ms: int) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk(b": OPENROUTER PROCESSING\n\n")
+        for i, word in enumerate(text.split(" ")):
+            time.sleep(chunk_delay_ms / 1000)
+            delta = {"choices": [{"delta": {"content": word if i == 0 else " " + word}}]}
+            self._chunk(b"data: " + json.dumps(delta, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **kwargs) -> tuple[StubOpenRouter, str]:
+    server = StubOpenRouter((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="stub-openrouter", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/api/v1/chat/completions"
+
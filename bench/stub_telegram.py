@@ -0,0 +1,219 @@
+"""
+stub_telegram.py — локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+Бот направляется на неё через TELEGRAM_API_URL (см. runner.create_bot).
+Поддерживает то, что вызывают наши боты: getUpdates (long polling по offset/timeout),
+sendMessage, editMessageText, sendDocument, sendChatAction, answerCallbackQuery,
+setMyCommands, deleteWebhook, getMe. Всё, что бот «отправил», складывается
+в server.sent, и тест может дождаться ответа в нужный чат через wait_for().
+Нажатия inline-кнопок — inject_callback(), присланные файлы — inject_document().
+
+    server, url = start_stub()
+    update_id = server.inject(chat_id=1, text="/note_add купить молоко")
+    server.wait_for(chat_id=1, after=t0, predicate=lambda m: True, timeout=10)
+"""
+
+from __future__ import annotations
+import json
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+MAX_POLL_WAIT_S = 1.0   # дольше не держим getUpdates, чтобы бот быстро замечал остановку
+
+
+class Sent(dict):
+    """Запись об исходящем вызове бота: method, chat_id, message_id, text, reply_markup, t (perf_counter)."""
+
+
+class StubTelegram(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, *, api_delay_ms: int = 0) -> None:
+        super().__init__(addr, _Handler)
+        self.api_delay_ms = api_delay_ms
+        self.updates: Deque[dict] = deque()
+        self.sent: Dict[int, List[Sent]] = {}
+        self.calls: Dict[str, int] = {}
+        self.polling = threading.Event()     # бот начал long polling — готов к работе
+        self.files: Dict[str, bytes] = {}    # file_id -> содержимое (для getFile и скачивания)
+        self._next_update = 1
+        self._next_message = 1
+        self._cond = threading.Condition()
+
+    def handle_error(self, request, client_address) -> None:
+        if not isinstance(sys.exc_info()[1], ConnectionError):   # бот остановлен посреди getUpdates — норма
+            super().handle_error(request, client_address)
+
+    # ---------- сторона теста ----------
+    def inject(self, chat_id: int, text: str, *, user_id: int | None = None) -> int:
+        with self._cond:
+            update_id = self._next_update
+            self._next_update += 1
+            message_id = self._message_id()
+            msg = {
+                "message_id": message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": user_id or chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            }
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            self.updates.append({"update_id": update_id, "message": msg})
+            self._cond.notify_all()
+        return update_id
+
+    def inject_document(self, chat_id: int, data: bytes, file_name: str, caption: str = "", *,
+                        user_id: int | None = None) -> int:
+        """Пользователь прислал файл; бот скачает его через getFile + /file/bot<token>/<path>."""
+        with self._cond:
+            update_id = self._next_update
+            self._next_update += 1
+            file_id = f"doc{update_id}"
+            self.files[file_id] = data
+            self.updates.append({"update_id": update_id, "message": {
+                "message_id": self._message_id(), "date": int(time.time()), "caption": caption,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": user_id or chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+                "document": {"file_id": file_id, "file_unique_id": file_id, "file_name": file_name,
+                             "file_size": len(data)},
+            }})
+            self._cond.notify_all()
+        return update_id
+
+    def inject_callback(self, chat_id: int, message_id: int, data: str, *, user_id: int | None = None) -> int:
+        """Нажатие inline-кнопки с callback_data=data под сообщением бота message_id."""
+        with self._cond:
+            update_id = self._next_update
+            self._next_update += 1
+            user = {"id": user_id or chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+            self.updates.append({"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": str(chat_id), "data": data,
+                "message": {"message_id": message_id, "date": int(time.time()), "text": "",
+                            "chat": {"id": chat_id, "type": "private"}},
+            }})
+            self._cond.notify_all()
+        return update_id
+
+    def wait_for(self, chat_id: int, after: float, predicate: Callable[[Sent], bool],
+                 timeout: float) -> Sent | None:
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                for m in self.sent.get(chat_id, ()):
+                    if m["t"] >= after and predicate(m):
+                        return m
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return None
+                self._cond.wait(left)
+
+    # ---------- сторона бота ----------
+    def _message_id(self) -> int:
+        self._next_message += 1
+        return self._next_message
+
+    def record(self, method: str, params: dict) -> dict:
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            chat_id = int(params.get("chat_id", 0) or 0)
+            message_id = int(params["message_id"]) if method == "editMessageText" else self._message_id()
+            text = params.get("text") or params.get("caption") or ""
+            if chat_id:
+                self.sent.setdefault(chat_id, []).append(
+                    Sent(method=method, chat_id=chat_id, message_id=message_id, text=text,
+                         reply_markup=json.loads(params.get("reply_markup") or "null"), t=time.perf_counter()))
+                self._cond.notify_all()
+        return {"message_id": message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"}}
+
+    def poll(self, offset: int, timeout: float) -> list:
+        deadline = time.perf_counter() + min(timeout, MAX_POLL_WAIT_S)
+        with self._cond:
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+            while not self.updates:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return []
+                self._cond.wait(left)
+            return list(self.updates)[:100]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+    def _reply(self, result) -> None:
+        body = json.dumps({"ok": True, "result": result}, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        # apihelper шлёт параметры в query string, файлы — multipart в теле
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params.update({k: v[-1] for k, v in parse_qs(body.decode("utf-8")).items()})
+        method = url.path.rsplit("/", 1)[-1]
+        srv: StubTelegram = self.server
+
+        if url.path.startswith("/file/"):
+            data = srv.files.get(method)
+            self.send_response(200 if data is not None else 404)
+            self.send_header("Content-Length", str(len(data or b"")))
+            self.end_headers()
+            self.wfile.write(data or b"")
+            return
+
+        if method == "getUpdates":
+            offset = int(params.get("offset", 0) or 0)
+            timeout = float(params.get("timeout", 0) or 0)
+            if timeout > 0:
+                srv.polling.set()
+            with srv._cond:
+                srv.calls["getUpdates"] = srv.calls.get("getUpdates", 0) + 1
+            if offset < 0:   # skip_pending: бот просит последний апдейт, чтобы пропустить старые
+                self._reply([])
+                return
+            self._reply(srv.poll(offset, timeout))
+            return
+
+        if srv.api_delay_ms:
+            time.sleep(srv.api_delay_ms / 1000)
+        if method == "getFile":
+            file_id = params.get("file_id", "")
+            self._reply({"file_id": file_id, "file_unique_id": file_id, "file_path": f"documents/{file_id}",
+                         "file_size": len(srv.files.get(file_id, b""))})
+        elif method == "getMe":
+            self._reply({"id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"})
+        elif method in ("sendMessage", "editMessageText", "sendDocument"):
+            self._reply(srv.record(method, params))
+        else:   # setMyCommands, deleteWebhook, sendChatAction, answerCallbackQuery, ...
+            with srv._cond:
+                srv.calls[method] = srv.calls.get(method, 0) + 1
+            self._reply(True)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **kwargs) -> tuple[StubTelegram, str]:
+    """Возвращает (server, base_url) — base_url для TELEGRAM_API_URL."""
+    server = StubTelegram((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="stub-telegram", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+__all__ = ["StubTelegram", "start_stub"]
@@ -0,0 +1,245 @@
+"""
+broadcast.py — рассылка большому числу пользователей для main3.py.
+
+Было: scheduler_loop() по одному вызывал make_daily_text, bot.send_message и
+db.mark_sent_today — одна отправка и одна транзакция на пользователя в одном потоке.
+
+Стало:
+  - пул из N рабочих потоков с ограниченной очередью (память не растёт с числом получателей);
+  - общий token bucket на ~30 сообщений/с — лимит Telegram на бота;
+  - 429 Too Many Requests: ждём retry_after из ответа и повторяем (до max_retries);
+  - сеть, таймауты, 5xx — повтор с экспоненциальной паузой; не вышло — получатель
+    не отмечается, и планировщик пошлёт ему в следующий проход;
+  - 403 (бот заблокирован) и 400 (чат не найден и т.п.) — окончательный отказ,
+    получатель отмечается, чтобы не слать ему весь день;
+  - отметки last_sent_date копятся и пишутся пачками в одной транзакции (on_done).
+    Если запись не удалась и после повторов, пачка остаётся в unmarked — вызывающий
+    не должен слать этим получателям второй раз (см. main3.send_due).
+"""
+
+from __future__ import annotations
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+TELEGRAM_MSG_PER_SEC = 30
+# Коды Bot API, при которых повтор не поможет: 403 — бот заблокирован/удалён, 400 — чат не найден и т.п.
+PERMANENT_ERROR_CODES = {400, 403}
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, n: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            return False
+
+    def acquire(self, n: float = 1.0) -> None:
+        """Блокирует поток, пока не наберётся n токенов."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def refund(self, n: float = 1.0) -> None:
+        """Возвращает n токенов, взятых зря (вызов так и не состоялся), — не больше capacity."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + n)
+
+    def pause(self, seconds: float) -> None:
+        """Забирает запас на seconds вперёд — так все потоки притормаживают после 429."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    def retry_in(self, n: float = 1.0) -> float:
+        """Через сколько секунд наберётся n токенов (0 — уже есть)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (n - self._tokens) / self.rate)
+
+    def snapshot(self) -> tuple[float, float]:
+        """(токенов, time.time()) — чтобы сохранить запас между перезапусками (см. ratelimit.py)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens, time.time()
+
+    def restore(self, tokens: float, at: float) -> None:
+        """Обратное к snapshot(): запас на момент at плюс то, что накопилось с тех пор."""
+        with self._lock:
+            self._tokens = min(self.capacity, tokens + max(0.0, time.time() - at) * self.rate)
+            self._updated = time.monotonic()
+
+
+def retry_after_of(exc: Exception) -> float | None:
+    """Для ApiTelegramException с кодом 429 вернёт retry_after (секунды), иначе None."""
+    if getattr(exc, "error_code", None) != 429:
+        return None
+    params = (getattr(exc, "result_json", None) or {}).get("parameters") or {}
+    return float(params.get("retry_after", 1))
+
+
+def is_permanent_error(exc: Exception) -> bool:
+    """Ошибка, после которой этому получателю сегодня слать бесполезно."""
+    return getattr(exc, "error_code", None) in PERMANENT_ERROR_CODES
+
+
+@dataclass
+class BroadcastStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    gave_up: int = 0
+    unmarked: int = 0
+    elapsed_s: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def per_sec(self) -> float:
+        return self.sent / self.elapsed_s if self.elapsed_s else 0.0
+
+
+class Broadcaster:
+    def __init__(self,
+                 send: Callable[[int, str], None],
+                 *,
+                 on_done: Callable[[List[int]], None] | None = None,
+                 rate: float = TELEGRAM_MSG_PER_SEC,
+                 workers: int = 8,
+                 batch_size: int = 500,
+                 max_retries: int = 3,
+                 backoff_s: float = 1.0) -> None:
+        self.send = send
+        self.on_done = on_done
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.unmarked: List[int] = []   # доставлено, но on_done так и не удался
+        self._done: List[int] = []
+        self._lock = threading.Lock()
+
+    # ---------- отметки об отправке пачками ----------
+    def _mark(self, user_id: int) -> None:
+        batch = None
+        with self._lock:
+            self._done.append(user_id)
+            if len(self._done) >= self.batch_size:
+                batch, self._done = self._done, []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: List[int]) -> None:
+        if not (self.on_done and batch):
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.on_done(batch)
+                return
+            except Exception as e:
+                log.warning("Broadcast on_done failed for %d users (attempt %d): %r", len(batch), attempt + 1, e)
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff_s * 2 ** attempt)
+        log.error("Broadcast: %d users got the message but are not marked as sent", len(batch))
+        with self._lock:
+            self.unmarked.extend(batch)
+
+    # ---------- отправка одному получателю ----------
+    def _deliver(self, user_id: int, text: str, stats: BroadcastStats) -> None:
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                self.send(user_id, text)
+            except Exception as e:
+                wait = retry_after_of(e)
+                permanent = wait is None and is_permanent_error(e)
+                if not permanent and attempt < self.max_retries:
+                    with self._lock:
+                        stats.retried += 1
+                    if wait is not None:
+                        self.bucket.pause(wait)
+                    else:
+                        wait = self.backoff_s * 2 ** attempt   # сеть, таймаут, 5xx
+                    time.sleep(wait)
+                    continue
+                with self._lock:
+                    if permanent:
+                        stats.failed += 1
+                        if len(stats.errors) < 20:
+                            stats.errors.append(f"{user_id}: {e!r}")
+                    else:
+                        stats.gave_up += 1  # не отмечаем — попробуем при следующем проходе
+                if permanent:
+                    # блокировка бота пользователем и т.п. — повтор не поможет, считаем день закрытым
+                    log.warning("Send failed to %s: %r", user_id, e)
+                    self._mark(user_id)
+                else:
+                    log.warning("Send to %s gave up after %d attempts: %r", user_id, attempt + 1, e)
+                return
+            with self._lock:
+                stats.sent += 1
+            self._mark(user_id)
+            return
+
+    def _worker(self, q: "queue.Queue[Tuple[int, str] | None]", stats: BroadcastStats) -> None:
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            self._deliver(item[0], item[1], stats)
+
+    def run(self, jobs: Iterable[Tuple[int, str]]) -> BroadcastStats:
+        """jobs — итератор (user_id, text); читается лениво, по мере освобождения очереди."""
+        stats = BroadcastStats()
+        t0 = time.perf_counter()
+        q: "queue.Queue[Tuple[int, str] | None]" = queue.Queue(maxsize=self.workers * 4)
+        threads = [
+            threading.Thread(target=self._worker, args=(q, stats), name=f"broadcast-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+        try:
+            for job in jobs:
+                q.put(job)
+        finally:
+            for _ in threads:
+                q.put(None)
+            for t in threads:
+                t.join()
+            with self._lock:
+                batch, self._done = self._done, []
+            self._flush(batch)
+            stats.unmarked = len(self.unmarked)
+            stats.elapsed_s = time.perf_counter() - t0
+        return stats
+
+
+__all__ = ["TokenBucket", "Broadcaster", "BroadcastStats", "retry_after_of", "is_permanent_error",
+           "TELEGRAM_MSG_PER_SEC", "PERMANENT_ERROR_CODES"]
@@ -0,0 +1,101 @@
+"""
+cache.py — простой потокобезопасный LRU-кэш со счётчиками попаданий/промахов.
+
+Используется как read-through кэш поверх SQLite (реестр моделей и персонажей в
+db.py): get() -> промах -> читаем из БД -> set(). Запись в БД обязана
+инвалидировать соответствующие ключи (pop/clear) или записать новое значение (set).
+
+Каждая такая запись увеличивает поколение кэша. get_or_load() кладёт загруженное
+значение, только если поколение за время загрузки не изменилось: иначе чтение,
+начатое до записи в БД, вернуло бы в кэш старое значение уже после clear().
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, name: str = "") -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize должен быть > 0")
+        self.maxsize = maxsize
+        self.name = name
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_loads = 0
+        self._generation = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._generation += 1
+            self._put(key, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Read-through: при промахе вызывает loader() и кладёт результат в кэш —
+        если за время загрузки не было set/pop/clear (тогда значение могло устареть).
+        """
+        with self._lock:
+            generation = self._generation
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            with self._lock:
+                if self._generation == generation:
+                    self._put(key, value)
+                else:
+                    self.stale_loads += 1
+        return value
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_loads": self.stale_loads,
+            }
+
+
+__all__ = ["LRUCache", "MISSING"]
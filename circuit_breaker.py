@@ -0,0 +1,115 @@
+"""
+circuit_breaker.py — автоматический выключатель (circuit breaker) для внешних вызовов.
+
+closed    — обычная работа, считаем ошибки подряд;
+open      — после failure_threshold ошибок подряд вызовы отклоняются сразу,
+            без похода в сеть, на reset_timeout_s секунд;
+half_open — по истечении паузы пропускаем один пробный вызов: успех → closed,
+            ошибка → снова open.
+
+Переходы пишутся в лог и считаются (transitions), чтобы было видно, как часто
+модель «выпадает».
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+log = logging.getLogger(__name__)
+
+CB_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", "5"))
+CB_RESET_TIMEOUT_S = float(os.getenv("CB_RESET_TIMEOUT_S", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, *,
+                 failure_threshold: int = CB_FAILURE_THRESHOLD,
+                 reset_timeout_s: float = CB_RESET_TIMEOUT_S) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _move(self, state: str) -> None:
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        log.warning("Circuit %s: %s -> %s (ошибок подряд: %d)", self.name, self.state, state, self.failures)
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+
+    def allow(self) -> bool:
+        """Можно ли сейчас делать вызов. False — отказать сразу."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout_s:
+                self._move(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != CLOSED:
+                self._move(CLOSED)
+
+    def release(self) -> None:
+        """Разрешённый allow() вызов не состоялся (не было токена и т.п.): пробный вызов свободен."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._move(OPEN)
+
+    def retry_in(self) -> float:
+        """Через сколько секунд open-выключатель пустит пробный вызов."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout_s - (time.monotonic() - self.opened_at))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"name": self.name, "state": self.state, "failures": self.failures,
+                    "rejected": self.rejected, "transitions": dict(self.transitions)}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        cb = _breakers.get(name)
+        if cb is None:
+            cb = _breakers[name] = CircuitBreaker(name)
+        return cb
+
+
+def all_stats() -> list[dict]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return [cb.stats() for cb in breakers]
+
+
+__all__ = ["CircuitBreaker", "get_breaker", "all_stats", "CLOSED", "OPEN", "HALF_OPEN"]
@@ -0,0 +1,121 @@
+"""
+conversation.py — память персонажей: история диалога в пределах бюджета токенов.
+
+История хранится в db (conversation_turns) по ключу (пользователь, персонаж).
+В запрос к модели попадают:
+  system → выжимка старых реплик (если влезает) → последние реплики → вопрос,
+причём всё вместе не больше CONTEXT_TOKEN_BUDGET (оценка ~3 символа на токен).
+Реплики читаются от новых к старым и чтение останавливается, как только бюджет
+исчерпан, — сборка стоит O(бюджет), а не O(длина истории). Последняя не
+поместившаяся реплика обрезается, если от бюджета осталось хоть что-то заметное.
+
+HistoryPruner раз в HISTORY_PRUNE_INTERVAL_S сворачивает всё, что старше
+HISTORY_KEEP_TURNS последних реплик, в короткую выжимку и удаляет реплики
+старше HISTORY_MAX_AGE_DAYS.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+from contextlib import closing
+from typing import Dict, List
+
+import db
+
+log = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "40"))
+HISTORY_MAX_AGE_DAYS = float(os.getenv("HISTORY_MAX_AGE_DAYS", "30"))
+HISTORY_PRUNE_INTERVAL_S = float(os.getenv("HISTORY_PRUNE_INTERVAL_S", "600"))
+SUMMARY_MAX_CHARS = 600
+MIN_TRUNCATED_TOKENS = 30   # обрезок короче этого в контекст не кладём
+MESSAGE_OVERHEAD = 4        # служебные токены на сообщение (роль, разделители)
+CHARS_PER_TOKEN = 3         # грубо для смеси кириллицы и латиницы
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD
+
+
+def _truncate(text: str, tokens: int) -> str:
+    return text[:max(0, tokens - MESSAGE_OVERHEAD) * CHARS_PER_TOKEN].rstrip() + "…"
+
+
+def with_history(messages: List[Dict], user_id: int, character_id: int,
+                 budget: int = CONTEXT_TOKEN_BUDGET) -> List[Dict]:
+    """messages = [system, user] → [system, (выжимка), ...история..., user] в пределах budget."""
+    system, question = messages[0], messages[-1]
+    left = budget - estimate_tokens(system["content"]) - estimate_tokens(question["content"])
+    history: List[Dict] = []
+    with closing(db.iter_recent_turns(user_id, character_id)) as turns:
+        for row in turns:
+            if row["tokens"] <= left:
+                history.append({"role": row["role"], "content": row["content"]})
+                left -= row["tokens"]
+                continue
+            if left >= MIN_TRUNCATED_TOKENS:
+                history.append({"role": row["role"], "content": _truncate(row["content"], left)})
+            left = 0
+            break
+    history.reverse()
+
+    context = [system]
+    summary = db.get_conversation_summary(user_id, character_id)
+    if summary:
+        note = f"Кратко о более раннем разговоре: {summary}"
+        if estimate_tokens(note) <= left:
+            context.append({"role": "system", "content": note})
+    return context + history + [question]
+
+
+def remember(user_id: int, character_id: int, question: str, answer: str) -> None:
+    try:
+        db.add_turns(user_id, character_id, [
+            ("user", question, estimate_tokens(question)),
+            ("assistant", answer, estimate_tokens(answer)),
+        ])
+    except Exception as e:  # память не должна ломать ответ пользователю
+        log.warning("Conversation history write failed: %r", e)
+
+
+def summarize(previous: str | None, turns: list[tuple[str, str]]) -> str:
+    """
+    Выжимка без вызова модели: вопросы пользователя из удаляемых реплик,
+    по одной строке, самые новые в конце; общий размер — не больше SUMMARY_MAX_CHARS.
+    """
+    questions = [" ".join(content.split())[:80] for role, content in turns if role == "user"]
+    text = "; ".join(filter(None, [previous, *questions]))
+    if len(text) > SUMMARY_MAX_CHARS:
+        text = "…" + text[-SUMMARY_MAX_CHARS:]
+    return text
+
+
+class HistoryPruner:
+    def __init__(self, interval_s: float = HISTORY_PRUNE_INTERVAL_S) -> None:
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-pruner", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def prune_once(self) -> dict:
+        result = db.prune_conversations(HISTORY_KEEP_TURNS, HISTORY_MAX_AGE_DAYS * 86400, summarize)
+        if result["folded"] or result["expired"]:
+            log.info("History pruned: %s", result)
+        return result
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.prune_once()
+            except Exception as e:
+                log.exception("History pruning failed: %r", e)
+
+
+__all__ = ["with_history", "remember", "estimate_tokens", "summarize", "HistoryPruner", "CONTEXT_TOKEN_BUDGET"]
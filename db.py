@@ -1,15 +1,59 @@
 import os
+import re
 import sqlite3
+import time
+
+import sqlite_pool
+from cache import LRUCache
 
 DB_PATH = os.getenv("DB_PATH", "bot.db")
 
+# Кэш реестра: таблицы models и characters меняются редко, читаются на каждый
+# /ask_*, /whoami, /characters. Привязки user_character — LRU по пользователям.
+USER_CHARACTER_CACHE_SIZE = int(os.getenv("USER_CHARACTER_CACHE_SIZE", "10000"))
+_models_cache = LRUCache(maxsize=4, name="models")
+_characters_cache = LRUCache(maxsize=1024, name="characters")
+_user_character_cache = LRUCache(maxsize=USER_CHARACTER_CACHE_SIZE, name="user_character")
+
+# Несколько процессов (supervisor.py) держат свои копии кэша. Триггеры на models и
+# characters увеличивают registry_version, и каждый процесс не чаще раза в
+# REGISTRY_CHECK_INTERVAL_S сверяет версии и сбрасывает устаревшее. Привязки
+# user_character так не синхронизируются: пользователь всегда попадает в один процесс.
+REGISTRY_CHECK_INTERVAL_S = float(os.getenv("REGISTRY_CHECK_INTERVAL_S", "1.0"))
+_registry_versions: dict[str, int] = {}
+_registry_checked_at = 0.0
+
+def invalidate_registry_cache() -> None:
+    _models_cache.clear()
+    _characters_cache.clear()
+    _user_character_cache.clear()
+
+def _sync_registry_cache() -> None:
+    global _registry_checked_at
+    now = time.monotonic()
+    if now - _registry_checked_at < REGISTRY_CHECK_INTERVAL_S:
+        return
+    _registry_checked_at = now
+    with _connect() as conn:
+        rows = conn.execute("SELECT name, version FROM registry_version").fetchall()
+    for row in rows:
+        seen = _registry_versions.get(row["name"])
+        _registry_versions[row["name"]] = row["version"]
+        if seen is None or seen == row["version"]:
+            continue
+        if row["name"] == "models":
+            _models_cache.clear()
+        else:   # characters: промпты лежат и в кэше привязок
+            _characters_cache.clear()
+            _user_character_cache.clear()
+
+def cache_stats() -> list[dict]:
+    return [c.stats() for c in (_models_cache, _characters_cache, _user_character_cache)]
+
 def _connect():
-    conn = sqlite3.connect(DB_PATH, timeout=5.0)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.execute("PRAGMA journal_mode = WAL")
-    conn.execute("PRAGMA busy_timeout = 5000")
-    return conn
+    # Соединение берётся из пула (одно на поток, PRAGMA уже выставлены).
+    # `with _connect() as conn:` делает commit/rollback, но не закрывает его.
+    return sqlite_pool.connect(DB_PATH)
 
 def init_db():
     schema = """
@@ -43,7 +87,54 @@ def init_db():
         character_id     INTEGER NOT NULL,
         FOREIGN KEY (character_id) REFERENCES characters(id)
     );
+
+    -- История диалога с персонажем: tokens — оценка при записи, чтобы сборка
+    -- контекста не пересчитывала длину старых реплик
+    CREATE TABLE IF NOT EXISTS conversation_turns (
+        id               INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_user_id INTEGER NOT NULL,
+        character_id     INTEGER NOT NULL,
+        role             TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+        content          TEXT NOT NULL,
+        tokens           INTEGER NOT NULL,
+        created_at       REAL NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_turns_dialog ON conversation_turns(telegram_user_id, character_id, id);
+    CREATE INDEX IF NOT EXISTS idx_turns_created_at ON conversation_turns(created_at);
+
+    -- Краткая выжимка реплик, удалённых из conversation_turns при чистке
+    CREATE TABLE IF NOT EXISTS conversation_summary (
+        telegram_user_id INTEGER NOT NULL,
+        character_id     INTEGER NOT NULL,
+        summary          TEXT NOT NULL,
+        updated_at       REAL NOT NULL,
+        PRIMARY KEY (telegram_user_id, character_id)
+    );
+
+    -- Разовые переносы старого notes.json (migrate_notes_json.py): что и кому уже перенесено
+    CREATE TABLE IF NOT EXISTS legacy_note_imports (
+        source      TEXT PRIMARY KEY,
+        user_id     INTEGER NOT NULL,
+        inserted    INTEGER NOT NULL,
+        imported_at REAL NOT NULL
+    );
+
+    -- Версии реестра для кэшей в нескольких процессах (см. _sync_registry_cache)
+    CREATE TABLE IF NOT EXISTS registry_version (
+        name    TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """ + "".join(
+        f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+        INSERT INTO registry_version(name, version) VALUES ('{table}', 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1;
+    END;
     """
+        for table in ("models", "characters")
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+    )
 
     # Отдельно добавляем данные
     add_data = """
@@ -70,30 +161,159 @@ def init_db():
 
     with _connect() as conn:
         conn.executescript(schema)
+        _migrate_notes_fts(conn)
+        _migrate_note_daily_stats(conn)
         try:
             conn.executescript(add_data)
         except sqlite3.IntegrityError:
             pass  # Данные уже существуют
+    invalidate_registry_cache()
     print("База данных инициализирована")
 
-def list_models() -> list[dict]:
+def _load_models() -> list[dict]:
     with _connect() as conn:
         rows = conn.execute("SELECT id,key,lable,active FROM models ORDER BY id").fetchall()
         return [{"id":r["id"], "key":r["key"], "lable":r["lable"], "active":bool(r["active"])} for r in rows]
+
+# Полнотекстовый индекс по заметкам (FTS5, external content = notes).
+# unicode61 складывает регистр и для кириллицы, но «ё» считает отдельной буквой —
+# поэтому в индекс пишем текст с ё→е (длина слов не меняется, snippet() не сбивается).
+# Колонка user_id хранит токен «u<id>»: фильтр по владельцу идёт внутри индекса,
+# а не после ранжирования совпадений всех пользователей.
+# prefix='2 3' — отдельные индексы префиксов, чтобы запросы вида «заме*» не сканировали словарь.
+NOTES_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE notes_fts USING fts5(
+    text,
+    user_id,
+    content = 'notes',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts(rowid, text, user_id)
+    VALUES (new.id, replace(replace(new.text, 'ё', 'е'), 'Ё', 'Е'), 'u' || new.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts(notes_fts, rowid, text, user_id)
+    VALUES ('delete', old.id, replace(replace(old.text, 'ё', 'е'), 'Ё', 'Е'), 'u' || old.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF text, user_id ON notes BEGIN
+    INSERT INTO notes_fts(notes_fts, rowid, text, user_id)
+    VALUES ('delete', old.id, replace(replace(old.text, 'ё', 'е'), 'Ё', 'Е'), 'u' || old.user_id);
+    INSERT INTO notes_fts(rowid, text, user_id)
+    VALUES (new.id, replace(replace(new.text, 'ё', 'е'), 'Ё', 'Е'), 'u' || new.user_id);
+END;
+"""
+
+def _migrate_notes_fts(conn) -> None:
+    """Миграция для существующих bot.db: создаём FTS-таблицу и индексируем уже сохранённые заметки."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='notes_fts'"
+    ).fetchone()
+    if exists:
+        return
+    conn.executescript(NOTES_FTS_SCHEMA)
+    # не 'rebuild': он взял бы текст из notes как есть, без замены ё→е
+    conn.execute(
+        "INSERT INTO notes_fts(rowid, text, user_id) "
+        "SELECT id, replace(replace(text, 'ё', 'е'), 'Ё', 'Е'), 'u' || user_id FROM notes"
+    )
+    conn.commit()
+    print("FTS-индекс заметок создан")
+
+# Счётчики заметок по дням: (пользователь, день UTC) -> сколько заметок создано.
+# Поддерживаются триггерами на notes, поэтому /note_stats за N дней читает не больше
+# N строк по первичному ключу, а не перебирает все заметки пользователя.
+NOTE_DAILY_STATS_SCHEMA = """
+CREATE TABLE note_daily_stats (
+    user_id INTEGER NOT NULL,
+    day     TEXT NOT NULL,              -- YYYY-MM-DD по created_at (UTC)
+    count   INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS note_daily_stats_ai AFTER INSERT ON notes BEGIN
+    INSERT INTO note_daily_stats(user_id, day, count) VALUES (new.user_id, date(new.created_at), 1)
+    ON CONFLICT(user_id, day) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS note_daily_stats_ad AFTER DELETE ON notes BEGIN
+    UPDATE note_daily_stats SET count = count - 1
+    WHERE user_id = old.user_id AND day = date(old.created_at);
+    DELETE FROM note_daily_stats
+    WHERE user_id = old.user_id AND day = date(old.created_at) AND count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS note_daily_stats_au AFTER UPDATE OF user_id, created_at ON notes BEGIN
+    UPDATE note_daily_stats SET count = count - 1
+    WHERE user_id = old.user_id AND day = date(old.created_at);
+    DELETE FROM note_daily_stats
+    WHERE user_id = old.user_id AND day = date(old.created_at) AND count <= 0;
+    INSERT INTO note_daily_stats(user_id, day, count) VALUES (new.user_id, date(new.created_at), 1)
+    ON CONFLICT(user_id, day) DO UPDATE SET count = count + 1;
+END;
+"""
+
+def _migrate_note_daily_stats(conn) -> None:
+    """Миграция для существующих bot.db: таблица счётчиков, триггеры и заполнение по уже сохранённым заметкам."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='note_daily_stats'"
+    ).fetchone()
+    if exists:
+        return
+    conn.executescript(NOTE_DAILY_STATS_SCHEMA)
+    _backfill_note_daily_stats(conn)
+    conn.commit()
+    print("Счётчики заметок по дням заполнены")
+
+def _backfill_note_daily_stats(conn) -> None:
+    conn.execute("DELETE FROM note_daily_stats")
+    conn.execute(
+        "INSERT INTO note_daily_stats(user_id, day, count) "
+        "SELECT user_id, date(created_at), COUNT(*) FROM notes GROUP BY user_id, date(created_at)"
+    )
+
+def rebuild_note_daily_stats() -> int:
+    """Пересчитать счётчики с нуля (одной транзакцией) — если их правили мимо триггеров. -> строк."""
+    with _connect() as conn:
+        _backfill_note_daily_stats(conn)
+        return conn.execute("SELECT COUNT(*) FROM note_daily_stats").fetchone()[0]
+
+def note_daily_counts(user_id: int, days: int) -> list[tuple[str, int]]:
+    """[(YYYY-MM-DD, заметок)] за последние days дней (UTC), только дни с заметками, по возрастанию."""
+    with _connect() as conn:
+        rows = conn.execute(
+            """SELECT day, count
+            FROM note_daily_stats
+            WHERE user_id = ? AND day >= date('now', ?)
+            ORDER BY day""",
+            (user_id, f"-{max(days, 1) - 1} days")
+        ).fetchall()
+    return [(r["day"], r["count"]) for r in rows]
+
+def list_models() -> list[dict]:
+    _sync_registry_cache()
+    return [dict(m) for m in _models_cache.get_or_load("all", _load_models)]
     
 
-def list_characters() -> list[dict]:
+def _load_characters() -> dict[int, dict]:
     with _connect() as conn:
-        rows = conn.execute("SELECT id, name FROM characters ORDER BY id").fetchall()
-        return [{"id": r["id"], "name": r["name"]} for r in rows]
+        rows = conn.execute("SELECT id, name, prompt FROM characters ORDER BY id").fetchall()
+        return {r["id"]: {"id": r["id"], "name": r["name"], "prompt": r["prompt"]} for r in rows}
+
+def list_characters() -> list[dict]:
+    _sync_registry_cache()
+    characters = _characters_cache.get_or_load("all", _load_characters)
+    return [{"id": c["id"], "name": c["name"]} for c in characters.values()]
 
 def get_character_by_id(character_id: int) -> dict | None:
-    with _connect() as conn:
-        row = conn.execute(
-            "SELECT id, name, prompt FROM characters WHERE id = ?",
-            (character_id,)
-        ).fetchone()
-    return {"id": row["id"], "name": row["name"], "prompt": row["prompt"]} if row else None
+    _sync_registry_cache()
+    character = _characters_cache.get_or_load("all", _load_characters).get(character_id)
+    return dict(character) if character else None
 
 def set_user_character(user_id: int, character_id: int) -> dict:
     character = get_character_by_id(character_id)
@@ -109,9 +329,15 @@ def set_user_character(user_id: int, character_id: int) -> dict:
             """,
             (user_id, character_id)
         )
-    return character
+    _user_character_cache.set(user_id, character)
+    return dict(character)
 
 def get_user_character(user_id: int) -> dict:
+    _sync_registry_cache()
+    character = _user_character_cache.get_or_load(user_id, lambda: _load_user_character(user_id))
+    return dict(character)
+
+def _load_user_character(user_id: int) -> dict:
     with _connect() as conn:
         row = conn.execute(""" 
             SELECT p.id, p.name, p.prompt
@@ -135,6 +361,10 @@ def get_character_prompt_for_user(user_id: int) -> str:
     return get_user_character(user_id)["prompt"]
 
 def get_active_model() -> dict:
+    _sync_registry_cache()
+    return dict(_models_cache.get_or_load("active", _load_active_model))
+
+def _load_active_model() -> dict:
     with _connect() as conn:
         row = conn.execute("SELECT id,key,lable FROM models WHERE active=1").fetchone()
         if row:
@@ -143,6 +373,7 @@ def get_active_model() -> dict:
         if not row:
             raise RuntimeError("В реестре моделей нет записей")
         conn.execute("UPDATE models SET active=CASE WHEN id=? THEN 1 ELSE 0 END", (row["id"],))
+        _models_cache.pop("all")
         return {"id":row["id"], "key":row["key"], "lable":row["lable"], "active":True}
 
 def set_active_model(model_id: int) -> dict:
@@ -154,6 +385,7 @@ def set_active_model(model_id: int) -> dict:
             raise ValueError("Неизвестный ID модели")
         conn.execute("UPDATE models SET active=CASE WHEN id=? THEN 1 ELSE 0 END", (model_id,))
         conn.commit()
+        _models_cache.clear()
         return get_active_model()
 
 def add_note(user_id: int, text: str) -> int:
@@ -165,6 +397,96 @@ def add_note(user_id: int, text: str) -> int:
         conn.commit()
     return cur.lastrowid
 
+IMPORT_CHUNK = 1000
+
+def add_notes_bulk(user_id: int, texts, *, chunk: int = IMPORT_CHUNK, dedupe: bool = True,
+                   progress=None) -> dict:
+    """
+    Массовая вставка заметок (импорт, миграция notes.json). В отличие от add_note в цикле —
+    executemany пачками по chunk строк, одна транзакция (и один fsync) на пачку.
+
+    texts — любой итерируемый источник строк (читается один раз, лениво); пустые пропускаются.
+    dedupe=True: повторы внутри импорта и тексты, которые у пользователя уже есть, не вставляются.
+    Для этого строки сначала складываются во временную таблицу (UNIQUE по тексту), затем
+    за один проход по заметкам пользователя из неё удаляется то, что уже есть.
+    progress(вставлено, всего) вызывается после каждой пачки.
+    -> {"received", "empty", "duplicates", "inserted"}
+    """
+    stats = {"received": 0, "empty": 0, "duplicates": 0, "inserted": 0}
+
+    def cleaned():
+        for text in texts:
+            stats["received"] += 1
+            text = text.strip()
+            if text:
+                yield text
+            else:
+                stats["empty"] += 1
+
+    def batches(rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    conn = _connect()
+    if not dedupe:
+        for batch in batches(cleaned()):
+            with conn:
+                conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)", ((user_id, t) for t in batch))
+            stats["inserted"] += len(batch)
+            if progress:
+                progress(stats["inserted"], None)
+        return stats
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS note_import (seq INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE)")
+    try:
+        with conn:
+            conn.execute("DELETE FROM temp.note_import")
+        for batch in batches(cleaned()):
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO temp.note_import(text) VALUES (?)", ((t,) for t in batch))
+        with conn:
+            conn.execute("DELETE FROM temp.note_import WHERE text IN (SELECT text FROM notes WHERE user_id = ?)",
+                         (user_id,))
+        total = conn.execute("SELECT COUNT(*) FROM temp.note_import").fetchone()[0]
+        stats["duplicates"] = stats["received"] - stats["empty"] - total
+
+        last_seq = 0
+        while True:
+            rows = conn.execute(
+                "SELECT seq, text FROM temp.note_import WHERE seq > ? ORDER BY seq LIMIT ?", (last_seq, chunk)
+            ).fetchall()
+            if not rows:
+                break
+            with conn:
+                conn.executemany("INSERT INTO notes(user_id, text) VALUES (?, ?)", ((user_id, r["text"]) for r in rows))
+            last_seq = rows[-1]["seq"]
+            stats["inserted"] += len(rows)
+            if progress:
+                progress(stats["inserted"], total)
+    finally:
+        with conn:
+            conn.execute("DELETE FROM temp.note_import")
+    return stats
+
+def get_legacy_import(source: str) -> dict | None:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM legacy_note_imports WHERE source = ?", (source,)).fetchone()
+    return dict(row) if row else None
+
+def record_legacy_import(source: str, user_id: int, inserted: int) -> None:
+    with _connect() as conn:
+        conn.execute(
+            """INSERT INTO legacy_note_imports(source, user_id, inserted, imported_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET user_id = excluded.user_id,
+                inserted = legacy_note_imports.inserted + excluded.inserted, imported_at = excluded.imported_at""",
+            (source, user_id, inserted, time.time()))
+
 def list_notes(user_id: int, limit: int = 50):
     with _connect() as conn:
         cur = conn.execute(
@@ -177,18 +499,142 @@ def list_notes(user_id: int, limit: int = 50):
         )
     return cur.fetchall()
 
-def find_notes(user_id: int, query: str, limit: int = 50):
+def count_notes(user_id: int) -> int:
     with _connect() as conn:
-        cur = conn.execute(
+        return conn.execute("SELECT COUNT(*) FROM notes WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def _keyset_page(conn, sql: str, params: tuple, key: str,
+                 before_id: int | None, after_id: int | None, limit: int):
+    """
+    Одна страница по ключу key (id заметки), новые сверху. sql — шаблон
+    "SELECT ... WHERE ... {cond} ORDER BY <key> {order} LIMIT ?".
+    before_id — листаем к старым (id < before_id), after_id — к новым (id > after_id).
+    Без OFFSET: поиск по индексу до курсора + limit строк, цена не зависит от глубины.
+    Есть ли что-то по ту сторону страницы — отдельная проба LIMIT 1, тоже по индексу.
+    """
+    def fetch(cond: str, order: str, args: tuple, n: int):
+        return conn.execute(sql.format(cond=cond, order=order), (*params, *args, n)).fetchall()
+
+    if after_id is not None:
+        rows = fetch(f"AND {key} > ?", "ASC", (after_id,), limit + 1)
+        if rows:
+            has_newer = len(rows) > limit
+            rows = rows[:limit][::-1]
+            has_older = bool(fetch(f"AND {key} < ?", "DESC", (rows[-1]["id"],), 1))
+            return rows, has_older, has_newer
+        before_id = None  # более новых не осталось (удалили) — первая страница
+    cond, args = (f"AND {key} < ?", (before_id,)) if before_id is not None else ("", ())
+    rows = fetch(cond, "DESC", args, limit + 1)
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    has_newer = before_id is not None and bool(rows) and bool(fetch(f"AND {key} > ?", "ASC", (rows[0]["id"],), 1))
+    return rows, has_older, has_newer
+
+def list_notes_page(user_id: int, *, before_id: int | None = None, after_id: int | None = None,
+                    limit: int = 10):
+    """Страница заметок пользователя по индексу (user_id, id). -> (rows, has_older, has_newer)"""
+    with _connect() as conn:
+        return _keyset_page(
+            conn,
             """SELECT id, text, created_at
             FROM notes
-            WHERE user_id = ? AND text LIKE ?
-            ORDER BY id DESC
+            WHERE user_id = ? {cond}
+            ORDER BY id {order}
             LIMIT ?""",
-            (user_id, f'%{query}%', limit)
+            (user_id,), "id", before_id, after_id, limit,
+        )
+
+def iter_notes(user_id: int, batch: int = 500, *, since: str | None = None, until: str | None = None):
+    """
+    Все заметки пользователя от старых к новым, пачками по batch (keyset, без OFFSET).
+    since / until — 'YYYY-MM-DD' (UTC, включительно). Между пачками соединение
+    свободно, в памяти — не больше одной пачки.
+    """
+    last_id = 0
+    while True:
+        with _connect() as conn:
+            rows = conn.execute(
+                """SELECT id, text, created_at
+                FROM notes
+                WHERE user_id = ? AND id > ?
+                  AND (? IS NULL OR created_at >= ?)
+                  AND (? IS NULL OR created_at < date(?, '+1 day'))
+                ORDER BY id
+                LIMIT ?""",
+                (user_id, last_id, since, since, until, until, batch)
+            ).fetchall()
+        yield from rows
+        if len(rows) < batch:
+            return
+        last_id = rows[-1]["id"]
+
+def _fts_query(query: str) -> str:
+    # Каждое слово — префиксный поиск в кавычках (спецсимволы FTS5 не ломают запрос),
+    # слова объединяются по AND: «купить мол» найдёт «Купить молоко».
+    words = re.findall(r"\w+", query.replace("ё", "е").replace("Ё", "Е"))
+    return " ".join(f'text:"{w}"*' for w in words)
+
+def find_notes(user_id: int, query: str, limit: int = 50):
+    """
+    Поиск по заметкам через FTS5: ранжирование bm25, префиксы, подсветка в поле snippet.
+    Если в запросе нет ни одного слова (только знаки) — старый путь через LIKE.
+    """
+    match = _fts_query(query)
+    with _connect() as conn:
+        if not match:
+            cur = conn.execute(
+                """SELECT id, text, created_at, text AS snippet
+                FROM notes
+                WHERE user_id = ? AND text LIKE ?
+                ORDER BY id DESC
+                LIMIT ?""",
+                (user_id, f'%{query}%', limit)
+            )
+            return cur.fetchall()
+        cur = conn.execute(
+            """SELECT n.id, n.text, n.created_at,
+                   snippet(notes_fts, 0, '[', ']', '…', 12) AS snippet
+            FROM notes_fts
+            JOIN notes n ON n.id = notes_fts.rowid
+            WHERE notes_fts MATCH ? AND n.user_id = ?
+            ORDER BY bm25(notes_fts, 1.0, 0.0)
+            LIMIT ?""",
+            (f'user_id:"u{int(user_id)}" AND {match}', user_id, limit)
         )
     return cur.fetchall()
 
+def find_notes_page(user_id: int, query: str, *, before_id: int | None = None,
+                    after_id: int | None = None, limit: int = 10):
+    """
+    Поиск с постраничной навигацией. В отличие от find_notes, порядок — по id
+    (новые сверху), а не по bm25: ранжирование требует посчитать все совпадения
+    на каждой странице, а диапазон по rowid FTS5 отдаёт прямо из индекса.
+    -> (rows, has_older, has_newer), в rows есть поле snippet.
+    """
+    match = _fts_query(query)
+    with _connect() as conn:
+        if not match:
+            return _keyset_page(
+                conn,
+                """SELECT id, text, created_at, text AS snippet
+                FROM notes
+                WHERE user_id = ? AND text LIKE ? {cond}
+                ORDER BY id {order}
+                LIMIT ?""",
+                (user_id, f'%{query}%'), "id", before_id, after_id, limit,
+            )
+        return _keyset_page(
+            conn,
+            """SELECT n.id, n.text, n.created_at,
+                   snippet(notes_fts, 0, '[', ']', '…', 12) AS snippet
+            FROM notes_fts
+            JOIN notes n ON n.id = notes_fts.rowid
+            WHERE notes_fts MATCH ? AND n.user_id = ? {cond}
+            ORDER BY notes_fts.rowid {order}
+            LIMIT ?""",
+            (f'user_id:"u{int(user_id)}" AND {match}', user_id), "notes_fts.rowid", before_id, after_id, limit,
+        )
+
 def update_note(user_id: int, note_id: int, text: str) -> bool:
     with _connect() as conn:
         cur = conn.execute(
@@ -217,6 +663,99 @@ def get_note(user_id: int, note_id: int):
         )
     return cur.fetchone()
 
+# ---------- история диалогов ----------
+def add_turns(user_id: int, character_id: int, turns: list[tuple[str, str, int]]) -> None:
+    """turns — [(role, content, tokens), ...] одного обмена репликами, одной транзакцией."""
+    now = time.time()
+    with _connect() as conn:
+        conn.executemany(
+            """INSERT INTO conversation_turns(telegram_user_id, character_id, role, content, tokens, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            [(user_id, character_id, role, content, tokens, now) for role, content, tokens in turns]
+        )
+
+def iter_recent_turns(user_id: int, character_id: int):
+    """
+    Реплики от новых к старым. Курсор ленивый (индекс idx_turns_dialog),
+    так что вызывающий читает ровно столько строк, сколько поместилось в бюджет.
+    """
+    conn = _connect()
+    cur = conn.execute(
+        """SELECT role, content, tokens FROM conversation_turns
+        WHERE telegram_user_id = ? AND character_id = ?
+        ORDER BY id DESC""",
+        (user_id, character_id)
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+def get_conversation_summary(user_id: int, character_id: int) -> str | None:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT summary FROM conversation_summary WHERE telegram_user_id = ? AND character_id = ?",
+            (user_id, character_id)
+        ).fetchone()
+    return row["summary"] if row else None
+
+def clear_conversation(user_id: int, character_id: int) -> int:
+    with _connect() as conn:
+        n = conn.execute(
+            "DELETE FROM conversation_turns WHERE telegram_user_id = ? AND character_id = ?",
+            (user_id, character_id)
+        ).rowcount
+        conn.execute(
+            "DELETE FROM conversation_summary WHERE telegram_user_id = ? AND character_id = ?",
+            (user_id, character_id)
+        )
+    return n
+
+def prune_conversations(keep_turns: int, max_age_s: float, summarize) -> dict:
+    """
+    Оставляет в каждом диалоге не больше keep_turns последних реплик; удаляемые
+    передаются в summarize(old_summary, [(role, content), ...]) -> new_summary.
+    Реплики и выжимки старше max_age_s удаляются целиком.
+    """
+    now = time.time()
+    folded = 0
+    with _connect() as conn:
+        dialogs = conn.execute(
+            """SELECT telegram_user_id, character_id FROM conversation_turns
+            GROUP BY telegram_user_id, character_id HAVING COUNT(*) > ?""",
+            (keep_turns,)
+        ).fetchall()
+    for d in dialogs:
+        key = (d["telegram_user_id"], d["character_id"])
+        with _connect() as conn:
+            old = conn.execute(
+                """SELECT id, role, content FROM conversation_turns
+                WHERE telegram_user_id = ? AND character_id = ?
+                ORDER BY id DESC LIMIT -1 OFFSET ?""",
+                (*key, keep_turns)
+            ).fetchall()
+            if not old:
+                continue
+            prev = conn.execute(
+                "SELECT summary FROM conversation_summary WHERE telegram_user_id = ? AND character_id = ?", key
+            ).fetchone()
+            summary = summarize(prev["summary"] if prev else None, [(r["role"], r["content"]) for r in reversed(old)])
+            conn.execute(
+                """INSERT INTO conversation_summary(telegram_user_id, character_id, summary, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(telegram_user_id, character_id)
+                DO UPDATE SET summary = excluded.summary, updated_at = excluded.updated_at""",
+                (*key, summary, now)
+            )
+            folded += conn.execute(
+                "DELETE FROM conversation_turns WHERE telegram_user_id = ? AND character_id = ? AND id <= ?",
+                (*key, old[0]["id"])
+            ).rowcount
+    with _connect() as conn:
+        expired = conn.execute("DELETE FROM conversation_turns WHERE created_at < ?", (now - max_age_s,)).rowcount
+        conn.execute("DELETE FROM conversation_summary WHERE updated_at < ?", (now - max_age_s,))
+    return {"dialogs": len(dialogs), "folded": folded, "expired": expired}
+
 def _build_message(user_id: int, user_text: str) -> list[dict]:
     p = get_user_character(user_id)
     system = (
@@ -9,7 +9,7 @@ db.py — слой данных для DailyZodiakBot.
   - last_sent_date TEXT      — 'YYYY-MM-DD', чтобы не слать повторно за день
 
 Приёмы:
-  - отдельное подключение под каждую операцию (with _connect());
+  - соединение из пула sqlite_pool (одно на поток), with _connect() — транзакция;
   - PRAGMA: WAL + busy_timeout + row_factory=Row (см. Л3) [oai_citation:5‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME);
   - все SQL — параметризованные через "?" (никаких f-строк).
 """
@@ -19,6 +19,7 @@ import sqlite3
 import logging
 from typing import Optional
 
+import sqlite_pool
 from config2 import DB_PATH, DEFAULT_NOTIFY_HOUR
 
 log = logging.getLogger(__name__)
@@ -26,12 +27,8 @@ log = logging.getLogger(__name__)
 
 # ---------- подключение с «правильными» PRAGMA (см. Л3) ----------
 def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, timeout=5.0)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.execute("PRAGMA journal_mode = WAL")
-    conn.execute("PRAGMA busy_timeout = 5000")
-    return conn
+    # PRAGMA выполняются один раз при открытии соединения в sqlite_pool
+    return sqlite_pool.connect(DB_PATH)
 # WAL + busy_timeout уменьшают «database is locked», row_factory даёт доступ к полям по имени [oai_citation:6‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
 
 
@@ -52,6 +49,9 @@ def init_db() -> None:
 
     CREATE INDEX IF NOT EXISTS idx_users_hour ON users(notify_hour);
     CREATE INDEX IF NOT EXISTS idx_users_sent ON users(last_sent_date);
+    -- покрывающий индекс для планировщика и выборки получателей рассылки
+    CREATE INDEX IF NOT EXISTS idx_users_due
+        ON users(subscribed, notify_hour, last_sent_date) WHERE sign IS NOT NULL;
 
     CREATE TABLE IF NOT EXISTS models (
     
@@ -121,10 +121,63 @@ def list_due_users(today_str: str, hour: int) -> list[sqlite3.Row]:
         )
         return cur.fetchall()
 
+def schedule_by_hour(today_str: str) -> dict[int, int]:
+    """
+    {час: сколько подписчиков этого часа ещё не получили рассылку сегодня}
+    по всем часам, где есть подписчики со знаком. Идёт по индексу idx_users_due.
+    """
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT notify_hour,
+                   SUM(CASE WHEN last_sent_date IS NULL OR last_sent_date <> ? THEN 1 ELSE 0 END) AS pending
+            FROM users
+            WHERE subscribed = 1 AND sign IS NOT NULL
+            GROUP BY notify_hour
+            """,
+            (today_str,)
+        ).fetchall()
+    return {r["notify_hour"]: r["pending"] for r in rows}
+
+def iter_due_users(today_str: str, hour: int, page_size: int = 1000):
+    """
+    То же, что list_due_users, но страницами по user_id (keyset):
+    десятки тысяч получателей не грузятся в память одним списком.
+    """
+    last_id = -1
+    while True:
+        with _connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT user_id, sign
+                FROM users
+                WHERE subscribed = 1
+                  AND sign IS NOT NULL
+                  AND notify_hour = ?
+                  AND (last_sent_date IS NULL OR last_sent_date <> ?)
+                  AND user_id > ?
+                ORDER BY user_id
+                LIMIT ?
+                """,
+                (hour, today_str, last_id, page_size)
+            ).fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["user_id"]
+
 def mark_sent_today(user_id: int, today_str: str) -> None:
     with _connect() as conn:
         conn.execute("UPDATE users SET last_sent_date = ? WHERE user_id = ?", (today_str, user_id))
 
+def mark_sent_many(user_ids: list[int], today_str: str) -> None:
+    """Отметка отправки для пачки пользователей одной транзакцией."""
+    with _connect() as conn:
+        conn.executemany(
+            "UPDATE users SET last_sent_date = ? WHERE user_id = ?",
+            [(today_str, uid) for uid in user_ids]
+        )
+
 
 
 def ensure_models() -> None:
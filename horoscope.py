@@ -0,0 +1,101 @@
+"""
+horoscope.py — «гороскоп дня» для DailyZodiakBot без внешних API.
+
+Текст детерминированно зависит только от (знак, дата), поэтому за день есть
+ровно 12 разных текстов. Вместо шести md5 на каждого получателя рассылки
+таблица на дату рендерится один раз (precompute), дальше — поиск в dict.
+"""
+
+from __future__ import annotations
+import hashlib
+import threading
+from datetime import date, timedelta
+
+# ---------- справочник знаков ----------
+CANON_SIGNS = [
+    "овен", "телец", "близнецы", "рак", "лев", "дева",
+    "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"
+]
+SIGN_EMOJI = {
+    "овен":"♈", "телец":"♉", "близнецы":"♊", "рак":"♋", "лев":"♌", "дева":"♍",
+    "весы":"♎", "скорпион":"♏", "стрелец":"♐", "козерог":"♑", "водолей":"♒", "рыбы":"♓"
+}
+
+
+# ---------- генерация «гороскопа» без API (детерминированно на (sign, date)) ----------
+INTRO = [
+    "Сегодня вас ждёт", "День сулит", "Утро принесёт", "В первой половине дня вероятно",
+    "Хорошее время для", "Подходящий момент для"
+]
+FOCUS = ["работы", "личных дел", "общения", "обучения", "творчества", "маленьких поездок"]
+ADVICE = [
+    "действуйте спокойно и без спешки", "обратите внимание на детали", "держите курс и не отвлекайтесь",
+    "не спорьте из принципа", "подумайте о пользе привычек", "не бойтесь попросить помощи"
+]
+LUCK = [
+    "удача на вашей стороне", "окружающие настроены дружелюбно", "случай поможет тем, кто готов",
+    "небольшой риск себя оправдает", "поддержка придёт вовремя", "день подойдёт для новых начал"
+]
+COLOR = ["синий", "зелёный", "жёлтый", "красный", "фиолетовый", "белый", "оранжевый"]
+NUMBER = [3, 4, 5, 6, 7, 8, 9]
+
+def _pick(seq: list, seed: bytes, salt: str) -> str:
+    h = hashlib.md5(seed + salt.encode("utf-8")).hexdigest()
+    idx = int(h, 16) % len(seq)
+    return str(seq[idx])
+
+def make_daily_text(sign: str, for_date: date) -> str:
+    """
+    Генерирует 3–4 коротких фразы и пару «фишек» (цвет, число).
+    Детерминированно для (sign, date) — без внешних API.
+    """
+    iso = for_date.isoformat().encode("utf-8")
+    sgn = sign.encode("utf-8")
+    intro = _pick(INTRO, sgn+iso, ":intro")
+    focus = _pick(FOCUS, sgn+iso, ":focus")
+    advice = _pick(ADVICE, sgn+iso, ":advice")
+    luck = _pick(LUCK, sgn+iso, ":luck")
+    color = _pick(COLOR, sgn+iso, ":color")
+    number = _pick(NUMBER, sgn+iso, ":num")
+
+    emoji = SIGN_EMOJI.get(sign, "")
+    return (
+        f"{emoji} *{sign.capitalize()}* — {for_date.strftime('%Y-%m-%d')}\n"
+        f"{intro} акцент на *{focus}*; {luck}. Советы: {advice}.\n\n"
+        f"Счастливый цвет: *{color}*, число дня: *{number}*.\n"
+        f"_Развлекательный контент._"
+    )
+
+# ---------- таблица готовых текстов на даты ----------
+KEEP_DAYS_BEHIND = 1  # вчерашняя таблица нужна рассылке, которая перевалила за полночь
+
+_table: dict[date, dict[str, str]] = {}
+_table_lock = threading.Lock()
+
+
+def precompute(for_date: date, days_ahead: int = 0) -> None:
+    """Рендерит все 12 знаков на for_date и ещё days_ahead дней вперёд; старые даты выкидывает."""
+    for i in range(days_ahead + 1):
+        d = for_date + timedelta(days=i)
+        if d in _table:
+            continue
+        rendered = {s: make_daily_text(s, d) for s in CANON_SIGNS}
+        with _table_lock:
+            _table[d] = rendered
+    cutoff = for_date - timedelta(days=KEEP_DAYS_BEHIND)
+    with _table_lock:
+        for d in [d for d in _table if d < cutoff]:
+            del _table[d]
+
+
+def daily_text(sign: str, for_date: date) -> str:
+    """Готовый текст из таблицы; дата считается при первом обращении."""
+    day = _table.get(for_date)
+    if day is None:
+        precompute(for_date)
+        day = _table[for_date]
+    text = day.get(sign)
+    return text if text is not None else make_daily_text(sign, for_date)
+
+
+__all__ = ["CANON_SIGNS", "SIGN_EMOJI", "make_daily_text", "daily_text", "precompute"]
@@ -0,0 +1,56 @@
+"""
+http_pool.py — общий requests.Session с пулом keep-alive соединений.
+
+requests.post() каждый раз создаёт новую сессию: новый TCP + TLS handshake на
+каждый вопрос к модели. Сессия из этого модуля держит соединения открытыми
+(до POOL_SIZE на хост) и переиспользуется всеми потоками процесса.
+Время запросов учитывается в metrics как зависимость «openrouter» (для стрима —
+до получения заголовков ответа).
+"""
+
+from __future__ import annotations
+import atexit
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import track
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+class _TimedSession(requests.Session):
+    def request(self, *args, **kwargs):
+        with track("openrouter"):
+            return super().request(*args, **kwargs)
+
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                s = _TimedSession()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def close_session() -> None:
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+atexit.register(close_session)
+
+__all__ = ["get_session", "close_session", "POOL_SIZE"]
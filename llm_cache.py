@@ -0,0 +1,173 @@
+"""
+llm_cache.py — постоянный кэш ответов LLM (SQLite).
+
+Ключ — sha256 от (ключ модели, полный список messages, параметры генерации).
+Одинаковый вопрос тому же персонажу и той же модели при низкой температуре
+отдаётся из кэша за миллисекунды и не тратит бесплатную квоту OpenRouter.
+
+  - TTL: записи старше LLM_CACHE_TTL_S считаются промахом;
+  - размер: не больше LLM_CACHE_MAX_ENTRIES, вытесняются давно не читанные (LRU по last_used);
+  - при temperature > LLM_CACHE_MAX_TEMPERATURE кэш не используется — ответы должны отличаться.
+
+Одинаковые запросы, пришедшие одновременно (пока ответа ещё нет в кэше),
+склеиваются через flights (singleflight.py): к OpenRouter уходит один запрос,
+остальные получают его ответ или его ошибку.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import sqlite_pool
+from ai_client import chat_once
+from singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+TTL_S = int(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+EVICT_EVERY = 100  # проверяем размер раз в N записей, а не на каждую
+
+_schema_ready = False
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypass": 0, "evicted": 0}
+_writes = 0
+
+# Одновременные одинаковые запросы к LLM (ключ — request_key)
+flights: SingleFlight = SingleFlight("llm_requests")
+
+
+def _connect():
+    global _schema_ready
+    conn = sqlite_pool.connect(CACHE_PATH)
+    if not _schema_ready:
+        with conn:
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key        TEXT PRIMARY KEY,
+                model      TEXT NOT NULL,
+                text       TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used  REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions(last_used);
+            """)
+        _schema_ready = True
+    return conn
+
+
+def make_key(model: str, messages: List[Dict], **params) -> str:
+    raw = json.dumps([model, messages, params], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def request_key(messages: List[Dict], *, model: str, temperature: float, max_tokens: int) -> str:
+    return make_key(model, messages, temperature=temperature, max_tokens=max_tokens)
+
+
+def get(key: str) -> str | None:
+    now = time.time()
+    with _connect() as conn:
+        row = conn.execute("SELECT text, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row["created_at"] > TTL_S:
+            return None
+        conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+    return row["text"]
+
+
+def put(key: str, model: str, text: str) -> None:
+    global _writes
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            """INSERT INTO completions(key, model, text, created_at, last_used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET text = excluded.text,
+                created_at = excluded.created_at, last_used = excluded.last_used""",
+            (key, model, text, now, now)
+        )
+    with _lock:
+        _writes += 1
+        check = _writes % EVICT_EVERY == 0
+    if check:
+        evict()
+
+
+def evict() -> int:
+    """Удаляет просроченные записи и самые давно читанные сверх MAX_ENTRIES."""
+    with _connect() as conn:
+        n = conn.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - TTL_S,)).rowcount
+        extra = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - MAX_ENTRIES
+        if extra > 0:
+            n += conn.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_used LIMIT ?)",
+                (extra,)
+            ).rowcount
+    with _lock:
+        _stats["evicted"] += n
+    return n
+
+
+def lookup(messages: List[Dict], *, model: str, temperature: float, max_tokens: int) -> str | None:
+    """Ответ из кэша или None (промах либо температура выше порога)."""
+    if temperature > MAX_TEMPERATURE:
+        with _lock:
+            _stats["bypass"] += 1
+        return None
+    key = request_key(messages, model=model, temperature=temperature, max_tokens=max_tokens)
+    try:
+        text = get(key)
+    except Exception as e:  # кэш не должен ломать ответ пользователю
+        log.warning("LLM cache read failed: %r", e)
+        text = None
+    with _lock:
+        _stats["hits" if text is not None else "misses"] += 1
+    return text
+
+
+def store(messages: List[Dict], text: str, *, model: str, temperature: float, max_tokens: int) -> None:
+    if not text or temperature > MAX_TEMPERATURE:
+        return
+    try:
+        put(request_key(messages, model=model, temperature=temperature, max_tokens=max_tokens), model, text)
+    except Exception as e:
+        log.warning("LLM cache write failed: %r", e)
+
+
+def cached_chat_once(messages: List[Dict], *,
+                     model: str,
+                     temperature: float = 0.2,
+                     max_tokens: int = 400,
+                     timeout_s: int = 30) -> Tuple[str, int, bool]:
+    """
+    chat_once() с кэшем и склейкой одновременных одинаковых запросов.
+    Возвращает (text, dt_ms, from_cache); при попадании dt_ms — время чтения из кэша,
+    при склейке — сколько ждал этот вызов.
+    """
+    t0 = time.perf_counter()
+    text = lookup(messages, model=model, temperature=temperature, max_tokens=max_tokens)
+    if text is not None:
+        return text, int((time.perf_counter() - t0) * 1000), True
+
+    key = request_key(messages, model=model, temperature=temperature, max_tokens=max_tokens)
+    (text, dt_ms), shared = flights.do(key, lambda: chat_once(
+        messages, model=model, temperature=temperature, max_tokens=max_tokens, timeout_s=timeout_s))
+    if shared:
+        return text, int((time.perf_counter() - t0) * 1000), False
+    store(messages, text, model=model, temperature=temperature, max_tokens=max_tokens)
+    return text, dt_ms, False
+
+
+def stats() -> dict:
+    with _lock:
+        return {"name": "llm_completions", **_stats, "coalesced": flights.coalesced}
+
+
+__all__ = ["cached_chat_once", "lookup", "store", "make_key", "request_key", "flights", "get", "put", "evict", "stats"]
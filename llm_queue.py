@@ -0,0 +1,182 @@
+"""
+llm_queue.py — отдельный пул для запросов к LLM.
+
+Было: /ask, /ask_model, /ask_random вызывали OpenRouter прямо в потоке-обработчике
+TeleBot (таймаут 30 с). Несколько медленных ответов занимали все потоки, и
+/note_add, /models ждали за ними.
+
+Стало: обработчик ставит задачу в очередь и сразу отвечает «думаю…», а
+LLM_WORKERS собственных потоков выполняют задачи:
+  - справедливость: у каждого пользователя своя очередь, потоки берут задачи
+    по кругу (round-robin), так что один активный пользователь не задерживает остальных;
+  - ограничения: не больше LLM_QUEUE_MAX_DEPTH задач всего и LLM_QUEUE_MAX_PER_USER
+    на пользователя, сверх — QueueFull;
+  - метрики: глубина очереди, время ожидания и выполнения (среднее, p50, p99).
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List
+
+from ai_client import MAX_IN_FLIGHT
+
+log = logging.getLogger(__name__)
+
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", str(MAX_IN_FLIGHT)))
+LLM_QUEUE_MAX_DEPTH = int(os.getenv("LLM_QUEUE_MAX_DEPTH", "100"))
+LLM_QUEUE_MAX_PER_USER = int(os.getenv("LLM_QUEUE_MAX_PER_USER", "3"))
+SAMPLES = 1000  # сколько последних замеров хранить для перцентилей
+
+
+class QueueFull(Exception):
+    """Очередь (общая или пользователя) заполнена; текст — для пользователя."""
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))]
+
+
+class LLMJobQueue:
+    def __init__(self, *,
+                 workers: int = LLM_WORKERS,
+                 max_depth: int = LLM_QUEUE_MAX_DEPTH,
+                 max_per_user: int = LLM_QUEUE_MAX_PER_USER) -> None:
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+        self._queues: Dict[int, Deque[tuple[Callable[[], None], float]]] = {}
+        self._ready: Deque[int] = deque()   # пользователи с задачами, в порядке обхода
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopped = False
+        self._depth = 0
+        self._active = 0
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "max_depth": 0}
+        self._waits: Deque[float] = deque(maxlen=SAMPLES)
+        self._runs: Deque[float] = deque(maxlen=SAMPLES)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """
+        Мягкая остановка: ждёт, пока очередь опустеет и текущие задачи допишут ответы,
+        затем stop(). Возвращает False, если за timeout не успели (оставшееся отбрасывается).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._depth or self._active:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                self._cond.wait(0.1)
+            done = not self._depth and not self._active
+        self.stop()
+        return done
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def submit(self, user_id: int, job: Callable[[], None]) -> int:
+        """
+        Ставит job в очередь пользователя. Возвращает, сколько задач было впереди
+        (для сообщения «в очереди: N»). Бросает QueueFull, если места нет.
+        """
+        self.start()
+        with self._cond:
+            q = self._queues.get(user_id)
+            if self._depth >= self.max_depth:
+                self._counters["rejected"] += 1
+                raise QueueFull("Сейчас слишком много вопросов, попробуйте через минуту.")
+            if q is not None and len(q) >= self.max_per_user:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"У вас уже {len(q)} вопрос(а) в очереди, дождитесь ответа.")
+            if q is None:
+                q = self._queues[user_id] = deque()
+                self._ready.append(user_id)
+            q.append((job, time.perf_counter()))
+            ahead = self._depth
+            self._depth += 1
+            self._counters["submitted"] += 1
+            self._counters["max_depth"] = max(self._counters["max_depth"], self._depth)
+            self._cond.notify()
+        return ahead
+
+    def _take(self) -> tuple[Callable[[], None], float] | None:
+        with self._cond:
+            while not self._ready and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return None
+            user_id = self._ready.popleft()
+            q = self._queues[user_id]
+            item = q.popleft()
+            if q:
+                self._ready.append(user_id)   # остальные задачи пользователя — в конец круга
+            else:
+                del self._queues[user_id]
+            self._depth -= 1
+            self._active += 1
+            return item
+
+    def _worker(self) -> None:
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            job, enqueued = item
+            started = time.perf_counter()
+            ok = True
+            try:
+                job()
+            except Exception as e:
+                ok = False
+                log.exception("LLM job failed: %r", e)
+            finished = time.perf_counter()
+            with self._cond:
+                self._active -= 1
+                self._counters["done" if ok else "failed"] += 1
+                self._waits.append((started - enqueued) * 1000)
+                self._runs.append((finished - started) * 1000)
+
+    def stats(self) -> dict:
+        with self._cond:
+            waits, runs = list(self._waits), list(self._runs)
+            return {
+                "depth": self._depth,
+                "active": self._active,
+                "users": len(self._queues),
+                "workers": self.workers,
+                **self._counters,
+                "wait_ms_avg": sum(waits) / len(waits) if waits else 0.0,
+                "wait_ms_p50": _percentile(waits, 0.50),
+                "wait_ms_p99": _percentile(waits, 0.99),
+                "run_ms_avg": sum(runs) / len(runs) if runs else 0.0,
+                "run_ms_p50": _percentile(runs, 0.50),
+                "run_ms_p99": _percentile(runs, 0.99),
+            }
+
+
+__all__ = ["LLMJobQueue", "QueueFull", "LLM_WORKERS", "LLM_QUEUE_MAX_DEPTH", "LLM_QUEUE_MAX_PER_USER"]
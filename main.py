@@ -2,17 +2,18 @@ import os
 from dotenv import load_dotenv
 from telebot import types
 from typing import List
-import telebot
 import logging
 import requests
 
+from runner import create_bot, run_bot
+
 
 
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
 if not TOKEN:
  raise RuntimeError(" .env =5F TOKEN")
-bot = telebot.TeleBot(TOKEN)
+bot = create_bot(TOKEN)
 
 
 def parse_ints_from_text(text: str) -> List[int]:
@@ -206,6 +207,6 @@ def cmd_max(message):
 
 
 if __name__ == "__main__":
- bot.infinity_polling(skip_pending=True)
+ run_bot(bot)  # polling или webhook (BOT_MODE)
 
 
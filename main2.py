@@ -2,15 +2,26 @@ import os
 from dotenv import load_dotenv
 import telebot
 import time
-import json
 import random
 from telebot import types
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from db import *
 from db import list_characters, get_character_by_id, get_user_character
 from db import get_character_by_id
-from ai_client import chat_once, OpenRouterError
-from db import init_db
+from ai_client import OpenRouterError, RETRY_STATS
+from circuit_breaker import get_breaker, all_stats as breaker_stats
+from db import init_db, _build_message
+import note_pages
+from note_export import export_notes, parse_export_args, ExportTooLarge
+from note_import import texts_from_file, lines_from_text, IMPORT_MAX_BYTES
+from migrate_notes_json import migrate_on_startup
+import llm_cache
+from stream_reply import reply_queued
+from llm_queue import LLMJobQueue
+from model_router import router
+from conversation import with_history, remember, HistoryPruner
+from runner import create_bot, run_bot
+from ratelimit import RateLimiter, LLM_STATS
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -18,32 +29,14 @@ TOKEN = os.getenv("TOKEN")
 if not TOKEN:
     raise RuntimeError("В .env файле нет TOKEN")
 
-bot = telebot.TeleBot(TOKEN)
+# Не чаще RATE_LIMITS на команду и RATE_LIMIT_USER на пользователя (см. ratelimit.py)
+rate_limiter = RateLimiter()
+bot = create_bot(TOKEN, rate_limiter=rate_limiter)
 
-# Загрузка заметок из файла
-def load_notes():
-    global notes, note_counter
-    try:
-        with open('notes.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            notes = data.get('notes', {})
-            # Конвертируем ключи обратно в int (json сохраняет как str)
-            notes = {int(k): v for k, v in notes.items()}
-            note_counter = data.get('counter', 1)
-    except FileNotFoundError:
-        notes = {}
-        note_counter = 1
-
-# Сохранение заметок в файл
-def save_notes():
-    with open('notes.json', 'w', encoding='utf-8') as f:
-        json.dump({
-            'notes': notes,
-            'counter': note_counter
-        }, f, ensure_ascii=False, indent=2)
-
-# Загружаем заметки при старте
-load_notes()
+# Запросы к LLM выполняются в своём пуле, а не в потоках-обработчиках TeleBot (см. llm_queue.py)
+llm_jobs = LLMJobQueue()
+
+# Заметки — в SQLite (db.py), у каждого пользователя свои; списки и поиск постраничные (см. note_pages.py)
 
 @bot.message_handler(commands=['start'])
 def start(message):
@@ -54,33 +47,30 @@ def help_cmd(message):
     help_text = """
 Доступные команды:
 /note_add <текст> - Добавить заметку
-/note_list - Показать все заметки
+/note_list [N] - Показать заметки (по N на странице)
 /note_find <запрос> - Найти заметку
 /note_edit <id> <новый текст> - Изменить заметку
 /note_del <id> - Удалить заметку
 /note_count - Показать количество заметок
+/note_import - Импорт заметок: строки ниже команды или файл с подписью /note_import
 """
     bot.reply_to(message, help_text)
 
 @bot.message_handler(commands=['note_add'])
 def note_add(message):
-    global note_counter
     text = message.text.replace('/note_add', '').strip()
     if not text:
         bot.reply_to(message, "Ошибка: Укажите текст заметки.")
         return
-    notes[note_counter] = text
-    save_notes()  # Сохраняем после добавления
-    bot.reply_to(message, f"Заметка #{note_counter} добавлена: {text}")
-    note_counter += 1
+    note_id = add_note(message.from_user.id, text)
+    bot.reply_to(message, f"Заметка #{note_id} добавлена: {text}")
 
 @bot.message_handler(commands=['note_list'])
 def note_list(message):
-    if not notes:
-        bot.reply_to(message, "Заметок пока нет.")
-        return
-    response = "Список заметок:\n" + "\n".join([f"{id}: {text}" for id, text in notes.items()])
-    bot.reply_to(message, response)
+    parts = message.text.split()
+    limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else note_pages.PAGE_SIZE
+    text, kb = note_pages.list_page(message.from_user.id, limit=limit)
+    bot.reply_to(message, text, reply_markup=kb)
 
 @bot.message_handler(commands=['note_find'])
 def note_find(message):
@@ -88,12 +78,29 @@ def note_find(message):
     if not query:
         bot.reply_to(message, "Ошибка: Укажите поисковый запрос.")
         return
-    found = {id: text for id, text in notes.items() if query in text}
-    if not found:
-        bot.reply_to(message, "Заметки не найдены.")
-        return
-    response = "Найденные заметки:\n" + "\n".join([f"{id}: {text}" for id, text in found.items()])
-    bot.reply_to(message, response)
+    text, kb = note_pages.find_page(message.from_user.id, query)
+    sent = bot.reply_to(message, text, reply_markup=kb)
+    if kb:
+        note_pages.remember_query(sent.chat.id, sent.message_id, query)
+
+@bot.callback_query_handler(func=lambda c: (c.data or "").startswith((note_pages.LIST + ":", note_pages.FIND + ":")))
+def note_page_nav(call):
+    kind, before_id, after_id, limit = note_pages.parse_cursor(call.data)
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+    if kind == note_pages.LIST:
+        text, kb = note_pages.list_page(call.from_user.id, before_id=before_id, after_id=after_id, limit=limit)
+    else:
+        query = note_pages.query_for(chat_id, message_id)
+        if query is None:
+            bot.answer_callback_query(call.id, "Поиск устарел, повторите /note_find")
+            return
+        text, kb = note_pages.find_page(call.from_user.id, query, before_id=before_id, after_id=after_id)
+    bot.answer_callback_query(call.id)
+    try:
+        bot.edit_message_text(text, chat_id, message_id, reply_markup=kb)
+    except telebot.apihelper.ApiTelegramException as e:
+        if "message is not modified" not in str(e):  # повторное нажатие на ту же страницу
+            raise
 
 @bot.message_handler(commands=['note_edit'])
 def note_edit(message):
@@ -107,11 +114,9 @@ def note_edit(message):
     except ValueError:
         bot.reply_to(message, "Ошибка: ID должен быть числом.")
         return
-    if note_id not in notes:
+    if not update_note(message.from_user.id, note_id, new_text):
         bot.reply_to(message, f"Ошибка: Заметка #{note_id} не найдена.")
         return
-    notes[note_id] = new_text
-    save_notes()  # Сохраняем после изменения
     bot.reply_to(message, f"Заметка #{note_id} изменена на: {new_text}")
 
 @bot.message_handler(commands=['note_del'])
@@ -125,16 +130,14 @@ def note_del(message):
     except ValueError:
         bot.reply_to(message, "Ошибка: ID должен быть числом.")
         return
-    if note_id not in notes:
+    if not delete_note(message.from_user.id, note_id):
         bot.reply_to(message, f"Ошибка: Заметка #{note_id} не найдена.")
         return
-    del notes[note_id]
-    save_notes()  # Сохраняем после удаления
     bot.reply_to(message, f"Заметка #{note_id} удалена.")
 
 @bot.message_handler(commands=['note_count'])
 def note_count(message):
-    count = len(notes)
+    count = count_notes(message.from_user.id)
     if count == 0:
         bot.reply_to(message, "У вас пока нет заметок.")
     elif count == 1:
@@ -146,53 +149,110 @@ def note_count(message):
        
 @bot.message_handler(commands=['note_export'])
 def note_export(message):
-    if not notes:
-        bot.reply_to(message, "Нет заметок для экспорта.")
+    try:
+        opts = parse_export_args(message.text.split()[1:])
+    except ValueError:
+        bot.reply_to(message, "Использование: /note_export [txt|jsonl|csv] [gz] [YYYY-MM-DD [YYYY-MM-DD]]\n"
+                              "Даты — период (UTC, включительно), например: /note_export csv gz 2024-01-01 2024-01-31")
         return
-    
-    # Создаем имя файла с временной меткой
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"notes_{timestamp}.txt"
-    
     try:
-        # Записываем заметки в файл
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(f"Экспорт заметок от {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Всего заметок: {len(notes)}\n")
-            f.write("=" * 50 + "\n\n")
-            
-            for note_id, text in sorted(notes.items()):
-                f.write(f"Заметка #{note_id}:\n")
-                f.write(f"{text}\n")
-                f.write("-" * 30 + "\n")
-        
-        # Отправляем файл пользователю
-        with open(filename, 'rb') as f:
-            bot.send_document(message.chat.id, f, caption="Ваши заметки экспортированы в файл.")
-        
-        # Удаляем временный файл
-        os.remove(filename)
-        
+        # Файл собирается в памяти (большой — во временном файле без имени), на диске ничего не остаётся
+        f, filename, count = export_notes(message.from_user.id, **opts)
+    except ExportTooLarge as e:
+        bot.reply_to(message, f"Ошибка при экспорте: {e}. Укажите период или добавьте gz.")
+        return
     except Exception as e:
         bot.reply_to(message, f"Ошибка при экспорте: {str(e)}")
+        return
+    with f:
+        if not count:
+            bot.reply_to(message, "Нет заметок для экспорта.")
+            return
+        bot.send_document(message.chat.id, f, visible_file_name=filename,
+                          caption="Ваши заметки экспортированы в файл.")
+
+IMPORT_PROGRESS_EVERY_S = 1.0   # прогресс большого импорта — не чаще раза в секунду (лимиты на edit)
+
+def _import_notes(message, texts):
+    status = bot.reply_to(message, "⏳ Импорт…")
+    last_edit = time.monotonic()
+
+    def progress(done, total):
+        nonlocal last_edit
+        if time.monotonic() - last_edit >= IMPORT_PROGRESS_EVERY_S:
+            last_edit = time.monotonic()
+            bot.edit_message_text(f"⏳ Импорт: {done} из {total}…", status.chat.id, status.message_id)
+
+    try:
+        stats = add_notes_bulk(message.from_user.id, texts, progress=progress)
+    except ValueError as e:
+        bot.edit_message_text(f"Ошибка импорта: {e}. Ничего не добавлено.", status.chat.id, status.message_id)
+        return
+    bot.edit_message_text(
+        f"Импортировано заметок: {stats['inserted']}.\n"
+        f"Пропущено: повторов — {stats['duplicates']}, пустых строк — {stats['empty']}.",
+        status.chat.id, status.message_id)
+
+@bot.message_handler(commands=['note_import'])
+def note_import(message):
+    parts = message.text.split("\n", 1)
+    if len(parts) < 2 or not parts[1].strip():
+        bot.reply_to(message, "Использование: /note_import, а ниже — заметки, по одной на строку.\n"
+                              "Или отправьте файл .txt, .jsonl, .csv (можно .gz) с подписью /note_import")
+        return
+    _import_notes(message, lines_from_text(parts[1]))
+
+@bot.message_handler(content_types=['document'], func=lambda m: (m.caption or "").startswith("/note_import"))
+def note_import_file(message):
+    doc = message.document
+    if doc.file_size and doc.file_size > IMPORT_MAX_BYTES:
+        bot.reply_to(message, f"Ошибка: файл больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ.")
+        return
+    data = bot.download_file(bot.get_file(doc.file_id).file_path)
+    try:
+        texts = texts_from_file(data, doc.file_name)
+    except ValueError as e:
+        bot.reply_to(message, f"Ошибка импорта: {e}.")
+        return
+    _import_notes(message, texts)
+
+NOTE_STATS_DEFAULT_DAYS = 7
+NOTE_STATS_MAX_DAYS = 366
+NOTE_STATS_DAILY_LINES = 31   # по дням показываем не больше месяца, дальше — только дни недели
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+def _bar(count, top, width=20):
+    return '█' * max(1, round(count * width / top)) if count else ''
 
 @bot.message_handler(commands=['note_stats'])
 def note_stats(message):
-    stats = {
-        'Пн': 5,
-        'Вт': 8, 
-        'Ср': 3,
-        'Чт': 12,
-        'Пт': 7,
-        'Сб': 2,
-        'Вс': 4
-    }
-    
-    response = "Активность по заметкам:\n"
-    for day, count in stats.items():
-        bar = '█' * count
-        response += f"{day}: {bar} {count}\n"
-    
+    parts = message.text.split()
+    days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else NOTE_STATS_DEFAULT_DAYS
+    days = min(max(days, 1), NOTE_STATS_MAX_DAYS)
+    per_day = dict(note_daily_counts(message.from_user.id, days))  # ≤ days строк из note_daily_stats
+    total = sum(per_day.values())
+    if not total:
+        bot.reply_to(message, f"За последние {days} дн. заметок нет.")
+        return
+
+    by_weekday = [0] * 7
+    for day, count in per_day.items():
+        by_weekday[date.fromisoformat(day).weekday()] += count
+
+    response = f"Активность по заметкам за {days} дн. (UTC), всего: {total}\n"
+    if days <= NOTE_STATS_DAILY_LINES:
+        today = datetime.utcnow().date()
+        top = max(per_day.values())
+        response += "\nПо дням:\n"
+        for i in range(days - 1, -1, -1):
+            day = today - timedelta(days=i)
+            count = per_day.get(day.isoformat(), 0)
+            response += f"{day:%d.%m} {WEEKDAYS[day.weekday()]}: {_bar(count, top)} {count}\n"
+    top = max(by_weekday)
+    response += "\nПо дням недели:\n"
+    for name, count in zip(WEEKDAYS, by_weekday):
+        response += f"{name}: {_bar(count, top)} {count}\n"
+
     bot.reply_to(message, response)
 
 @bot.message_handler(commands=["models"])
@@ -201,10 +261,18 @@ def cmd_models(message: types.Message) -> None:
     if not items:
         bot.reply_to(message, "Список моделей пуст.")
         return
+    health = router.health()
     lines = ["Доступные модели:"]
     for m in items:
         star = "★" if m["active"] else " "
         lines.append(f"{star} {m['id']}. {m['lable']}  [{m['key']}]")
+        h = health.get(m["key"])
+        if h and h["requests"]:
+            mark = "🔴" if h["cooldown_s"] or get_breaker(m["key"]).state != "closed" else (
+                "🟡" if h["error_rate"] > 0.2 else "🟢")
+            p50 = f"{h['p50_ms']:.0f}" if h["p50_ms"] is not None else "—"
+            p95 = f"{h['p95_ms']:.0f}" if h["p95_ms"] is not None else "—"
+            lines.append(f"    {mark} p50 {p50} мс, p95 {p95} мс, ошибок {h['error_rate']:.0%} из {h['requests']}")
     lines.append("\nАктивировать: /model <ID>")
     bot.reply_to(message, "\n".join(lines))
 
@@ -264,6 +332,44 @@ def cmd_character(message: types.Message) -> None:
     except ValueError:
         bot.reply_to(message, "Неизвестный ID персонажа. Сначала /characters.")
 
+@bot.message_handler(commands=["cache_stats"])
+def cmd_cache_stats(message: types.Message) -> None:
+    lines = ["Кэш реестра (попадания / промахи / размер):"]
+    for st in cache_stats():
+        lines.append(f"{st['name']}: {st['hits']} / {st['misses']} / {st['size']}/{st['maxsize']}")
+    st = llm_cache.stats()
+    lines.append(f"Кэш ответов LLM: {st['hits']} / {st['misses']}, мимо кэша: {st['bypass']}, вытеснено: {st['evicted']}")
+    fl = llm_cache.flights.stats()
+    lines.append(f"Склеено одинаковых запросов к LLM: {fl['coalesced']} (запросов к OpenRouter: {fl['leaders']})")
+    bot.reply_to(message, "\n".join(lines))
+
+@bot.message_handler(commands=["llm_stats"])
+def cmd_llm_stats(message: types.Message) -> None:
+    st = llm_jobs.stats()
+    lines = [
+        f"Очередь LLM: {st['depth']} (максимум {st['max_depth']}), выполняется {st['active']}/{st['workers']}",
+        f"Задач: {st['submitted']}, готово {st['done']}, ошибок {st['failed']}, отклонено {st['rejected']}",
+        f"Ожидание, мс: ср. {st['wait_ms_avg']:.0f}, p50 {st['wait_ms_p50']:.0f}, p99 {st['wait_ms_p99']:.0f}",
+        f"Выполнение, мс: ср. {st['run_ms_avg']:.0f}, p50 {st['run_ms_p50']:.0f}, p99 {st['run_ms_p99']:.0f}",
+        f"Ответов запасной моделью: {router.counters['fallbacks']}, "
+        f"дублирующих запросов: {router.counters['hedges']} (выиграли {router.counters['hedge_wins']})",
+        f"Повторов: {RETRY_STATS['retries']} (по Retry-After {RETRY_STATS['retry_after_honoured']}), "
+        f"сдались: {RETRY_STATS['gave_up']}, отклонено выключателем: {RETRY_STATS['short_circuited']}",
+        f"Общий лимит запросов к OpenRouter: выдано {LLM_STATS['acquired']} "
+        f"(из них после ожидания {LLM_STATS['waited']}), отклонено {LLM_STATS['rejected']}",
+    ]
+    for cb in breaker_stats():
+        if cb["state"] != "closed" or cb["transitions"]:
+            lines.append(f"⚡ {cb['name']}: {cb['state']}, ошибок подряд {cb['failures']}, "
+                         f"отклонено {cb['rejected']}, переходы {cb['transitions']}")
+    bot.reply_to(message, "\n".join(lines))
+
+@bot.message_handler(commands=["forget"])
+def cmd_forget(message: types.Message) -> None:
+    character = get_user_character(message.from_user.id)
+    n = clear_conversation(message.from_user.id, character["id"])
+    bot.reply_to(message, f"{character['name']} забыл(а) ваш разговор ({n} реплик).")
+
 @bot.message_handler(commands=["sofia"])
 def cmd_sofia(message: types.Message):
     text = "Привет! 😊 Я София — твой виртуальный помощник. Чем могу помочь?"
@@ -319,25 +425,44 @@ def cmd_ask_random(message: types.Message) -> None:
     chosen = random.choice(items)
     character = get_character_by_id(chosen["id"])
 
-    msgs = _build_messages_for_character(character, q)
+    uid = message.from_user.id
+    msgs = with_history(_build_messages_for_character(character, q), uid, character["id"])
     model_key = get_active_model()["key"]
 
     try:
-        text, ms = chat_once(
-            msgs, 
-            model=model_key, 
-            temperature=0.2, 
-            max_tokens=400
-        )
-        out = (text or "").strip()[:4000]
-        bot.reply_to(
-            message, 
-            text=f"{out}\n\n⏱ {ms} мс; 🧠 модель: {model_key}; 🎭 как: {character['name']}"
+        reply_queued(
+            bot, llm_jobs, message, msgs,
+            model=model_key,
+            footer=lambda latency: f"⏱ {latency}; 🧠 модель: {model_key}; 🎭 как: {character['name']}",
+            temperature=0.2,
+            max_tokens=400,
+            on_answer=lambda answer: remember(uid, character["id"], q, answer)
         )
+    except Exception:
+        bot.reply_to(message, text="Непредвиденная ошибка.")
 
-    except OpenRouterError as e:
-        bot.reply_to(message, text=f"Ошибка: {e}")
+@bot.message_handler(commands=["ask"])
+def cmd_ask(message: types.Message) -> None:
+    q = message.text.replace("/ask", "", 1).strip()
+    if not q:
+        bot.reply_to(message, text="Использование: /ask <вопрос>")
+        return
+
+    q = q[:600]
+    uid = message.from_user.id
+    character_id = get_user_character(uid)["id"]
+    msgs = with_history(_build_message(uid, q), uid, character_id)
+    model = get_active_model()
 
+    try:
+        reply_queued(
+            bot, llm_jobs, message, msgs,
+            model=model["key"],
+            footer=lambda latency: f"⏱ {latency}; 🧠 модель: {model['lable']}",
+            temperature=0.2,
+            max_tokens=400,
+            on_answer=lambda answer: remember(uid, character_id, q, answer)
+        )
     except Exception:
         bot.reply_to(message, text="Непредвиденная ошибка.")
 
@@ -351,6 +476,7 @@ def _setup_bot_commands() -> None:
         types.BotCommand(command="note_del", description="Удалить заметку"),
         types.BotCommand(command="note_count", description="Сколько заметок"),
         types.BotCommand(command="note_export", description="Экспорт заметок в .txt"),
+        types.BotCommand(command="note_import", description="Импорт заметок из текста или файла"),
         types.BotCommand(command="note_stats", description="Статистика по датам"),
         types.BotCommand(command="model", description="Установить активную модель"),
         types.BotCommand(command="models", description="Получить список моделей"),
@@ -360,6 +486,7 @@ def _setup_bot_commands() -> None:
         types.BotCommand(command="character", description="Установить активного персонажа"),
         types.BotCommand(command="characters", description="Получить список персонажей"),
         types.BotCommand(command="whoami", description="Получить активную модель и активного персонажа"),
+        types.BotCommand(command="forget", description="Очистить историю разговора с персонажем"),
         types.BotCommand(command="sofia", description="Поговорить с персонажем София"),
     ]
 
@@ -376,7 +503,8 @@ def cmd_start(message: types.Message) -> None:
         "/note_edit <id> <текст>\n"
         "/note_del <id>\n"
         "/note_count\n"
-        "/note_export\n"
+        "/note_export [txt|jsonl|csv] [gz] [с] [по]\n"
+        "/note_import (строки ниже или файл)\n"
         "/note_stats [days]\n"
         "/models\n"
         "/model <id>\n"
@@ -386,6 +514,7 @@ def cmd_start(message: types.Message) -> None:
         "/characters\n"
         "/character <id>\n"
         "/whoami\n"
+        "/forget\n"
     )
     bot.reply_to(message, text)
 
@@ -435,28 +564,42 @@ def cmd_ask_model(message: types.Message) -> None:
         # Используем выбранную модель
         model_key = target_model["key"]
         
-        text, ms = chat_once(
-            messages, 
-            model=model_key, 
-            temperature=0.2, 
-            max_tokens=400
-        )
-        
         # Получаем текущую активную модель для проверки
         current_model = get_active_model()
         
-        out = (text or "").strip()[:4000]
-        bot.reply_to(
-            message, 
-            text=f"{out}\n\n⏱ {ms} мс\n🧠 использована модель: {target_model['lable']}\n⭐ активная модель: {current_model['lable']}"
+        reply_queued(
+            bot, llm_jobs, message, messages,
+            model=model_key,
+            footer=lambda latency: f"⏱ {latency}\n🧠 использована модель: {target_model['lable']}\n⭐ активная модель: {current_model['lable']}",
+            temperature=0.2,
+            max_tokens=400,
+            fallback=False  # пользователь выбрал модель явно
         )
 
     except OpenRouterError as e:
         bot.reply_to(message, text=f"Ошибка: {e}")
     except Exception as e:
         bot.reply_to(message, text=f"Ошибка: {str(e)}")
-if __name__ == "__main__":
+def startup(primary: bool = True, workers: int = 1) -> None:
+    """
+    Подготовка перед приёмом апдейтов. Под supervisor.py вызывается в каждом процессе;
+    фоновая чистка истории и меню команд нужны один раз — только в primary.
+    """
     init_db()
-    _setup_bot_commands()
+    if primary:
+        migrate_on_startup()    # заметки старого notes.json — владельцу (см. migrate_notes_json.py)
+        HistoryPruner().start()
+        _setup_bot_commands()
+
+
+def shutdown() -> None:
+    """Мягкая остановка (supervisor.py): дождаться начатых ответов LLM, сохранить лимиты."""
+    llm_jobs.drain(timeout=30)
+    rate_limiter.flush()
+
+
+if __name__ == "__main__":
+    startup()
     print("Бот запускается...")
-    bot.infinity_polling(skip_pending=True)
\ No newline at end of file
+    run_bot(bot)  # polling или webhook (BOT_MODE)
+
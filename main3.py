@@ -12,37 +12,32 @@ main.py — DailyZodiakBot (развлекательный контент без
   /signs                  — показать список знаков
 
 Рассылка:
-  - фоновый поток проверяет раз в минуту: кому отправить сейчас;
-  - условие: subscribed=1, notify_hour == now.hour, last_sent_date != today.
+  - фоновый поток (scheduler.DailyScheduler) спит ровно до ближайшего часа, где есть
+    кому отправить; /set_time, /set_sign, /subscribe, /unsubscribe будят его досрочно;
+  - условие: subscribed=1, notify_hour == now.hour, last_sent_date != today;
+  - отправка через broadcast.Broadcaster: пул потоков, ~30 сообщений/с, пачки отметок в БД.
 """
 
 from __future__ import annotations
 import logging
 import threading
-import time
-import hashlib
 from datetime import datetime, date
 
-import telebot
 from telebot import types
 
 import db2 as db
+from broadcast import Broadcaster
+from horoscope import CANON_SIGNS, SIGN_EMOJI, daily_text, precompute
+from scheduler import DailyScheduler
+from runner import create_bot, run_bot
 from config2 import TOKEN, DEFAULT_NOTIFY_HOUR
 
 log = logging.getLogger(__name__)
 
-bot = telebot.TeleBot(TOKEN)
+bot = create_bot(TOKEN)
 db.init_db()  # создаём схемы, если их нет
 
-# ---------- справочник знаков: канон, синонимы, эмодзи ----------
-CANON_SIGNS = [
-    "овен", "телец", "близнецы", "рак", "лев", "дева",
-    "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"
-]
-SIGN_EMOJI = {
-    "овен":"♈", "телец":"♉", "близнецы":"♊", "рак":"♋", "лев":"♌", "дева":"♍",
-    "весы":"♎", "скорпион":"♏", "стрелец":"♐", "козерог":"♑", "водолей":"♒", "рыбы":"♓"
-}
+# ---------- справочник знаков: синонимы (канон и эмодзи — в horoscope.py) ----------
 # Примитивные англ. синонимы — чтобы не спотыкались:
 SIGN_ALIASES = {
     "aries":"овен", "taurus":"телец", "gemini":"близнецы", "cancer":"рак", "leo":"лев", "virgo":"дева",
@@ -72,51 +67,6 @@ def sign_keyboard() -> types.ReplyKeyboardMarkup:
 # Используем ReplyKeyboard для быстрого выбора (паттерн из занятий по кнопкам) [oai_citation:7‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq)
 
 
-# ---------- генерация «гороскопа» без API (детерминированно на (sign, date)) ----------
-INTRO = [
-    "Сегодня вас ждёт", "День сулит", "Утро принесёт", "В первой половине дня вероятно",
-    "Хорошее время для", "Подходящий момент для"
-]
-FOCUS = ["работы", "личных дел", "общения", "обучения", "творчества", "маленьких поездок"]
-ADVICE = [
-    "действуйте спокойно и без спешки", "обратите внимание на детали", "держите курс и не отвлекайтесь",
-    "не спорьте из принципа", "подумайте о пользе привычек", "не бойтесь попросить помощи"
-]
-LUCK = [
-    "удача на вашей стороне", "окружающие настроены дружелюбно", "случай поможет тем, кто готов",
-    "небольшой риск себя оправдает", "поддержка придёт вовремя", "день подойдёт для новых начал"
-]
-COLOR = ["синий", "зелёный", "жёлтый", "красный", "фиолетовый", "белый", "оранжевый"]
-NUMBER = [3, 4, 5, 6, 7, 8, 9]
-
-def _pick(seq: list, seed: bytes, salt: str) -> str:
-    h = hashlib.md5(seed + salt.encode("utf-8")).hexdigest()
-    idx = int(h, 16) % len(seq)
-    return str(seq[idx])
-
-def make_daily_text(sign: str, for_date: date) -> str:
-    """
-    Генерирует 3–4 коротких фразы и пару «фишек» (цвет, число).
-    Детерминированно для (sign, date) — без внешних API.
-    """
-    iso = for_date.isoformat().encode("utf-8")
-    sgn = sign.encode("utf-8")
-    intro = _pick(INTRO, sgn+iso, ":intro")
-    focus = _pick(FOCUS, sgn+iso, ":focus")
-    advice = _pick(ADVICE, sgn+iso, ":advice")
-    luck = _pick(LUCK, sgn+iso, ":luck")
-    color = _pick(COLOR, sgn+iso, ":color")
-    number = _pick(NUMBER, sgn+iso, ":num")
-
-    emoji = SIGN_EMOJI.get(sign, "")
-    return (
-        f"{emoji} *{sign.capitalize()}* — {for_date.strftime('%Y-%m-%d')}\n"
-        f"{intro} акцент на *{focus}*; {luck}. Советы: {advice}.\n\n"
-        f"Счастливый цвет: *{color}*, число дня: *{number}*.\n"
-        f"_Развлекательный контент._"
-    )
-
-
 # ---------- вспомогательные утилиты ----------
 def user_mention(m: types.Message) -> str:
     u = m.from_user
@@ -166,6 +116,7 @@ def cmd_set_sign(message: types.Message) -> None:
         return
     db.ensure_user(message.from_user.id)
     db.set_sign(message.from_user.id, s)
+    scheduler.wake()
     bot.reply_to(message, f"Знак сохранён: {SIGN_EMOJI[s]} {s.capitalize()}")
 
 
@@ -178,6 +129,7 @@ def cmd_set_time(message: types.Message) -> None:
         return
     db.ensure_user(message.from_user.id)
     db.set_notify_hour(message.from_user.id, hour)
+    scheduler.wake()
     bot.reply_to(message, f"Час отправки сохранён: {hour}:00")
 
 
@@ -185,6 +137,7 @@ def cmd_set_time(message: types.Message) -> None:
 def cmd_subscribe(message: types.Message) -> None:
     db.ensure_user(message.from_user.id)
     db.set_subscribed(message.from_user.id, True)
+    scheduler.wake()
     bot.reply_to(message, "Подписка включена. Я пришлю сообщение в заданный час.")
 
 
@@ -192,6 +145,7 @@ def cmd_subscribe(message: types.Message) -> None:
 def cmd_unsubscribe(message: types.Message) -> None:
     db.ensure_user(message.from_user.id)
     db.set_subscribed(message.from_user.id, False)
+    scheduler.wake()
     bot.reply_to(message, "Подписка выключена.")
 
 
@@ -217,7 +171,7 @@ def cmd_today(message: types.Message) -> None:
     if not row or not row["sign"]:
         bot.reply_to(message, "Сначала /set_sign <знак>.")
         return
-    txt = make_daily_text(row["sign"], date.today())
+    txt = daily_text(row["sign"], date.today())
     bot.send_message(message.chat.id, txt, parse_mode="Markdown")
 
 
@@ -227,30 +181,65 @@ def kb_pick_sign(message: types.Message) -> None:
     s = (message.text or "").strip().lower()
     db.ensure_user(message.from_user.id)
     db.set_sign(message.from_user.id, s)
+    scheduler.wake()
     bot.reply_to(message, f"Знак сохранён: {SIGN_EMOJI[s]} {s.capitalize()}")
 
 
 # ---------- планировщик ежедневной отправки ----------
-def scheduler_loop() -> None:
-    log.info("Scheduler started")
-    while True:
-        now = datetime.now()               # время сервера
-        today_str = now.strftime("%Y-%m-%d")
-        hour = now.hour
+# Доставлено, но отметка в БД не записалась (Broadcaster.unmarked): {дата: {user_id: час}}.
+# Пока отметка не запишется, этим пользователям повторно не шлём.
+_unmarked: dict[str, dict[int, int]] = {}
+
+
+def _retry_unmarked(today_str: str) -> dict[int, int]:
+    for day in [d for d in _unmarked if d != today_str]:
+        del _unmarked[day]
+    pending = _unmarked.setdefault(today_str, {})
+    if pending:
         try:
-            due = db.list_due_users(today_str, hour)
-            for u in due:
-                # Сгенерировать текст и отправить:
-                txt = make_daily_text(u["sign"], now.date())
-                try:
-                    bot.send_message(u["user_id"], txt, parse_mode="Markdown")
-                except Exception as e:
-                    log.warning("Send failed to %s: %r", u["user_id"], e)
-                # Отметить отправку за сегодня:
-                db.mark_sent_today(u["user_id"], today_str)
+            db.mark_sent_many(sorted(pending), today_str)
+            pending.clear()
         except Exception as e:
-            log.exception("Scheduler error: %r", e)
-        time.sleep(60)  # проверяем раз в минуту
+            log.warning("Still cannot mark %d delivered users: %r", len(pending), e)
+    return pending
+
+
+def send_due(now: datetime) -> None:
+    """Рассылка всем, у кого notify_hour == now.hour и сегодня ещё не отправляли."""
+    today_str = now.strftime("%Y-%m-%d")
+    hour = now.hour
+    unmarked = _retry_unmarked(today_str)
+    broadcaster = Broadcaster(
+        lambda user_id, txt: bot.send_message(user_id, txt, parse_mode="Markdown"),
+        # отметить отправку за сегодня — пачками, одной транзакцией на пачку
+        on_done=lambda user_ids: db.mark_sent_many(user_ids, today_str),
+    )
+    # 12 текстов на дату считаются один раз, дальше — поиск в таблице
+    precompute(now.date(), days_ahead=1)
+    jobs = ((u["user_id"], daily_text(u["sign"], now.date()))
+            for u in db.iter_due_users(today_str, hour) if u["user_id"] not in unmarked)
+    stats = broadcaster.run(jobs)
+    unmarked.update(dict.fromkeys(broadcaster.unmarked, hour))
+    if stats.sent or stats.failed or stats.gave_up:
+        log.info("Broadcast %s %02d:00: sent=%d failed=%d retried=%d gave_up=%d unmarked=%d (%.1f msg/s)",
+                 today_str, hour, stats.sent, stats.failed, stats.retried, stats.gave_up, stats.unmarked,
+                 stats.per_sec)
+
+
+def due_by_hour(today_str: str) -> dict[int, int]:
+    """db.schedule_by_hour без тех, кому уже доставлено (иначе планировщик повторял бы час весь час)."""
+    counts = db.schedule_by_hour(today_str)
+    for hour in _unmarked.get(today_str, {}).values():
+        if counts.get(hour):
+            counts[hour] -= 1
+    return counts
+
+
+scheduler = DailyScheduler(schedule=due_by_hour, run_hour=send_due)
+
+
+def scheduler_loop() -> None:
+    scheduler.run_forever()
 
 
 def start_scheduler() -> None:
@@ -273,8 +262,21 @@ def setup_bot_commands() -> None:
     bot.set_my_commands(cmds)
 
 
-# ---------- точка входа ----------
-if __name__ == "__main__":
+def startup(primary: bool = True, workers: int = 1) -> None:
+    """
+    Меню команд и планировщик рассылки — один на всех (supervisor.py запускает их
+    только в primary). /set_time и т.п. в других процессах будят лишь свой, не
+    запущенный, планировщик, поэтому primary перечитывает расписание раз в минуту.
+    """
+    if not primary:
+        return
     setup_bot_commands()        # удобство для пользователей [oai_citation:8‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq)
+    if workers > 1:
+        scheduler.max_sleep_s = 60.0
     start_scheduler()           # запускаем фоновую проверку
-    bot.infinity_polling(skip_pending=True)  # запуск long polling (паттерн Л2/Л3) [oai_citation:9‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq) [oai_citation:10‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
+
+
+# ---------- точка входа ----------
+if __name__ == "__main__":
+    startup()
+    run_bot(bot)  # запуск long polling (паттерн Л2/Л3) или webhook, см. BOT_MODE [oai_citation:9‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq) [oai_citation:10‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
@@ -0,0 +1,276 @@
+"""
+metrics.py — метрики ботов в формате Prometheus и учёт времени обработчиков.
+
+  - HandlerMetricsMiddleware (class middleware TeleBot): на каждую команду —
+    гистограмма задержки, ошибки, сколько сейчас выполняется;
+  - track("db" | "telegram" | "openrouter"): время внешних вызовов. Его вызывают
+    sqlite_pool (каждый execute), http_pool (запросы к OpenRouter) и отправитель
+    запросов к Bot API (install_telegram_timing). Время, набежавшее внутри
+    обработчика, дополнительно раскладывается по команде: видно, сколько из
+    задержки /note_find — база, а сколько — ответ в Telegram;
+  - render() — текст для GET /metrics, serve_metrics() — HTTP-сервер на METRICS_PORT;
+  - summary() — сводка для команды /stats.
+"""
+
+from __future__ import annotations
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Tuple
+
+from telebot import apihelper
+from telebot.handler_backends import BaseMiddleware
+
+log = logging.getLogger(__name__)
+
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))   # 0 — HTTP-эндпоинт выключен
+MAX_COMMAND_LABELS = 100                              # чтобы /любой_мусор не раздувал метрики
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEPENDENCIES = ("db", "telegram", "openrouter")
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}   # labels -> [counts по бакетам + inf, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def snapshot(self) -> Dict[tuple, Tuple[List[int], float, int]]:
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+
+    def quantile(self, q: float, *label_values: str) -> float | None:
+        """Оценка квантиля по бакетам (верхняя граница бакета, как histogram_quantile без интерполяции)."""
+        with self._lock:
+            s = self._series.get(label_values)
+            if not s or not s[2]:
+                return None
+            need, seen = q * s[2], 0
+            for i, n in enumerate(s[0]):
+                seen += n
+                if seen >= need:
+                    return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return None
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            base = ",".join(f'{l}="{v}"' for l, v in zip(self.labels, key))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                out.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            out.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            out.append(f"{self.name}_count{{{base}}} {count}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], kind: str = "counter") -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.kind = kind
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + value
+
+    def get(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0.0)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            base = ",".join(f'{l}="{val}"' for l, val in zip(self.labels, key))
+            out.append(f"{self.name}{{{base}}} {v:g}" if base else f"{self.name} {v:g}")
+        return out
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки апдейта", ("command",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("command",))
+HANDLER_IN_FLIGHT = Counter("bot_handler_in_flight", "Обработчики, выполняющиеся сейчас", ("command",), kind="gauge")
+HANDLER_DEPENDENCY = Counter("bot_handler_dependency_seconds_total",
+                             "Время внешних вызовов внутри обработчиков", ("command", "dependency"))
+DEPENDENCY_SECONDS = Histogram("bot_dependency_seconds", "Время одного внешнего вызова", ("dependency",))
+TELEGRAM_SECONDS = Histogram("telegram_api_seconds", "Запросы к Bot API по методам", ("method",))
+
+REGISTRY = [HANDLER_SECONDS, HANDLER_ERRORS, HANDLER_IN_FLIGHT, HANDLER_DEPENDENCY,
+            DEPENDENCY_SECONDS, TELEGRAM_SECONDS]
+
+_local = threading.local()      # _local.spent: {dependency: секунды} текущего обработчика
+_labels: set[str] = set()
+_labels_lock = threading.Lock()
+
+
+def record(dependency: str, seconds: float) -> None:
+    DEPENDENCY_SECONDS.observe(seconds, dependency)
+    spent = getattr(_local, "spent", None)
+    if spent is not None:
+        spent[dependency] = spent.get(dependency, 0.0) + seconds
+
+
+@contextmanager
+def track(dependency: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(dependency, time.perf_counter() - t0)
+
+
+def _command_of(update_type: str, obj) -> str:
+    if update_type == "callback_query":
+        label = "callback:" + (obj.data or "").split(":", 1)[0]
+    else:
+        text = getattr(obj, "text", None) or ""
+        label = text.split(maxsplit=1)[0].split("@", 1)[0] if text.startswith("/") else update_type
+    label = label[:32]
+    with _labels_lock:
+        if label not in _labels:
+            if len(_labels) >= MAX_COMMAND_LABELS:
+                return "other"
+            _labels.add(label)
+    return label
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    update_sensitive = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.update_types = ["message", "edited_message", "callback_query"]
+
+    def _pre(self, update_type: str, obj, data) -> None:
+        command = _command_of(update_type, obj)
+        data["_metrics"] = (command, time.perf_counter())
+        HANDLER_IN_FLIGHT.inc(1, command)
+        _local.spent = {}
+
+    def _post(self, obj, data, exception) -> None:
+        command, t0 = data.pop("_metrics")
+        HANDLER_SECONDS.observe(time.perf_counter() - t0, command)
+        HANDLER_IN_FLIGHT.inc(-1, command)
+        if exception is not None:
+            HANDLER_ERRORS.inc(1, command)
+        for dependency, dt in (getattr(_local, "spent", None) or {}).items():
+            HANDLER_DEPENDENCY.inc(dt, command, dependency)
+        _local.spent = None
+
+    def pre_process_message(self, message, data) -> None:
+        self._pre("message", message, data)
+
+    def post_process_message(self, message, data, exception) -> None:
+        self._post(message, data, exception)
+
+    def pre_process_edited_message(self, message, data) -> None:
+        self._pre("edited_message", message, data)
+
+    def post_process_edited_message(self, message, data, exception) -> None:
+        self._post(message, data, exception)
+
+    def pre_process_callback_query(self, call, data) -> None:
+        self._pre("callback_query", call, data)
+
+    def post_process_callback_query(self, call, data, exception) -> None:
+        self._post(call, data, exception)
+
+
+def install_telegram_timing() -> None:
+    """Все запросы TeleBot к Bot API идут через сессию apihelper, но с замером времени."""
+    if apihelper.CUSTOM_REQUEST_SENDER is not None:
+        return
+
+    def timed_sender(method, url, **kwargs):
+        with track("telegram"):
+            t0 = time.perf_counter()
+            try:
+                return apihelper._get_req_session().request(method, url, **kwargs)
+            finally:
+                TELEGRAM_SECONDS.observe(time.perf_counter() - t0, url.rsplit("/", 1)[-1])
+
+    apihelper.CUSTOM_REQUEST_SENDER = timed_sender
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> List[dict]:
+    """По каждой команде: вызовы, ошибки, p50/p95 и среднее время в зависимостях."""
+    rows = []
+    for (command,), (_, total, count) in sorted(HANDLER_SECONDS.snapshot().items()):
+        rows.append({
+            "command": command,
+            "count": count,
+            "errors": int(HANDLER_ERRORS.get(command)),
+            "in_flight": int(HANDLER_IN_FLIGHT.get(command)),
+            "avg_ms": total / count * 1000,
+            "p50_ms": (HANDLER_SECONDS.quantile(0.5, command) or 0) * 1000,
+            "p95_ms": (HANDLER_SECONDS.quantile(0.95, command) or 0) * 1000,
+            **{f"{d}_ms": HANDLER_DEPENDENCY.get(command, d) / count * 1000 for d in DEPENDENCIES},
+        })
+    return rows
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(host: str = METRICS_LISTEN, port: int = METRICS_PORT) -> ThreadingHTTPServer | None:
+    """Поднимает GET /metrics в фоновом потоке. port=0 — не поднимать."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        log.warning("Metrics endpoint %s:%d не поднят: %r", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Metrics: http://%s:%d/metrics", host, port)
+    return server
+
+
+__all__ = ["track", "record", "HandlerMetricsMiddleware", "install_telegram_timing", "render", "summary",
+           "serve_metrics", "Histogram", "Counter"]
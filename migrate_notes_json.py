@@ -0,0 +1,109 @@
+"""
+migrate_notes_json.py — перенос старого хранилища заметок main2.py
+(notes.json + журнал notes.json.log, см. note_journal.py) в SQLite (таблица notes).
+
+Старые заметки были общими, без владельца, поэтому пользователь, которому они
+достанутся, задаётся явно. Вставка — db.add_notes_bulk (executemany пачками,
+повторы и уже перенесённые тексты пропускаются). Перенос записывается в
+legacy_note_imports, поэтому второй раз он не выполняется и удалённые после
+переноса заметки не возвращаются. Исходные файлы не изменяются.
+
+main2.startup() переносит notes.json сам, если известен владелец: NOTES_JSON_OWNER_ID
+или единственный id в ADMIN_IDS. Иначе пишет в лог, сколько заметок ждут переноса.
+Вручную:
+
+    python migrate_notes_json.py --user-id 123456789 [--path notes.json] [--db bot.db] [--keep-duplicates] [--force]
+"""
+
+from __future__ import annotations
+import argparse
+import logging
+import os
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+NOTES_JSON_PATH = os.getenv("NOTES_JSON_PATH", "notes.json")
+
+
+def _owner_from_env() -> int | None:
+    owner = os.getenv("NOTES_JSON_OWNER_ID", "").strip()
+    if owner:
+        return int(owner)
+    admins = [x for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x]
+    return int(admins[0]) if len(admins) == 1 else None
+
+
+def has_legacy_notes(path: str) -> bool:
+    return os.path.exists(path) or os.path.exists(path + ".log")
+
+
+def migrate(path: str, user_id: int, *, dedupe: bool = True, progress=None) -> dict:
+    """Переносит заметки из path пользователю user_id и отмечает перенос. -> статистика add_notes_bulk."""
+    import db
+    from note_journal import read_notes
+
+    notes = read_notes(path)
+    stats = db.add_notes_bulk(user_id, [text for _, text in sorted(notes.items())],
+                              dedupe=dedupe, progress=progress)
+    db.record_legacy_import(os.path.abspath(path), user_id, stats["inserted"])
+    return stats
+
+
+def migrate_on_startup(path: str = NOTES_JSON_PATH, owner_id: int | None = None) -> dict | None:
+    """
+    Для main2.startup(): перенести notes.json, если он есть и ещё не перенесён.
+    Без владельца ничего не делает (заметки нельзя отдать наугад), только пишет в лог.
+    """
+    import db
+
+    if not has_legacy_notes(path) or db.get_legacy_import(os.path.abspath(path)):
+        return None
+    owner_id = owner_id if owner_id is not None else _owner_from_env()
+    if owner_id is None:
+        log.warning("%s ещё не перенесён в SQLite: задайте NOTES_JSON_OWNER_ID или запустите "
+                    "python migrate_notes_json.py --user-id <id>", path)
+        return None
+    stats = migrate(path, owner_id)
+    log.info("Notes from %s migrated to user %s: %s", path, owner_id, stats)
+    return stats
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Перенос notes.json в SQLite")
+    ap.add_argument("--user-id", type=int, required=True, help="Telegram id владельца заметок")
+    ap.add_argument("--path", default=NOTES_JSON_PATH, help="снапшот notes.json (журнал рядом, <path>.log)")
+    ap.add_argument("--db", default=None, help="файл БД (по умолчанию DB_PATH или bot.db)")
+    ap.add_argument("--keep-duplicates", action="store_true", help="не пропускать одинаковые тексты")
+    ap.add_argument("--force", action="store_true", help="переносить, даже если перенос уже был")
+    args = ap.parse_args()
+
+    if args.db:
+        os.environ["DB_PATH"] = args.db
+    import db
+
+    if not has_legacy_notes(args.path):
+        print(f"Нет ни {args.path}, ни {args.path}.log — переносить нечего.", file=sys.stderr)
+        return 1
+    db.init_db()
+    done = db.get_legacy_import(os.path.abspath(args.path))
+    if done and not args.force:
+        print(f"{args.path} уже перенесён пользователю {done['user_id']} ({done['inserted']} заметок). "
+              f"Повторить: --force", file=sys.stderr)
+        return 1
+    t0 = time.perf_counter()
+
+    def progress(done, total):
+        print(f"\r  {done}/{total or '?'}", end="", flush=True)
+
+    stats = migrate(args.path, args.user_id, dedupe=not args.keep_duplicates, progress=progress)
+    elapsed = time.perf_counter() - t0
+    print(f"\nЗаметок в {args.path}: {stats['received']}. Перенесено: {stats['inserted']}, "
+          f"пропущено повторов: {stats['duplicates']}, пустых: {stats['empty']} за {elapsed:.2f} с "
+          f"({stats['inserted'] / max(elapsed, 1e-9):.0f} заметок/с)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+model_router.py — выбор модели OpenRouter по задержке и ошибкам.
+
+Было: каждый вопрос уходил только в активную модель (models.active = 1), и 429/5xx
+от неё сразу превращались в ошибку для пользователя через _friendly().
+
+Стало: по каждому ключу модели держится скользящее окно последних ROUTER_WINDOW
+запросов (задержка, успех), из него — p50/p95 и доля ошибок.
+  - fallback: при повторяемой ошибке (429, 5xx, таймаут) запрос уходит в следующую
+    по качеству модель из таблицы models; 4xx вроде 401/404 сразу отдаются наверх;
+  - после такой ошибки модель на ROUTER_COOLDOWN_S уходит в конец списка;
+  - hedging (только chat(), не стрим): если ответа нет дольше p95 модели
+    (не меньше ROUTER_HEDGE_MIN_MS), параллельно отправляется запрос в следующую
+    модель, и берётся первый успешный ответ;
+  - health() — сводка для /models.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Tuple
+
+from ai_client import ChatStream, OpenRouterError, RateLimitedError, chat_once, chat_stream
+from db import list_models
+
+log = logging.getLogger(__name__)
+
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+ROUTER_COOLDOWN_S = float(os.getenv("ROUTER_COOLDOWN_S", "30"))
+ROUTER_HEDGE = os.getenv("ROUTER_HEDGE", "1") == "1"
+ROUTER_HEDGE_MIN_MS = float(os.getenv("ROUTER_HEDGE_MIN_MS", "1500"))
+# Оценка задержки модели, по которой ещё нет статистики
+DEFAULT_LATENCY_MS = 3000.0
+
+RETRYABLE = {429, 500, 502, 503, 504}
+
+
+def is_retryable(e: OpenRouterError) -> bool:
+    # RateLimitedError — наш общий лимит, а не ответ модели: другая модель его не обойдёт
+    return e.status in RETRYABLE and not isinstance(e, RateLimitedError)
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))]
+
+
+class ModelStats:
+    """Скользящее окно последних запросов к одной модели."""
+
+    def __init__(self, window: int = ROUTER_WINDOW) -> None:
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.cooldown_until = 0.0
+        self.last_error: str | None = None
+        self.total = 0
+
+    def record(self, ms: float, ok: bool) -> None:
+        self.samples.append((ms, ok))
+        self.total += 1
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency(self, p: float) -> float | None:
+        ok = [ms for ms, good in self.samples if good]
+        return _percentile(ok, p) if ok else None
+
+    def score(self) -> float:
+        """Меньше — лучше: типичная задержка, штрафованная за ошибки."""
+        return (self.latency(0.5) or DEFAULT_LATENCY_MS) * (1 + 4 * self.error_rate)
+
+
+class ModelRouter:
+    def __init__(self, candidates: Callable[[], List[str]], *,
+                 hedge: bool = ROUTER_HEDGE,
+                 hedge_min_ms: float = ROUTER_HEDGE_MIN_MS) -> None:
+        """candidates() — ключи всех доступных моделей (обычно из таблицы models)."""
+        self.candidates = candidates
+        self.hedge = hedge
+        self.hedge_min_ms = hedge_min_ms
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="router-hedge")
+        self.counters = {"fallbacks": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _st(self, key: str) -> ModelStats:
+        st = self._stats.get(key)
+        if st is None:
+            st = self._stats[key] = ModelStats()
+        return st
+
+    def record(self, key: str, ms: float, error: OpenRouterError | None = None) -> None:
+        if isinstance(error, RateLimitedError):
+            return  # запроса к модели не было — её статистика ни при чём
+        with self._lock:
+            st = self._st(key)
+            st.record(ms, error is None)
+            if error is not None:
+                st.last_error = str(error)
+                if is_retryable(error):
+                    st.cooldown_until = time.monotonic() + ROUTER_COOLDOWN_S
+
+    def ranked(self, preferred: str) -> List[str]:
+        """preferred первым (если не на паузе), затем остальные по score; модели на паузе — в конце."""
+        keys = list(dict.fromkeys([preferred, *self.candidates()]))
+        now = time.monotonic()
+        with self._lock:
+            def order(key: str) -> tuple:
+                st = self._st(key)
+                cooling = st.cooldown_until > now
+                return (cooling, key != preferred, st.score())
+            return sorted(keys, key=order)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _timed(self, key: str, messages: List[Dict], kwargs: dict, attempts: int | None) -> Tuple[str, int, str]:
+        t0 = time.perf_counter()
+        try:
+            text, dt_ms = chat_once(messages, model=key, attempts=attempts, **kwargs)
+        except OpenRouterError as e:
+            self.record(key, (time.perf_counter() - t0) * 1000, e)
+            raise
+        self.record(key, dt_ms)
+        return text, dt_ms, key
+
+    @staticmethod
+    def _attempts(order: List[str], i: int) -> int | None:
+        """Пока есть запасные модели, не повторяем запрос к упавшей — сразу переключаемся."""
+        return 1 if i + 1 < len(order) else None
+
+    def _hedge_deadline_s(self, key: str) -> float:
+        with self._lock:
+            st = self._st(key)
+            p95 = st.latency(0.95) if len(st.samples) >= ROUTER_MIN_SAMPLES else None
+        return max(self.hedge_min_ms, p95 or 0.0) / 1000
+
+    def chat(self, messages: List[Dict], *, preferred: str, **kwargs) -> Tuple[str, int, str]:
+        """
+        Как chat_once, но с fallback и hedging. Возвращает (text, dt_ms, model_key),
+        где model_key — модель, чей ответ получен. Если упали все — последняя ошибка.
+        """
+        order = self.ranked(preferred)
+        t0 = time.perf_counter()
+        last: OpenRouterError | None = None
+        i = 0
+        while i < len(order):
+            primary = order[i]
+            backup = order[i + 1] if self.hedge and i + 1 < len(order) else None
+            futures = {self._pool.submit(self._timed, primary, messages, kwargs, self._attempts(order, i))}
+            done, _ = wait(futures, timeout=self._hedge_deadline_s(primary) if backup else None)
+            if not done and backup:
+                self._count("hedges")
+                log.info("Router: %s is slow, hedging with %s", primary, backup)
+                i += 1
+                futures.add(self._pool.submit(self._timed, backup, messages, kwargs, self._attempts(order, i)))
+            pending = futures
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    try:
+                        text, _, key = f.result()
+                    except OpenRouterError as e:
+                        last = e
+                        if not is_retryable(e):
+                            raise
+                        continue
+                    if key != primary:
+                        self._count("hedge_wins")
+                    if key != preferred:
+                        self._count("fallbacks")
+                    # опоздавший запрос доработает в фоне: его результат попадёт только в статистику
+                    return text, int((time.perf_counter() - t0) * 1000), key
+            log.warning("Router: %s failed (%s), trying next model", order[i], last)
+            i += 1
+        raise last or OpenRouterError(503, "Нет доступных моделей.")
+
+    def open_stream(self, messages: List[Dict], *, preferred: str, **kwargs) -> Tuple[ChatStream, str]:
+        """
+        chat_stream с fallback: ошибка до начала ответа (429/5xx/таймаут) — пробуем
+        следующую модель. Задержку и исход стрима вызывающий сообщает через record().
+        """
+        last: OpenRouterError | None = None
+        order = self.ranked(preferred)
+        for i, key in enumerate(order):
+            t0 = time.perf_counter()
+            try:
+                stream = chat_stream(messages, model=key, attempts=self._attempts(order, i), **kwargs)
+            except OpenRouterError as e:
+                self.record(key, (time.perf_counter() - t0) * 1000, e)
+                if not is_retryable(e):
+                    raise
+                log.warning("Router: %s failed (%s), trying next model", key, e)
+                last = e
+                continue
+            if key != preferred:
+                self._count("fallbacks")
+            return stream, key
+        raise last or OpenRouterError(503, "Нет доступных моделей.")
+
+    def health(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "requests": st.total,
+                    "p50_ms": st.latency(0.5),
+                    "p95_ms": st.latency(0.95),
+                    "error_rate": st.error_rate,
+                    "cooldown_s": max(0.0, st.cooldown_until - now),
+                    "last_error": st.last_error,
+                }
+                for key, st in self._stats.items()
+            }
+
+
+def _model_keys() -> List[str]:
+    return [m["key"] for m in list_models()]
+
+
+router = ModelRouter(_model_keys)
+
+
+__all__ = ["ModelRouter", "ModelStats", "router", "is_retryable", "RETRYABLE"]
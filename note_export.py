@@ -0,0 +1,143 @@
+"""
+note_export.py — потоковый экспорт заметок для /note_export.
+
+Было: все заметки писались в notes_<время>.txt в рабочей папке, файл открывался
+заново, отправлялся и удалялся. Двойной ввод-вывод, гонка имён при двух экспортах
+в одну секунду, мусорные файлы при ошибке.
+Стало: строки идут из db.iter_notes (keyset-пачками) через генератор форматирования
+прямо в SpooledTemporaryFile: пока экспорт меньше EXPORT_SPOOL_BYTES, он целиком
+в памяти, дальше — в анонимном временном файле, который удалит ОС. Опционально gzip.
+В памяти одновременно — одна пачка строк из БД и буфер сжатия.
+
+Форматы: txt (как раньше), jsonl (объект на строку), csv (id, created_at, text).
+"""
+
+from __future__ import annotations
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import IO, Iterable, Iterator
+
+import db
+
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(4 * 1024 * 1024)))
+EXPORT_BATCH = 1000
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024    # больше Bot API не принимает
+GZIP_LEVEL = 6
+
+FORMATS = ("txt", "jsonl", "csv")
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+def _txt(rows: Iterable) -> Iterator[str]:
+    yield f"Экспорт заметок от {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    yield "=" * 50 + "\n\n"
+    total = 0
+    for row in rows:
+        total += 1
+        yield f"Заметка #{row['id']}:\n{row['text']}\n" + "-" * 30 + "\n"
+    yield f"\nВсего заметок: {total}\n"   # в конце: считать заранее — лишний проход по БД
+
+
+def _jsonl(rows: Iterable) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({"id": row["id"], "created_at": row["created_at"], "text": row["text"]},
+                         ensure_ascii=False) + "\n"
+
+
+class _Line:
+    """«Файл» для csv.writer, который просто отдаёт последнюю записанную строку."""
+    def write(self, s: str) -> str:
+        return s
+
+
+def _csv(rows: Iterable) -> Iterator[str]:
+    writer = csv.writer(_Line())
+    yield writer.writerow(["id", "created_at", "text"])
+    for row in rows:
+        yield writer.writerow([row["id"], row["created_at"], row["text"]])
+
+
+_FORMATTERS = {"txt": _txt, "jsonl": _jsonl, "csv": _csv}
+
+
+def write_export(out: IO[bytes], rows: Iterable, fmt: str = "txt", *, compress: bool = False,
+                 limit_bytes: int | None = None) -> int:
+    """Пишет rows в out в формате fmt (и gzip). -> сколько заметок записано."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    sink: IO[bytes] = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) if compress else out
+    start = out.tell()
+    buf = io.StringIO()
+    try:
+        for chunk in _FORMATTERS[fmt](counted()):
+            buf.write(chunk)
+            if buf.tell() >= 64 * 1024:         # пишем кусками, а не по строке
+                sink.write(buf.getvalue().encode("utf-8"))
+                buf = io.StringIO()
+                if limit_bytes is not None and out.tell() - start > limit_bytes:
+                    raise ExportTooLarge(f"экспорт больше {limit_bytes // (1024 * 1024)} МБ")
+        sink.write(buf.getvalue().encode("utf-8"))
+    finally:
+        if compress:
+            sink.close()     # дописывает хвост gzip, сам out не закрывает
+    if limit_bytes is not None and out.tell() - start > limit_bytes:
+        raise ExportTooLarge(f"экспорт больше {limit_bytes // (1024 * 1024)} МБ")
+    return count
+
+
+def export_notes(user_id: int, fmt: str = "txt", *, compress: bool = False,
+                 since: str | None = None, until: str | None = None,
+                 limit_bytes: int | None = TELEGRAM_DOCUMENT_LIMIT) -> tuple[IO[bytes], str, int]:
+    """
+    Экспорт заметок пользователя (since/until — 'YYYY-MM-DD', UTC, включительно).
+    Больше limit_bytes — ExportTooLarge (по умолчанию — лимит документа в Bot API).
+    -> (файл, готовый к чтению с начала; имя для отправки; число заметок). Файл закрыть после отправки.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    try:
+        rows = db.iter_notes(user_id, EXPORT_BATCH, since=since, until=until)
+        count = write_export(out, rows, fmt, compress=compress, limit_bytes=limit_bytes)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    name = f"notes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}" + (".gz" if compress else "")
+    return out, name, count
+
+
+def parse_export_args(args: list[str]) -> dict:
+    """['csv', 'gz', '2024-01-01', '2024-02-01'] -> параметры export_notes. ValueError — непонятный аргумент."""
+    opts: dict = {"fmt": "txt", "compress": False, "since": None, "until": None}
+    dates = []
+    for arg in args:
+        a = arg.lower()
+        if a in FORMATS:
+            opts["fmt"] = a
+        elif a in ("gz", "gzip"):
+            opts["compress"] = True
+        else:
+            dates.append(datetime.strptime(a, "%Y-%m-%d").date().isoformat())
+    if len(dates) > 2:
+        raise ValueError("слишком много дат")
+    if dates:
+        opts["since"] = dates[0]
+    if len(dates) == 2:
+        opts["until"] = dates[1]
+    return opts
+
+
+__all__ = ["export_notes", "write_export", "parse_export_args", "ExportTooLarge", "FORMATS"]
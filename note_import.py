@@ -0,0 +1,68 @@
+"""
+note_import.py — разбор входных данных для /note_import и миграции notes.json.
+
+Источник превращается в ленивый поток строк-заметок, который уходит в
+db.add_notes_bulk (executemany пачками, дедупликация, прогресс):
+  - текст сообщения после /note_import — заметка на строку;
+  - файл .txt — заметка на непустую строку;
+  - .jsonl — поле "text" каждой строки, .csv — колонка text (форматы /note_export);
+  - .gz — то же, сжатое (notes.jsonl.gz и т.п.).
+"""
+
+from __future__ import annotations
+import csv
+import gzip
+import io
+import json
+from typing import Iterator
+
+IMPORT_MAX_BYTES = 20 * 1024 * 1024   # больше через getFile Bot API не скачать
+IMPORT_MAX_UNPACKED = 100 * 1024 * 1024   # .gz распаковываем не больше этого
+
+
+def lines_from_text(text: str) -> Iterator[str]:
+    return iter(text.splitlines())
+
+
+def texts_from_file(data: bytes, filename: str) -> Iterator[str]:
+    """Заметки из загруженного файла; формат — по расширению. ValueError — не удалось разобрать."""
+    name = (filename or "").lower()
+    if name.endswith(".gz"):
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+                data = f.read(IMPORT_MAX_UNPACKED + 1)
+        except (OSError, EOFError):
+            raise ValueError("повреждённый .gz")
+        if len(data) > IMPORT_MAX_UNPACKED:
+            raise ValueError(f"распакованный файл больше {IMPORT_MAX_UNPACKED // (1024 * 1024)} МБ")
+        name = name[:-3]
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("файл не в UTF-8")
+    if name.endswith(".jsonl"):
+        return _from_jsonl(text)
+    if name.endswith(".csv"):
+        return _from_csv(text)
+    return lines_from_text(text)
+
+
+def _from_jsonl(text: str) -> Iterator[str]:
+    for n, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)["text"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"строка {n}: ожидается JSON с полем text")
+
+
+def _from_csv(text: str) -> Iterator[str]:
+    reader = csv.DictReader(io.StringIO(text))
+    if "text" not in (reader.fieldnames or []):
+        raise ValueError("в CSV нет колонки text")
+    for row in reader:
+        yield row["text"] or ""
+
+
+__all__ = ["texts_from_file", "lines_from_text", "IMPORT_MAX_BYTES"]
@@ -0,0 +1,58 @@
+"""
+note_journal.py — чтение старого хранилища заметок main2.py (до SQLite).
+
+Было: main2.py держал заметки в notes.json (снапшот {"notes": {...}, "counter": N})
+и дописывал каждую операцию в журнал notes.json.log (одна JSON-строка на операцию);
+фоновая компактация переносила журнал в снапшот через notes.json.log.old.
+
+Стало: заметки main2.py живут в SQLite (db.py, у каждого пользователя свои), а этот
+модуль только читает старые файлы для переноса (migrate_notes_json.py):
+снапшот + повтор .log.old и .log; оборванная последняя строка журнала
+пропускается. Файлы не изменяются.
+"""
+
+from __future__ import annotations
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def _replay(path: str, notes: dict[int, str]) -> int:
+    n = 0
+    try:
+        with open(path, "rb") as f:
+            for offset, line in enumerate(f):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("no newline")
+                    rec = json.loads(line)
+                except ValueError:
+                    log.warning("Skipping torn journal record in %s (line %d)", path, offset + 1)
+                    break
+                note_id = int(rec["id"])
+                if rec["op"] == "set":
+                    notes[note_id] = rec["text"]
+                elif rec["op"] == "del":
+                    notes.pop(note_id, None)
+                n += 1
+    except FileNotFoundError:
+        pass
+    return n
+
+
+def read_notes(path: str = "notes.json") -> dict[int, str]:
+    """Заметки {id: текст} — то же состояние, что видел старый бот при старте."""
+    notes: dict[int, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        notes.update({int(k): v for k, v in data.get("notes", {}).items()})
+    except FileNotFoundError:
+        pass
+    replayed = _replay(path + ".log.old", notes) + _replay(path + ".log", notes)
+    log.info("Legacy notes read from %s: %d (replayed %d ops)", path, len(notes), replayed)
+    return notes
+
+
+__all__ = ["read_notes"]
@@ -0,0 +1,112 @@
+"""
+note_pages.py — постраничный вывод /note_list и /note_find с кнопками «◀ ▶».
+
+Было: все заметки одним сообщением — после ~4096 символов Telegram его не принимал,
+а db.list_notes отдавал фиксированные 50 штук.
+Стало: страница по PAGE_SIZE заметок, курсор — id крайней заметки (keyset, см.
+db.list_notes_page), поэтому любая страница — поиск по индексу, а не OFFSET.
+Общее число заметок не считается: первая страница у пользователя со 100k заметок
+строится так же быстро, как у пользователя с десятью.
+
+callback_data короткие (лимит Telegram — 64 байта):
+  nl:o123[:N] — /note_list, заметки старше #123 (o) или новее (n); N — размер страницы;
+  nf:o123     — /note_find; сам запрос в callback_data не влезает, он хранится
+                в LRU по (chat_id, message_id) сообщения с результатами.
+"""
+
+from __future__ import annotations
+import os
+from typing import Tuple
+
+from telebot import types
+
+import db
+from cache import MISSING, LRUCache
+
+PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "10"))
+MAX_PAGE_SIZE = 50
+FIND_QUERIES_CACHE_SIZE = int(os.getenv("NOTE_FIND_QUERIES_CACHE_SIZE", "10000"))
+PREVIEW_CHARS = 300          # длинные заметки на странице обрезаются
+MESSAGE_LIMIT = 4000         # с запасом от 4096 у Telegram
+
+LIST, FIND = "nl", "nf"
+
+_find_queries = LRUCache(maxsize=FIND_QUERIES_CACHE_SIZE, name="note_find_queries")
+
+Page = Tuple[str, types.InlineKeyboardMarkup | None]
+
+
+def _preview(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS].rstrip() + "…"
+
+
+def parse_cursor(data: str) -> tuple[str, int | None, int | None, int]:
+    """'nl:o123:20' -> ('nl', before_id=123, after_id=None, limit=20)."""
+    kind, _, rest = data.partition(":")
+    cursor, _, limit = rest.partition(":")
+    key = int(cursor[1:]) if cursor[1:].isdigit() else None
+    before_id = key if cursor[:1] == "o" else None
+    after_id = key if cursor[:1] == "n" else None
+    return kind, before_id, after_id, int(limit) if limit.isdigit() else PAGE_SIZE
+
+
+def _keyboard(kind: str, first_id: int, last_id: int, has_newer: bool, has_older: bool,
+              limit: int) -> types.InlineKeyboardMarkup | None:
+    suffix = f":{limit}" if limit != PAGE_SIZE else ""
+    buttons = []
+    if has_newer:
+        buttons.append(types.InlineKeyboardButton("◀", callback_data=f"{kind}:n{first_id}{suffix}"))
+    if has_older:
+        buttons.append(types.InlineKeyboardButton("▶", callback_data=f"{kind}:o{last_id}{suffix}"))
+    if not buttons:
+        return None
+    kb = types.InlineKeyboardMarkup()
+    kb.row(*buttons)
+    return kb
+
+
+def _render(kind: str, title: str, rows, has_older: bool, has_newer: bool, limit: int,
+            field: str = "text") -> Page:
+    lines = [title]
+    size = len(title)
+    shown = []
+    for row in rows:
+        line = f"{row['id']}: {_preview(row[field])}"
+        if shown and size + len(line) + 1 > MESSAGE_LIMIT:
+            has_older = True  # остальное — на следующей странице, курсор — последняя показанная
+            break
+        lines.append(line)
+        size += len(line) + 1
+        shown.append(row)
+    return "\n".join(lines), _keyboard(kind, shown[0]["id"], shown[-1]["id"], has_newer, has_older, limit)
+
+
+def list_page(user_id: int, *, before_id: int | None = None, after_id: int | None = None,
+              limit: int = PAGE_SIZE) -> Page:
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    rows, has_older, has_newer = db.list_notes_page(user_id, before_id=before_id, after_id=after_id, limit=limit)
+    if not rows:
+        return "Заметок пока нет.", None
+    return _render(LIST, "Список заметок (новые сверху):", rows, has_older, has_newer, limit)
+
+
+def find_page(user_id: int, query: str, *, before_id: int | None = None,
+              after_id: int | None = None) -> Page:
+    rows, has_older, has_newer = db.find_notes_page(user_id, query, before_id=before_id,
+                                                    after_id=after_id, limit=PAGE_SIZE)
+    if not rows:
+        return "Заметки не найдены.", None
+    return _render(FIND, f"Найденные заметки по «{query}»:", rows, has_older, has_newer, PAGE_SIZE, "snippet")
+
+
+def remember_query(chat_id: int, message_id: int, query: str) -> None:
+    _find_queries.set((chat_id, message_id), query)
+
+
+def query_for(chat_id: int, message_id: int) -> str | None:
+    query = _find_queries.get((chat_id, message_id))
+    return None if query is MISSING else query
+
+
+__all__ = ["list_page", "find_page", "parse_cursor", "remember_query", "query_for", "LIST", "FIND", "PAGE_SIZE"]
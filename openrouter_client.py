@@ -1,12 +1,14 @@
 from __future__ import annotations
-import os, time, requests
+import os, time
 from dataclasses import dataclass
 from typing import Dict, List, Tuple
 from dotenv import load_dotenv
 
+from http_pool import get_session
+
 load_dotenv()
 
-OPENROUTER_API = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
 @dataclass
@@ -43,7 +45,7 @@ def chat_once(messages: List[Dict], *,
         "max_tokens": max_tokens,
     }
     t0 = time.perf_counter()
-    r = requests.post(OPENROUTER_API, json=payload, headers=headers, timeout=timeout_s)
+    r = get_session().post(OPENROUTER_API, json=payload, headers=headers, timeout=timeout_s)
     dt_ms = int((time.perf_counter() - t0) * 1000)
     if r.status_code // 100 != 2:
         raise OpenRouterError(r.status_code, _friendly(r.status_code))
@@ -0,0 +1,86 @@
+"""
+profiler.py — профилирование работающего бота по запросу (окно в N секунд).
+
+  - сэмплирующий профайлер: фоновый поток раз в interval_s снимает стеки всех
+    потоков (sys._current_frames) и считает, какие функции чаще всего на вершине
+    стека (self) и в стеке вообще (cumulative). В отличие от cProfile, видит все
+    потоки сразу и почти не замедляет их;
+  - tracemalloc: снимок в начале и в конце окна, топ мест, где выросла память.
+
+По умолчанию ничего не работает — включается командой /profile (см. runner.create_bot).
+"""
+
+from __future__ import annotations
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_INTERVAL_S = 0.005
+PROFILE_MAX_SECONDS = 120
+_running = threading.Lock()     # одно окно профилирования за раз
+
+
+def _where(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def profile_window(seconds: float, *, interval_s: float = PROFILE_INTERVAL_S,
+                   memory: bool = True, top: int = 15) -> str:
+    """Профилирует процесс seconds секунд и возвращает текстовый отчёт."""
+    seconds = min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+    if not _running.acquire(blocking=False):
+        return "Профилирование уже идёт."
+    try:
+        own = threading.get_ident()
+        self_counts: collections.Counter = collections.Counter()
+        cum_counts: collections.Counter = collections.Counter()
+        samples = 0
+        started_tracing = memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        before = tracemalloc.take_snapshot() if memory else None
+
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                self_counts[_where(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    where = _where(frame)
+                    if where not in seen:
+                        cum_counts[where] += 1
+                        seen.add(where)
+                    frame = frame.f_back
+                samples += 1
+            time.sleep(interval_s)
+
+        lines = [f"Профиль за {seconds:.0f} с, {samples} сэмплов стеков (все потоки)."]
+        lines.append("\nЧаще всего выполнялось (self):")
+        lines += [f"{n * 100 / max(1, samples):5.1f}%  {where}" for where, n in self_counts.most_common(top)]
+        lines.append("\nВ стеке (cumulative):")
+        lines += [f"{n * 100 / max(1, samples):5.1f}%  {where}" for where, n in cum_counts.most_common(top)]
+
+        if memory:
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"\nПамять (tracemalloc): сейчас {current / 1e6:.1f} МБ, пик {peak / 1e6:.1f} МБ. Рост за окно:")
+            for stat in after.compare_to(before, "lineno")[:top]:
+                if stat.size_diff <= 0:
+                    break
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size_diff / 1024:+9.1f} КБ  {os.path.basename(frame.filename)}:{frame.lineno}"
+                             f"  ({stat.count_diff:+d} объектов)")
+            if started_tracing:
+                tracemalloc.stop()
+        return "\n".join(lines)
+    finally:
+        _running.release()
+
+
+__all__ = ["profile_window", "PROFILE_MAX_SECONDS"]
@@ -0,0 +1,379 @@
+"""
+ratelimit.py — ограничение частоты команд пользователей и запросов к OpenRouter.
+
+Было: ничто не мешало одному пользователю слать /ask_model или /ask_random
+десятками подряд. Каждое сообщение — запрос к OpenRouter, общая бесплатная квота
+кончалась («Превышены лимиты»), и ждали все остальные.
+
+Стало (везде token bucket из broadcast.py):
+  - RateLimiter — ведра на пользователя: общее на все его апдейты (RATE_LIMIT_USER)
+    и по ведру на каждую команду из RATE_LIMITS («ask_model=3/60» — не чаще 3 раз
+    за 60 с, подряд можно все 3). Ведра — в OrderedDict в памяти, давно не тронутые
+    вытесняются сверх RATE_LIMIT_MAX_KEYS (LRU). Проверка — пара поисков в словаре и
+    try_acquire, единицы микросекунд (python -m bench.bench_ratelimit). Апдейт, отклонённый
+    ведром команды, токен общего ведра пользователя не тратит;
+  - RateLimitMiddleware (ставит runner.create_bot(rate_limiter=...) первой) — апдейт
+    без токена отбрасывается до обработчиков (CancelUpdate); «подождите N с»
+    пользователь получает один раз за период, остальные отказы молчаливые;
+  - llm_slot() — одно ведро на все запросы к OpenRouter (RATE_LIMIT_LLM), его берёт
+    ai_client перед каждой попыткой, включая повторы: OpenRouter считает каждый
+    HTTP-запрос, и по умолчанию (20 в минуту) лимит совпадает с его лимитом для
+    бесплатных моделей. Токена нет дольше RATE_LIMIT_LLM_MAX_WAIT_S —
+    RateLimitedError без похода в сеть.
+Без RATE_LIMIT_DB_PATH ведра живут в памяти процесса: ведро LLM общее для всех
+потоков одного бота, но у каждого процесса своё. RATE_LIMIT_DB_PATH включает
+SQLite (таблица rate_buckets): запас пользователей сохраняется раз в
+RATE_LIMIT_FLUSH_S и переживает перезапуск, а ведро LLM становится общим для всех
+процессов (пока SQLite недоступна или занята — работает ведро процесса). supervisor.py сам задаёт воркерам RATE_LIMIT_DB_PATH=ratelimit.db, если
+переменная не задана, поэтому лимит LLM общий на весь бот и с --workers N.
+Лимит «off» (или пустой) — выключен.
+"""
+
+from __future__ import annotations
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+
+import sqlite_pool
+from broadcast import TokenBucket
+
+log = logging.getLogger(__name__)
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "ask=5/60,ask_model=3/60,ask_random=3/60,"
+                                       "note_export=2/60,note_import=2/60")
+RATE_LIMIT_USER = os.getenv("RATE_LIMIT_USER", "30/10")
+RATE_LIMIT_LLM = os.getenv("RATE_LIMIT_LLM", "20/60")
+RATE_LIMIT_LLM_MAX_WAIT_S = float(os.getenv("RATE_LIMIT_LLM_MAX_WAIT_S", "5"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "")
+RATE_LIMIT_FLUSH_S = float(os.getenv("RATE_LIMIT_FLUSH_S", "5"))
+
+Limit = Tuple[float, float]   # (токенов в секунду, запас)
+USER = "*"                    # «команда» общего ведра пользователя
+LLM_KEY = "llm"               # строка общего ведра запросов к OpenRouter в rate_buckets
+
+
+def parse_limit(spec: str) -> Limit | None:
+    """'3/60' -> не чаще 3 раз за 60 с: (0.05 токена/с, запас 3). '', 'off', '0' -> None."""
+    spec = (spec or "").strip().lower()
+    if spec in ("", "off", "0"):
+        return None
+    count, _, seconds = spec.partition("/")
+    count, seconds = float(count), float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        return None
+    return count / seconds, count
+
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    """'ask=5/60,ask_model=3/60' -> {'ask': (...), 'ask_model': (...)}."""
+    limits = {}
+    for item in (spec or "").replace(" ", "").split(","):
+        if not item:
+            continue
+        command, _, limit = item.partition("=")
+        parsed = parse_limit(limit)
+        if parsed:
+            limits[command.lstrip("/").lower()] = parsed
+    return limits
+
+
+def command_of(text: str | None) -> str | None:
+    """'/ask_model@bot вопрос' -> 'ask_model'; не команда -> None."""
+    if not text or text[0] != "/":
+        return None
+    head = text[1:].split(None, 1)
+    return head[0].split("@", 1)[0].lower() if head else None
+
+
+class BucketTable:
+    """Таблица rate_buckets: (ключ, остаток токенов, момент по time.time())."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = sqlite_pool.connect(self.path)
+        if not self._schema_ready:
+            with conn:
+                conn.executescript("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key    TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    at     REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_rate_buckets_at ON rate_buckets(at);
+                """)
+            self._schema_ready = True
+        return conn
+
+    def load(self, key: str) -> Tuple[float, float] | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT tokens, at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        return (row["tokens"], row["at"]) if row else None
+
+    def save(self, rows: List[Tuple[str, float, float]], full: List[str], *, purge_before: float) -> None:
+        """rows — неполные ведра; full — полные (хранить незачем); purge_before — давно полные."""
+        with self._connect() as conn:
+            conn.executemany(
+                """INSERT INTO rate_buckets(key, tokens, at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, at = excluded.at""", rows)
+            conn.executemany("DELETE FROM rate_buckets WHERE key = ?", [(k,) for k in full])
+            conn.execute("DELETE FROM rate_buckets WHERE at < ? AND key != ?", (purge_before, LLM_KEY))
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        """
+        Берёт токен из общего для всех процессов ведра key. 0.0 — взяли,
+        иначе через сколько секунд появится токен (ничего не пишется).
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            tokens = capacity if row is None else min(capacity, row["tokens"] + max(0.0, now - row["at"]) * rate)
+            if tokens < 1:
+                conn.rollback()
+                return (1 - tokens) / rate
+            conn.execute(
+                """INSERT INTO rate_buckets(key, tokens, at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, at = excluded.at""",
+                (key, tokens - 1, now))
+            conn.commit()
+        return 0.0
+
+
+class RateLimiter:
+    """Ведра (команда, user_id) в памяти; с db_path — с сохранением в SQLite."""
+
+    def __init__(self, limits: Dict[str, Limit] | None = None, *,
+                 user: Limit | None = parse_limit(RATE_LIMIT_USER),
+                 max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 db_path: str = RATE_LIMIT_DB_PATH,
+                 flush_s: float = RATE_LIMIT_FLUSH_S) -> None:
+        self.limits = parse_limits(RATE_LIMITS) if limits is None else dict(limits)
+        self.user = user
+        self.max_keys = max_keys
+        self.flush_s = flush_s
+        self.table = BucketTable(db_path) if db_path else None
+        # ключ -> [ведро, до какого момента (monotonic) в нём точно нет токена]
+        self._buckets: "OrderedDict[Tuple[str, int], list]" = OrderedDict()
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._flusher: threading.Thread | None = None
+        self._counters = {"allowed": 0, "rejected": 0, "notified": 0, "evicted": 0}
+        self._rejected_by: Dict[str, int] = {}
+        # за это время любое ведро наполняется до краёв — строки старше можно удалять
+        spans = [c / r for r, c in self.limits.values()] + ([user[1] / user[0]] if user else [])
+        self._full_after_s = max(spans, default=0.0)
+
+    # ---------- проверка ----------
+    def check(self, user_id: int, command: str | None = None) -> Tuple[float, bool]:
+        """
+        (0.0, False) — пропустить апдейт. Иначе (через сколько секунд можно, сказать ли
+        об этом пользователю): True — только на первый отказ за период.
+        """
+        now = time.monotonic()
+        limit = self.limits.get(command) if command else None
+        taken: List[Tuple[Tuple[str, int], TokenBucket]] = []
+        wait, notify, name = 0.0, False, USER
+        if self.user:
+            wait, notify = self._take((USER, user_id), self.user, now, taken)
+        if not wait and limit:
+            name = command
+            wait, notify = self._take((command, user_id), limit, now, taken)
+            if wait:
+                for _, bucket in taken:
+                    bucket.refund()     # апдейт отброшен — токен общего ведра пользователя не тратим
+        with self._lock:
+            if not wait:
+                self._counters["allowed"] += 1
+                if self.table is not None:
+                    self._dirty.update(key for key, _ in taken)
+            else:
+                self._counters["rejected"] += 1
+                self._counters["notified"] += notify
+                self._rejected_by[name] = self._rejected_by.get(name, 0) + 1
+        return wait, notify
+
+    def _take(self, key: Tuple[str, int], limit: Limit, now: float,
+              taken: List[Tuple[Tuple[str, int], TokenBucket]]) -> Tuple[float, bool]:
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is not None:
+                self._buckets.move_to_end(key)
+        if entry is None:
+            entry = self._add(key, limit)
+        if now < entry[1]:
+            # уже отказывали, и токен с тех пор не набрался — ведро даже не трогаем
+            return entry[1] - now, False
+        bucket = entry[0]
+        if bucket.try_acquire():
+            taken.append((key, bucket))
+            return 0.0, False
+        wait = bucket.retry_in()
+        entry[1] = now + wait
+        return wait, True
+
+    def _add(self, key: Tuple[str, int], limit: Limit) -> list:
+        bucket = TokenBucket(*limit)
+        if self.table is not None:
+            self._start_flusher()
+            try:
+                saved = self.table.load(f"{key[0]}:{key[1]}")
+            except Exception as e:      # БД недоступна — лимит всё равно работает, с полным ведром
+                log.warning("Rate bucket %s not loaded: %r", key, e)
+                saved = None
+            if saved:
+                bucket.restore(*saved)
+        with self._lock:
+            entry = self._buckets.setdefault(key, [bucket, 0.0])
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                old, _ = self._buckets.popitem(last=False)
+                self._dirty.discard(old)    # давно не тронутое ведро почти наверняка уже полное
+                self._counters["evicted"] += 1
+        return entry
+
+    # ---------- сохранение в SQLite ----------
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="ratelimit-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_s)
+            try:
+                self.flush()
+            except Exception as e:
+                log.warning("Rate buckets flush failed: %r", e)
+
+    def flush(self) -> int:
+        """Пишет изменившиеся ведра в rate_buckets; возвращает, сколько записано."""
+        if self.table is None:
+            return 0
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            entries = [(key, self._buckets[key][0]) for key in dirty if key in self._buckets]
+        rows, full = [], []
+        for (command, user_id), bucket in entries:
+            tokens, at = bucket.snapshot()
+            key = f"{command}:{user_id}"
+            if tokens >= bucket.capacity:
+                full.append(key)
+            else:
+                rows.append((key, tokens, at))
+        if rows or full:
+            self.table.save(rows, full, purge_before=time.time() - self._full_after_s)
+        return len(rows) + len(full)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets), "max_keys": self.max_keys,
+                    "persistent": self.table is not None, **self._counters,
+                    "rejected_by": dict(self._rejected_by)}
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Отсекает сообщения и нажатия кнопок сверх лимитов limiter до обработчиков."""
+    update_sensitive = True
+
+    def __init__(self, bot, limiter: RateLimiter) -> None:
+        super().__init__()
+        self.update_types = ["message", "callback_query"]
+        self.bot = bot
+        self.limiter = limiter
+
+    def pre_process_message(self, message, data):
+        if message.from_user is None:
+            return None
+        command = command_of(message.text or message.caption)
+        wait, notify = self.limiter.check(message.from_user.id, command)
+        if not wait:
+            return None
+        if notify:
+            try:
+                self.bot.reply_to(message, f"⏳ Слишком часто. Попробуйте через {math.ceil(wait)} с.")
+            except Exception as e:
+                log.warning("Rate limit notice failed: %r", e)
+        return CancelUpdate()
+
+    def post_process_message(self, message, data, exception):
+        pass
+
+    def pre_process_callback_query(self, call, data):
+        wait, notify = self.limiter.check(call.from_user.id)
+        if not wait:
+            return None
+        if notify:
+            try:
+                self.bot.answer_callback_query(call.id, f"⏳ Слишком часто, подождите {math.ceil(wait)} с.")
+            except Exception as e:
+                log.warning("Rate limit notice failed: %r", e)
+        return CancelUpdate()
+
+    def post_process_callback_query(self, call, data, exception):
+        pass
+
+
+# ---------- общее ведро запросов к OpenRouter ----------
+LLM_STATS = {"acquired": 0, "waited": 0, "rejected": 0}
+_llm_lock = threading.Lock()
+_llm_bucket: TokenBucket | None = None
+_llm_table: BucketTable | None = None
+_LLM_LIMIT = parse_limit(RATE_LIMIT_LLM)
+
+
+def _llm_take() -> float:
+    """0.0 — токен взят, иначе через сколько секунд он появится."""
+    global _llm_bucket, _llm_table
+    rate, capacity = _LLM_LIMIT
+    if RATE_LIMIT_DB_PATH:
+        if _llm_table is None:
+            _llm_table = BucketTable(RATE_LIMIT_DB_PATH)
+        try:
+            return _llm_table.take(LLM_KEY, rate, capacity)
+        except Exception as e:      # БД занята или недоступна — лимит процесса, как без RATE_LIMIT_DB_PATH
+            log.warning("Shared LLM bucket unavailable, using the process one: %r", e)
+    with _llm_lock:
+        if _llm_bucket is None:
+            _llm_bucket = TokenBucket(rate, capacity)
+    return 0.0 if _llm_bucket.try_acquire() else _llm_bucket.retry_in()
+
+
+def llm_slot(max_wait_s: float = RATE_LIMIT_LLM_MAX_WAIT_S) -> float:
+    """
+    Ждёт токен общего ведра запросов к OpenRouter не дольше max_wait_s.
+    0.0 — можно идти в сеть; иначе через сколько секунд появится токен (запрос отклонить).
+    """
+    if _LLM_LIMIT is None:
+        return 0.0
+    deadline = time.monotonic() + max_wait_s
+    waited = False
+    while True:
+        wait = _llm_take()
+        if not wait:
+            with _llm_lock:
+                LLM_STATS["acquired"] += 1
+                LLM_STATS["waited"] += waited
+            return 0.0
+        if time.monotonic() + wait > deadline:
+            with _llm_lock:
+                LLM_STATS["rejected"] += 1
+            return wait
+        waited = True
+        time.sleep(wait)
+
+
+__all__ = ["RateLimiter", "RateLimitMiddleware", "BucketTable", "llm_slot", "parse_limit",
+           "parse_limits", "command_of", "LLM_STATS", "RATE_LIMITS", "RATE_LIMIT_USER",
+           "RATE_LIMIT_LLM", "RATE_LIMIT_DB_PATH"]
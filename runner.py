@@ -0,0 +1,311 @@
+"""
+runner.py — создание и запуск бота: long polling (как раньше) или webhook.
+
+create_bot() — TeleBot с метриками (metrics.py): middleware на все обработчики,
+замер запросов к Bot API, GET /metrics на METRICS_PORT и админ-команды
+/stats и /profile [секунды] (ADMIN_IDS — через запятую; пусто — команды выключены:
+профайлер и внутренние метрики не для посторонних).
+Шаги register_next_step_handler и FSM-состояния хранятся в state_store.py
+(STATE_BACKEND; по умолчанию SQLite — переживают перезапуск).
+create_bot(rate_limiter=...) ставит первой middleware лимитов ratelimit.py.
+
+Режим выбирается переменной окружения BOT_MODE=polling|webhook.
+TELEGRAM_API_URL — адрес Bot API вместо api.telegram.org (локальный сервер
+или заглушка для нагрузочного теста bench/loadtest.py).
+
+Webhook:
+  - лёгкий HTTP-сервер (http.server) принимает POST от Telegram на WEBHOOK_PATH;
+  - без WEBHOOK_SECRET не запускается; путь и заголовок X-Telegram-Bot-Api-Secret-Token
+    (сравнение за постоянное время) проверяются до чтения тела, тело больше
+    WEBHOOK_MAX_BODY_BYTES отклоняется с 413 — посторонний не заставит сервер буферизовать;
+  - кладёт апдейт в ограниченную очередь и сразу отвечает 200;
+    если очередь полна — 503, Telegram повторит доставку позже;
+  - WEBHOOK_WORKERS потоков разбирают очередь и вызывают bot.process_new_updates.
+  Telegram ходит только по HTTPS, поэтому снаружи нужен reverse proxy (nginx и т.п.),
+  а WEBHOOK_URL — его публичный адрес.
+"""
+
+from __future__ import annotations
+import hmac
+import logging
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+import telebot
+from dotenv import load_dotenv
+from telebot import types
+
+import metrics
+from profiler import profile_window
+from ratelimit import RateLimiter, RateLimitMiddleware
+from state_store import FSMStateStorage, StepHandlerBackend, make_store
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+BOT_MODE = (os.getenv("BOT_MODE") or "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")                 # https://example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")      # свой Bot API сервер или заглушка (bench/stub_telegram.py)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS
+
+
+def _state_stats_line(bot) -> str | None:
+    store = getattr(bot.next_step_backend, "store", None)
+    if store is None:
+        return None
+    st = store.stats()
+    return (f"состояния диалогов ({st['backend']}): живых {st['live']} из {st['max_entries']}, "
+            f"истекло {st['expired']}, вытеснено {st['evicted']}")
+
+
+def _rate_stats_line(bot) -> str | None:
+    for mw in getattr(bot, "middlewares", None) or []:
+        if isinstance(mw, RateLimitMiddleware):
+            st = mw.limiter.stats()
+            by = ", ".join(f"{k}: {v}" for k, v in sorted(st["rejected_by"].items(), key=lambda kv: -kv[1]))
+            return (f"лимиты: пропущено {st['allowed']}, отклонено {st['rejected']}"
+                    f"{f' ({by})' if by else ''}, ведер {st['keys']} из {st['max_keys']}")
+    return None
+
+
+def _stats_text(bot) -> str:
+    rows = metrics.summary()
+    extra = [line for line in (_state_stats_line(bot), _rate_stats_line(bot)) if line]
+    if not rows:
+        return "\n".join(extra) or "Пока нет данных."
+    lines = ["команда: вызовов / ошибок / сейчас; p50 / p95 / ср., мс; из них БД / Telegram / OpenRouter, мс"]
+    for r in sorted(rows, key=lambda r: -r["count"]):
+        lines.append(
+            f"{r['command']}: {r['count']} / {r['errors']} / {r['in_flight']}; "
+            f"{r['p50_ms']:.0f} / {r['p95_ms']:.0f} / {r['avg_ms']:.1f}; "
+            f"{r['db_ms']:.1f} / {r['telegram_ms']:.1f} / {r['openrouter_ms']:.1f}"
+        )
+    lines.extend(extra)
+    return "\n".join(lines)
+
+
+def _register_admin_commands(bot) -> None:
+    if not ADMIN_IDS:
+        log.warning("ADMIN_IDS is empty: admin commands /stats and /profile are disabled")
+
+    @bot.message_handler(commands=["stats"])
+    def cmd_stats(message: types.Message) -> None:
+        if not is_admin(message.from_user.id):
+            return
+        bot.reply_to(message, _stats_text(bot))
+
+    @bot.message_handler(commands=["profile"])
+    def cmd_profile(message: types.Message) -> None:
+        if not is_admin(message.from_user.id):
+            return
+        arg = message.text.split(maxsplit=1)[1:] or ["10"]
+        seconds = float(arg[0]) if arg[0].replace(".", "", 1).isdigit() else 10.0
+        bot.reply_to(message, f"Профилирую {seconds:.0f} с…")
+
+        def _run() -> None:
+            report = profile_window(seconds)
+            for i in range(0, len(report), 4000):
+                bot.send_message(message.chat.id, report[i:i + 4000])
+
+        threading.Thread(target=_run, name="profiler", daemon=True).start()
+
+
+def configure_api_url() -> None:
+    """Направляет apihelper на TELEGRAM_API_URL, если он задан."""
+    if TELEGRAM_API_URL:
+        base = TELEGRAM_API_URL.rstrip("/")
+        telebot.apihelper.API_URL = base + "/bot{0}/{1}"
+        telebot.apihelper.FILE_URL = base + "/file/bot{0}/{1}"
+
+
+def create_bot(token: str, *, rate_limiter: RateLimiter | None = None, **kwargs) -> telebot.TeleBot:
+    """
+    TeleBot для main*.py: метрики обработчиков, время Bot API, /metrics, /stats, /profile.
+    rate_limiter — лимиты частоты (ratelimit.py); его middleware идёт перед метриками:
+    отклонённый апдейт TeleBot не доводит до post_process, и метрики сочли бы его «в работе».
+    """
+    configure_api_url()
+    if "next_step_backend" not in kwargs or "state_storage" not in kwargs:
+        store = make_store()
+        kwargs.setdefault("next_step_backend", StepHandlerBackend(store))
+        kwargs.setdefault("state_storage", FSMStateStorage(store))
+    bot = telebot.TeleBot(token, use_class_middlewares=True, **kwargs)
+    if rate_limiter is not None:
+        bot.setup_middleware(RateLimitMiddleware(bot, rate_limiter))
+    bot.setup_middleware(metrics.HandlerMetricsMiddleware())
+    metrics.install_telegram_timing()
+    metrics.serve_metrics()
+    _register_admin_commands(bot)
+    return bot
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    bot — всё, у чего есть process_new_updates(list): TeleBot или маршрутизатор
+    supervisor.Supervisor. parse превращает тело POST в апдейт (для supervisor — json.loads).
+    """
+    daemon_threads = True
+
+    def __init__(self, bot, *,
+                 host: str = WEBHOOK_LISTEN,
+                 port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH,
+                 secret: str = WEBHOOK_SECRET,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS,
+                 max_body: int = WEBHOOK_MAX_BODY_BYTES,
+                 parse: Callable[[str], Any] = types.Update.de_json) -> None:
+        super().__init__((host, port), _WebhookHandler)
+        self.bot = bot
+        self.parse = parse
+        self.webhook_path = path
+        self.secret = secret
+        self.max_body = max_body
+        self.updates: "queue.Queue[tuple[Any, float] | None]" = queue.Queue(maxsize=queue_size)
+        self.stats = {"received": 0, "processed": 0, "rejected": 0, "forbidden": 0, "too_large": 0,
+                      "wait_ms_total": 0.0}
+        self._stats_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"webhook-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _worker(self) -> None:
+        while True:
+            item = self.updates.get()
+            if item is None:
+                return
+            update, enqueued = item
+            self._count("wait_ms_total", (time.perf_counter() - enqueued) * 1000)
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                log.exception("Webhook update failed: %r", e)
+            self._count("processed")
+
+    def start_workers(self) -> None:
+        for t in self._workers:
+            t.start()
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        for t in self._workers:
+            if t.is_alive():        # незапущенным воркерам сигнал не нужен (и в полную очередь не влезет)
+                self.updates.put(None)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+    def _reply(self, status: int, *, close: bool = False) -> None:
+        """close=True — тело запроса не прочитано, соединение дальше использовать нельзя."""
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if close:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+
+    def _authorized(self, secret: str) -> bool:
+        if not secret:
+            return True
+        token = self.headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+        return hmac.compare_digest(token.encode("utf-8"), secret.encode("utf-8"))
+
+    def do_POST(self) -> None:
+        srv: WebhookServer = self.server
+        if self.path != srv.webhook_path:
+            self._reply(404, close=True)
+            return
+        if not self._authorized(srv.secret):
+            srv._count("forbidden")
+            self._reply(403, close=True)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._reply(400, close=True)
+            return
+        if length > srv.max_body:
+            srv._count("too_large")
+            self._reply(413, close=True)
+            return
+        body = self.rfile.read(length)
+        try:
+            update = srv.parse(body.decode("utf-8"))
+        except Exception as e:
+            log.warning("Webhook: bad update payload: %r", e)
+            self._reply(400)
+            return
+        srv._count("received")
+        try:
+            srv.updates.put_nowait((update, time.perf_counter()))
+        except queue.Full:
+            srv._count("rejected")
+            self._reply(503)
+            return
+        self._reply(200)
+
+
+def register_webhook(bot) -> None:
+    """setWebhook на WEBHOOK_URL + WEBHOOK_PATH (старый снимается, накопившиеся апдейты сбрасываются)."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook, но не задан WEBHOOK_URL")
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook, но не задан WEBHOOK_SECRET: без него апдейты "
+                           "мог бы присылать кто угодно")
+    bot.remove_webhook()
+    bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        drop_pending_updates=True,
+        max_connections=max(1, min(100, WEBHOOK_WORKERS * 10)),
+    )
+
+
+def run_webhook(bot) -> None:
+    server = WebhookServer(bot)
+    server.start_workers()
+    register_webhook(bot)
+    log.info("Webhook mode: listening on %s:%d%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        server.serve_forever()
+    finally:
+        server.shutdown()
+
+
+def run_bot(bot) -> None:
+    """Точка входа для main*.py: polling или webhook в зависимости от BOT_MODE."""
+    if BOT_MODE == "webhook":
+        run_webhook(bot)
+    else:
+        bot.infinity_polling(skip_pending=True)
+
+
+__all__ = ["create_bot", "configure_api_url", "run_bot", "run_webhook", "register_webhook",
+           "WebhookServer", "BOT_MODE", "is_admin"]
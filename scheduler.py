@@ -0,0 +1,99 @@
+"""
+scheduler.py — планировщик ежедневной рассылки по событиям, без опроса раз в минуту.
+
+При каждом пробуждении читает расписание (одна агрегирующая выборка по индексу:
+сколько подписчиков каждого часа ещё ждут рассылку), берёт ближайший момент
+отправки и спит ровно до него. Рассылка стартует в hh:00:00, а не «в течение минуты».
+Очередь между пробуждениями не хранится: расписание меняют команды и другие
+процессы, а часов в сутках всего 24 — min() по ним дешевле, чем поддерживать кучу.
+
+wake() будит планировщик досрочно: его вызывают /set_time, /subscribe,
+/set_sign и т.п., после чего расписание перечитывается.
+"""
+
+from __future__ import annotations
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+log = logging.getLogger(__name__)
+
+# Страховка от «пропущенного» события (смена системного времени и т.п.)
+MAX_SLEEP_S = 3600.0
+# Если после прохода в часе остались неотправленные (429 и т.п.) — повтор не раньше чем через
+RETRY_DELAY_S = 60.0
+
+
+class DailyScheduler:
+    def __init__(self,
+                 schedule: Callable[[str], Dict[int, int]],
+                 run_hour: Callable[[datetime], None],
+                 clock: Callable[[], datetime] = datetime.now) -> None:
+        """
+        schedule(today_str) -> {час: сколько подписчиков этого часа ещё не получили сегодня}
+        run_hour(now)       -> отправить всем, кому положено в now.hour
+        """
+        self.schedule = schedule
+        self.run_hour = run_hour
+        self.clock = clock
+        self.max_sleep_s = MAX_SLEEP_S   # меньше — если расписание меняют другие процессы
+        self._wake = threading.Event()
+        self._stop = False
+        self.runs = 0
+        self.wakeups = 0
+
+    def wake(self) -> None:
+        self.wakeups += 1
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop = True
+        self._wake.set()
+
+    def _next(self, now: datetime) -> tuple[datetime, int] | None:
+        """Ближайший момент отправки и его час; None — подписчиков нет."""
+        today = now.replace(minute=0, second=0, microsecond=0)
+        fires = []
+        for hour, pending in self.schedule(now.strftime("%Y-%m-%d")).items():
+            fire = today.replace(hour=hour)
+            if hour == now.hour and pending:
+                fire = now                       # текущий час, есть кому слать — сейчас
+            elif fire <= now:
+                fire += timedelta(days=1)        # час уже прошёл — завтра
+            fires.append((fire, hour))
+        return min(fires, default=None)
+
+    def next_fire(self) -> tuple[datetime, int] | None:
+        return self._next(self.clock())
+
+    def run_forever(self) -> None:
+        log.info("Scheduler started")
+        while not self._stop:
+            try:
+                self._wake.clear()
+                now = self.clock()
+                nxt = self._next(now)
+                if nxt is None:
+                    log.debug("Scheduler: no subscribers, sleeping until woken")
+                    self._wake.wait(self.max_sleep_s)
+                    continue
+                fire, hour = nxt
+                delay = (fire - now).total_seconds()
+                if delay > 0:
+                    log.debug("Scheduler: next run %s (hour %d) in %.0f s", fire, hour, delay)
+                    if self._wake.wait(min(delay, self.max_sleep_s)):
+                        continue                 # расписание изменилось — перечитываем
+                    if self.clock() < fire:
+                        continue                 # проснулись чуть раньше — досыпаем
+                now = self.clock()
+                self.run_hour(now)
+                self.runs += 1
+                if self.schedule(now.strftime("%Y-%m-%d")).get(now.hour):
+                    self._wake.wait(RETRY_DELAY_S)
+            except Exception as e:
+                log.exception("Scheduler error: %r", e)
+                self._wake.wait(60)
+
+
+__all__ = ["DailyScheduler"]
@@ -0,0 +1,71 @@
+"""
+singleflight.py — склейка одинаковых одновременных запросов (single flight).
+
+Если несколько потоков одновременно вызывают do(key, fn) с одним ключом,
+fn выполняет только первый («ведущий»), остальные ждут и получают тот же
+результат — или то же исключение. После завершения ключ освобождается:
+следующий вызов снова пойдёт в fn (долговременное хранение — дело кэша).
+"""
+
+from __future__ import annotations
+import threading
+from typing import Callable, Dict, Generic, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: T | None = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self, name: str = "singleflight") -> None:
+        self.name = name
+        self._calls: Dict[str, _Call[T]] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0      # сколько раз fn реально вызывалась
+        self.coalesced = 0    # сколько вызовов получили чужой результат
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """Возвращает (результат, shared); shared=True — результат ведущего вызова."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"name": self.name, "leaders": self.leaders,
+                    "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+__all__ = ["SingleFlight"]
@@ -0,0 +1,180 @@
+"""
+sqlite_pool.py — общий слой подключений к SQLite для db.py и db2.py.
+
+Раньше каждая функция делала sqlite3.connect() + три PRAGMA, т.е. одна команда
+бота открывала 2–3 соединения. Теперь:
+  - у каждого потока своё соединение на каждый файл БД (sqlite3.Connection
+    нельзя безопасно делить между потоками без своей синхронизации);
+  - PRAGMA выполняются один раз при создании соединения;
+  - подготовленные выражения переиспользуются через кэш sqlite3
+    (cached_statements) — запросы у нас параметризованные, текст SQL одинаковый;
+  - соединение закрывается, когда завершается его поток (пулы потоков рассылки,
+    chat_many, хеджирования, /profile не копят открытые файлы), а оставшиеся —
+    при завершении процесса (atexit) или явно через close_all();
+  - время каждого execute/executemany/executescript/commit учитывается в
+    metrics (зависимость «db»).
+
+Использование не меняется: `with _connect() as conn:` — контекст-менеджер
+sqlite3.Connection делает commit/rollback, но соединение не закрывает.
+"""
+
+from __future__ import annotations
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+
+from metrics import record
+
+log = logging.getLogger(__name__)
+
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Сколько разных SQL держать подготовленными на одно соединение (дефолт sqlite3 — 128)
+CACHED_STATEMENTS = 256
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.Connection, который сообщает в metrics время выполнения запросов."""
+
+    def execute(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            record("db", time.perf_counter() - t0)
+
+    def executemany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            record("db", time.perf_counter() - t0)
+
+    def executescript(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(*args, **kwargs)
+        finally:
+            record("db", time.perf_counter() - t0)
+
+    def commit(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record("db", time.perf_counter() - t0)
+
+
+class _Holder:
+    """Соединение в threading.local: удаляется вместе с потоком, а с ним срабатывает finalize."""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+
+class ConnectionPool:
+    """Пул «одно соединение на поток» для одного файла БД."""
+
+    def __init__(self, path: str, timeout: float = 5.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[sqlite3.Connection] = []
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        # check_same_thread=False только ради close_all() из главного потока:
+        # в рабочем режиме соединением пользуется лишь поток-владелец.
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False,
+            factory=TimedConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._all.append(conn)
+        log.debug("SQLite connection opened: %s (%s)", self.path, threading.current_thread().name)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        """Поток-владелец завершился: закрываем его соединение, если close_all() ещё не закрыл."""
+        with self._lock:
+            if conn not in self._all:
+                return
+            self._all.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            log.warning("SQLite close failed: %r", e)
+        log.debug("SQLite connection closed with its thread: %s", self.path)
+
+    def connection(self) -> sqlite3.Connection:
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            if self._closed:
+                raise sqlite3.ProgrammingError(f"Пул {self.path} уже закрыт")
+            holder = _Holder(self._open())
+            weakref.finalize(holder, self._release, holder.conn)
+            self._local.holder = holder
+        return holder.conn
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+            self._closed = True
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                log.warning("SQLite close failed: %r", e)
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "connections": len(self._all), "closed": self._closed}
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str) -> ConnectionPool:
+    """Один пул на файл БД на весь процесс (db.py и db2.py получают свои)."""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None or pool._closed:
+                pool = ConnectionPool(path)
+                _pools[path] = pool
+    return pool
+
+
+def connect(path: str) -> sqlite3.Connection:
+    return get_pool(path).connection()
+
+
+def close_all() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+atexit.register(close_all)
+
+__all__ = ["ConnectionPool", "TimedConnection", "get_pool", "connect", "close_all"]
@@ -0,0 +1,376 @@
+"""
+state_store.py — хранилище состояний диалогов: шаги register_next_step_handler
+и FSM-состояния TeleBot (set_state / add_data).
+
+Было: TeleBot держит ожидающие шаги в обычном dict процесса (MemoryHandlerBackend).
+Кто нажал «Сумма» и не ответил, остаётся там навсегда, а после перезапуска все
+начатые диалоги теряются — ответ с числами уходит в обычные обработчики.
+Стало: два бэкенда с одним интерфейсом (get / set / pop, TTL, предел размера, счётчики):
+  - MemoryStateStore — OrderedDict в памяти: запись живёт STATE_TTL_S с последнего
+    изменения, больше STATE_MAX_ENTRIES — вытесняются давно не тронутые (LRU);
+  - SQLiteStateStore — таблица states в STATE_DB_PATH (значения — pickle): переживает
+    перезапуск и общая для процессов supervisor.py; TTL и вытеснение — по updated_at,
+    как в llm_cache.py.
+И два адаптера к точкам расширения TeleBot (их ставит runner.create_bot):
+  - StepHandlerBackend — next_step_backend: шаг хранится как ссылка «модуль:функция»
+    плюс аргументы, поэтому после перезапуска бот по-прежнему ждёт числа для «Суммы»;
+  - FSMStateStorage — state_storage для bot.set_state / get_state / add_data.
+
+STATE_BACKEND=sqlite|memory (по умолчанию sqlite). Счётчики — в /stats.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from telebot.handler_backends import HandlerBackend
+from telebot.storage import StateStorageBase
+from telebot.storage.base_storage import StateDataContext
+
+import sqlite_pool
+
+log = logging.getLogger(__name__)
+
+STATE_BACKEND = (os.getenv("STATE_BACKEND") or "sqlite").lower()
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+STATE_TTL_S = float(os.getenv("STATE_TTL_S", str(24 * 3600)))
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", "10000"))
+EVICT_EVERY = 100  # SQLite: просроченное и лишнее чистим раз в N записей, а не на каждую
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {"sets": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += value
+
+
+class MemoryStateStore(_Counters):
+    persistent = False
+
+    def __init__(self, *, ttl_s: float = STATE_TTL_S, max_entries: int = STATE_MAX_ENTRIES) -> None:
+        super().__init__()
+        if max_entries <= 0:
+            raise ValueError("max_entries должен быть > 0")
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()   # key -> (value, updated_at)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._counters["misses"] += 1
+                return None
+            value, updated_at = item
+            if time.time() - updated_at > self.ttl_s:
+                del self._data[key]
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            self._counters["sets"] += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def pop(self, key: str) -> Any | None:
+        value = self.get(key)
+        with self._lock:
+            self._data.pop(key, None)
+        return value
+
+    def purge_expired(self) -> int:
+        deadline = time.time() - self.ttl_s
+        with self._lock:
+            stale = [k for k, (_, updated_at) in self._data.items() if updated_at < deadline]
+            for k in stale:
+                del self._data[k]
+            self._counters["expired"] += len(stale)
+        return len(stale)
+
+    def stats(self) -> dict:
+        self.purge_expired()
+        with self._lock:
+            return {"backend": "memory", "live": len(self._data), "max_entries": self.max_entries,
+                    "ttl_s": self.ttl_s, **self._counters}
+
+
+class SQLiteStateStore(_Counters):
+    persistent = True
+
+    def __init__(self, path: str = STATE_DB_PATH, *, ttl_s: float = STATE_TTL_S,
+                 max_entries: int = STATE_MAX_ENTRIES) -> None:
+        super().__init__()
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._schema_ready = False
+        self._writes = 0
+
+    def _connect(self):
+        conn = sqlite_pool.connect(self.path)
+        if not self._schema_ready:
+            with conn:
+                conn.executescript("""
+                CREATE TABLE IF NOT EXISTS states (
+                    key        TEXT PRIMARY KEY,
+                    value      BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_states_updated_at ON states(updated_at);
+                """)
+            self._schema_ready = True
+        return conn
+
+    def get(self, key: str) -> Any | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, updated_at FROM states WHERE key = ?", (key,)).fetchone()
+            if row is not None and time.time() - row["updated_at"] > self.ttl_s:
+                conn.execute("DELETE FROM states WHERE key = ?", (key,))
+                self._count("expired")
+                row = None
+        if row is None:
+            self._count("misses")
+            return None
+        try:
+            value = pickle.loads(row["value"])
+        except Exception as e:     # код поменялся и запись больше не читается — как будто её нет
+            log.warning("State %s is unreadable, dropping: %r", key, e)
+            self._delete(key)
+            self._count("misses")
+            return None
+        self._count("hits")
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT INTO states(key, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at""",
+                (key, blob, time.time()))
+        with self._lock:
+            self._counters["sets"] += 1
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.purge_expired()
+
+    def pop(self, key: str) -> Any | None:
+        value = self.get(key)
+        if value is not None:
+            self._delete(key)
+        return value
+
+    def _delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM states WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        """Удаляет просроченное и всё сверх max_entries (давно не обновлявшееся)."""
+        with self._connect() as conn:
+            expired = conn.execute("DELETE FROM states WHERE updated_at < ?",
+                                   (time.time() - self.ttl_s,)).rowcount
+            evicted = conn.execute(
+                """DELETE FROM states WHERE key IN (
+                    SELECT key FROM states ORDER BY updated_at DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,)).rowcount
+        self._count("expired", expired)
+        self._count("evicted", evicted)
+        return expired + evicted
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            live = conn.execute("SELECT COUNT(*) FROM states WHERE updated_at >= ?",
+                                (time.time() - self.ttl_s,)).fetchone()[0]
+        with self._lock:
+            return {"backend": "sqlite", "live": live, "max_entries": self.max_entries,
+                    "ttl_s": self.ttl_s, **self._counters}
+
+
+def make_store(backend: str = STATE_BACKEND):
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    raise ValueError(f"STATE_BACKEND: неизвестный бэкенд {backend!r} (sqlite или memory)")
+
+
+# ---------- шаги register_next_step_handler ----------
+def _main_module_name() -> str:
+    """Имя, под которым скрипт импортировался бы (main.py -> main); под ним же его ищет supervisor.py."""
+    path = getattr(sys.modules.get("__main__"), "__file__", None) or ""
+    return os.path.splitext(os.path.basename(path))[0] or "__main__"
+
+
+def _callback_ref(callback) -> str | None:
+    qualname = getattr(callback, "__qualname__", "")
+    module = getattr(callback, "__module__", None)
+    if not module or not qualname or "<" in qualname:   # lambda и вложенные функции по имени не найти
+        return None
+    if module in ("__main__", "__mp_main__"):
+        module = _main_module_name()
+    return f"{module}:{qualname}"
+
+
+def _resolve_callback(ref: str):
+    module_name, _, qualname = ref.partition(":")
+    module = sys.modules.get(module_name)
+    if module is None and module_name == _main_module_name():
+        module = sys.modules["__main__"]
+    if module is None:
+        raise LookupError(f"модуль {module_name} не загружен")
+    obj = module
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+class _StoredHandler:
+    """То же, что telebot.Handler (handler["callback"] и т.д.), но callback — по ссылке."""
+
+    def __init__(self, callback, args, kwargs) -> None:
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+
+    def __getitem__(self, item):
+        return getattr(self, item)
+
+
+class StepHandlerBackend(HandlerBackend):
+    """next_step_backend для TeleBot поверх MemoryStateStore / SQLiteStateStore (ключ — чат)."""
+
+    def __init__(self, store, prefix: str = "step") -> None:
+        super().__init__()
+        self.store = store
+        self.prefix = prefix
+
+    def _key(self, handler_group_id) -> str:
+        return f"{self.prefix}:{handler_group_id}"
+
+    def _encode(self, handler) -> dict:
+        ref = _callback_ref(handler.callback)
+        if ref is None:
+            if self.store.persistent:
+                raise ValueError(f"Шаг {handler.callback!r} нельзя сохранить: нужна функция уровня модуля")
+            ref = handler.callback   # в памяти можно хранить и сам объект
+        return {"callback": ref, "args": handler.args, "kwargs": handler.kwargs}
+
+    def register_handler(self, handler_group_id, handler) -> None:
+        key = self._key(handler_group_id)
+        handlers = self.store.get(key) or []
+        handlers.append(self._encode(handler))
+        self.store.set(key, handlers)
+
+    def clear_handlers(self, handler_group_id) -> None:
+        self.store.pop(self._key(handler_group_id))
+
+    def get_handlers(self, handler_group_id):
+        stored = self.store.pop(self._key(handler_group_id))
+        if not stored:
+            return None
+        handlers = []
+        for h in stored:
+            callback = h["callback"]
+            if isinstance(callback, str):
+                try:
+                    callback = _resolve_callback(callback)
+                except (LookupError, AttributeError) as e:
+                    log.warning("Step handler %s is gone, skipping: %r", h["callback"], e)
+                    continue
+            handlers.append(_StoredHandler(callback, h["args"], h["kwargs"]))
+        return handlers or None
+
+    def load_handlers(self, filename=None, del_file_after_loading=True) -> None:
+        pass   # шаги и так в хранилище; для совместимости с TeleBot.load_next_step_handlers
+
+
+# ---------- FSM: bot.set_state / get_state / add_data ----------
+class FSMStateStorage(StateStorageBase):
+    """state_storage для TeleBot поверх MemoryStateStore / SQLiteStateStore. Запись — {state, data}."""
+
+    def __init__(self, store, prefix: str = "fsm", separator: str = ":") -> None:
+        super().__init__()
+        self.store = store
+        self.prefix = prefix
+        self.separator = separator
+
+    def _k(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None) -> str:
+        return self._get_key(chat_id, user_id, self.prefix, self.separator,
+                             business_connection_id, message_thread_id, bot_id)
+
+    def set_state(self, chat_id, user_id, state, business_connection_id=None, message_thread_id=None,
+                  bot_id=None) -> bool:
+        if hasattr(state, "name"):
+            state = state.name
+        key = self._k(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        record = self.store.get(key) or {"state": None, "data": {}}
+        record["state"] = state
+        self.store.set(key, record)
+        return True
+
+    def get_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                  bot_id=None) -> Optional[str]:
+        record = self.store.get(self._k(chat_id, user_id, business_connection_id, message_thread_id, bot_id))
+        return record["state"] if record else None
+
+    def delete_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                     bot_id=None) -> bool:
+        return self.store.pop(self._k(chat_id, user_id, business_connection_id, message_thread_id, bot_id)) is not None
+
+    def set_data(self, chat_id, user_id, key, value, business_connection_id=None, message_thread_id=None,
+                 bot_id=None) -> bool:
+        skey = self._k(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        record = self.store.get(skey)
+        if record is None:
+            raise RuntimeError(f"FSMStateStorage: key {skey} does not exist.")
+        record["data"][key] = value
+        self.store.set(skey, record)
+        return True
+
+    def get_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                 bot_id=None) -> Dict:
+        record = self.store.get(self._k(chat_id, user_id, business_connection_id, message_thread_id, bot_id))
+        return record["data"] if record else {}
+
+    def reset_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                   bot_id=None) -> bool:
+        return self.save(chat_id, user_id, {}, business_connection_id, message_thread_id, bot_id)
+
+    def get_interactive_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None,
+                             bot_id=None) -> StateDataContext:
+        return StateDataContext(self, chat_id=chat_id, user_id=user_id,
+                                business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    def save(self, chat_id, user_id, data, business_connection_id=None, message_thread_id=None,
+             bot_id=None) -> bool:
+        key = self._k(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        record = self.store.get(key)
+        if record is None:
+            return False
+        record["data"] = data
+        self.store.set(key, record)
+        return True
+
+
+__all__ = ["MemoryStateStore", "SQLiteStateStore", "StepHandlerBackend", "FSMStateStorage",
+           "make_store", "STATE_BACKEND"]
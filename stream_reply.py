@@ -0,0 +1,160 @@
+"""
+stream_reply.py — ответ LLM в Telegram по мере генерации.
+
+Сначала отправляется заглушка «⏳ …», затем она редактируется через
+edit_message_text по мере прихода кусков из ai_client.chat_stream().
+Telegram ограничивает частоту правок (~1 в секунду на чат), поэтому правки
+троттлятся: не чаще EDIT_INTERVAL_S и только если текст изменился.
+Одновременные одинаковые запросы склеиваются (llm_cache.flights): стримит
+первый, остальные получают готовый ответ.
+
+reply_queued() — то же, но через llm_queue: заглушка отправляется сразу из
+потока-обработчика, а запрос к модели выполняется в пуле LLM.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import time
+from typing import Callable, Dict, List
+
+from telebot.apihelper import ApiTelegramException
+
+import llm_cache
+from ai_client import chat_stream, OpenRouterError
+from llm_queue import LLMJobQueue, QueueFull
+from model_router import router
+
+log = logging.getLogger(__name__)
+
+EDIT_INTERVAL_S = float(os.getenv("STREAM_EDIT_INTERVAL_S", "1.2"))
+MAX_LEN = 4000
+CURSOR = " ▌"
+
+
+class ThrottledEditor:
+    """Держит одно сообщение и правит его не чаще, чем раз в interval_s."""
+
+    def __init__(self, bot, chat_id: int, message_id: int, interval_s: float = EDIT_INTERVAL_S) -> None:
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval_s = interval_s
+        self._last_edit = 0.0
+        self._last_text = ""
+        self.edits = 0
+
+    def update(self, text: str, *, force: bool = False) -> None:
+        now = time.monotonic()
+        text = text[:MAX_LEN] or "…"
+        if text == self._last_text or (not force and now - self._last_edit < self.interval_s):
+            return
+        try:
+            self.bot.edit_message_text(text, self.chat_id, self.message_id)
+            self.edits += 1
+        except ApiTelegramException as e:
+            # «message is not modified» и 429 на промежуточной правке не критичны
+            log.debug("edit_message_text skipped: %r", e)
+            if force:
+                raise
+        self._last_edit = now
+        self._last_text = text
+
+
+def reply_streaming(bot, message, msgs: List[Dict], *,
+                    model: str,
+                    footer: Callable[[str], str],
+                    temperature: float = 0.2,
+                    max_tokens: int = 400,
+                    placeholder=None,
+                    fallback: bool = True,
+                    on_answer: Callable[[str], None] | None = None) -> None:
+    """
+    Отвечает на message потоком. footer(latency) возвращает подпись под ответом,
+    latency — строка вида «850 мс, первый токен 120 мс» или «0 мс (из кэша)».
+    Ошибки показываются в том же сообщении вместо заглушки.
+    placeholder — уже отправленная заглушка (иначе отправим «⏳ …» сами).
+    fallback — при 429/5xx отвечать другой моделью (model_router); False — только model.
+    on_answer(text) вызывается с готовым ответом (например, чтобы запомнить его в истории).
+    """
+    t0 = time.perf_counter()
+    cached = llm_cache.lookup(msgs, model=model, temperature=temperature, max_tokens=max_tokens)
+    if cached is not None:
+        ms = int((time.perf_counter() - t0) * 1000)
+        text = f"{cached.strip()[:MAX_LEN - 200]}\n\n{footer(f'{ms} мс (из кэша)')}"
+        if placeholder is None:
+            bot.reply_to(message, text)
+        else:
+            ThrottledEditor(bot, placeholder.chat.id, placeholder.message_id).update(text, force=True)
+        if on_answer:
+            on_answer(cached.strip())
+        return
+
+    if placeholder is None:
+        placeholder = bot.reply_to(message, "⏳ …")
+    editor = ThrottledEditor(bot, placeholder.chat.id, placeholder.message_id)
+
+    def _stream():
+        if fallback:
+            stream, used = router.open_stream(msgs, preferred=model, temperature=temperature, max_tokens=max_tokens)
+        else:
+            stream, used = chat_stream(msgs, model=model, temperature=temperature, max_tokens=max_tokens), model
+        try:
+            for _ in stream:
+                editor.update(stream.text.strip() + CURSOR)
+        except OpenRouterError as e:
+            router.record(used, stream.total_ms or 0, e)
+            raise
+        router.record(used, stream.total_ms)
+        return stream, used
+
+    # Такой же запрос уже идёт (другой пользователь спросил то же самое) — ждём его ответ.
+    # С fallback может ответить запасная модель, поэтому /ask_model к /ask не присоединяется.
+    key = llm_cache.request_key(msgs, model=model, temperature=temperature, max_tokens=max_tokens)
+    if fallback:
+        key += ":fallback"
+    try:
+        (stream, used), shared = llm_cache.flights.do(key, _stream)
+    except OpenRouterError as e:
+        editor.update(f"Ошибка: {e}", force=True)
+        return
+    except Exception as e:
+        log.exception("LLM stream failed: %r", e)
+        editor.update("Непредвиденная ошибка.", force=True)
+        return
+
+    text = stream.text.strip()
+    note = f"; ответила запасная модель {used}" if used != model else ""
+    if shared:
+        ms = int((time.perf_counter() - t0) * 1000)
+        editor.update(f"{text[:MAX_LEN - 200] or '(пустой ответ)'}\n\n{footer(f'{ms} мс (общий запрос){note}')}",
+                      force=True)
+        if on_answer and text:
+            on_answer(text)
+        return
+    if used == model:
+        llm_cache.store(msgs, text, model=model, temperature=temperature, max_tokens=max_tokens)
+    log.info("LLM stream: model=%s ttft=%sms total=%sms edits=%d", used, stream.ttft_ms, stream.total_ms, editor.edits)
+    latency = f"{stream.total_ms} мс, первый токен {stream.ttft_ms if stream.ttft_ms is not None else '—'} мс{note}"
+    body = text[:MAX_LEN - 200] or "(пустой ответ)"
+    editor.update(f"{body}\n\n{footer(latency)}", force=True)
+    if on_answer and text:
+        on_answer(text)
+
+
+def reply_queued(bot, jobs: LLMJobQueue, message, msgs: List[Dict], **kwargs) -> None:
+    """
+    Сразу отвечает «думаю…» и ставит reply_streaming(...) в очередь LLM от имени
+    автора сообщения; поток-обработчик TeleBot освобождается немедленно.
+    """
+    ahead = jobs.depth
+    ack = "⏳ Думаю…" + (f" (в очереди: {ahead})" if ahead else "")
+    placeholder = bot.reply_to(message, ack)
+    try:
+        jobs.submit(message.from_user.id,
+                    lambda: reply_streaming(bot, message, msgs, placeholder=placeholder, **kwargs))
+    except QueueFull as e:
+        bot.edit_message_text(str(e), placeholder.chat.id, placeholder.message_id)
+
+
+__all__ = ["reply_streaming", "reply_queued", "ThrottledEditor", "EDIT_INTERVAL_S"]
@@ -0,0 +1,377 @@
+"""
+supervisor.py — один бот в нескольких процессах с разбиением пользователей по шардам.
+
+Было: main*.py — один процесс. GIL, один поток long polling и один писатель
+SQLite ограничивают пропускную способность, сколько бы ядер ни было.
+Стало: supervisor один принимает апдейты (long polling getUpdates или webhook,
+см. BOT_MODE) и раздаёт их N процессам-воркерам по user_id % N:
+  - апдейты одного пользователя всегда в одном процессе и по порядку, поэтому
+    register_next_step_handler, LRU-кэши по пользователю и очередь LLM работают как раньше;
+  - общее состояние (активная модель, персонажи) — в SQLite, кэши процессов
+    сверяются по registry_version (см. db._sync_registry_cache);
+  - воркер — обычный модуль бота (main, main2, main3): импортируется в новом
+    интерпретаторе, startup(primary, workers) модуля (если есть) вызывается в каждом,
+    фоновые задачи (планировщик, чистка истории, меню команд) — только в воркере 0;
+  - воркер 0 стартует первым и успевает выполнить миграции БД до остальных;
+  - SIGHUP — поочерёдный перезапуск воркеров (новый код без простоя): старый процесс
+    дорабатывает уже полученные апдейты своего шарда, новые ждут в очереди шарда;
+  - SIGTERM / SIGINT — мягкая остановка: воркеры дорабатывают очередь, ждут
+    обработчики TeleBot и shutdown() модуля (ответы LLM), через SUPERVISOR_SHUTDOWN_S — kill;
+  - упавший воркер перезапускается с паузой, апдейты его шарда ждут в очереди
+    (пропадает только то, что он уже забрал, но не обработал). Здоровье воркеров
+    проверяет отдельный поток раз в HEALTH_CHECK_S, поэтому приём апдейтов
+    не ждёт ни long polling, ни запуска нового процесса.
+
+    python supervisor.py main2 [--workers 4]
+
+SUPERVISOR_WORKERS — число воркеров (по умолчанию — число ядер), SUPERVISOR_QUEUE_SIZE —
+апдейтов в очереди шарда (полная очередь тормозит приём, а не теряет апдейты).
+METRICS_PORT у воркера i — METRICS_PORT + i. Если RATE_LIMIT_DB_PATH не задан, воркеры
+получают SUPERVISOR_RATE_LIMIT_DB_PATH (ratelimit.db): общий на все процессы лимит LLM.
+"""
+
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Any, List
+
+import telebot
+from dotenv import load_dotenv
+
+import runner
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", str(os.cpu_count() or 2)))
+SUPERVISOR_QUEUE_SIZE = int(os.getenv("SUPERVISOR_QUEUE_SIZE", "10000"))
+SUPERVISOR_SHUTDOWN_S = float(os.getenv("SUPERVISOR_SHUTDOWN_S", "30"))
+SUPERVISOR_POLL_TIMEOUT_S = int(os.getenv("SUPERVISOR_POLL_TIMEOUT_S", "10"))
+SUPERVISOR_RATE_LIMIT_DB_PATH = os.getenv("SUPERVISOR_RATE_LIMIT_DB_PATH", "ratelimit.db")
+STARTUP_TIMEOUT_S = 120.0
+RESTART_BACKOFF_S = (1.0, 30.0)   # пауза перед перезапуском упавшего воркера: от и до
+HEALTH_CHECK_S = 0.5               # как часто поток-монитор проверяет воркеры
+BATCH = 100                        # апдейтов за раз в process_new_updates воркера
+
+# Поля апдейта, в которых есть отправитель (from) или хотя бы чат
+_UPDATE_KINDS = ("message", "edited_message", "callback_query", "inline_query",
+                 "chosen_inline_result", "channel_post", "edited_channel_post",
+                 "my_chat_member", "chat_member", "chat_join_request",
+                 "shipping_query", "pre_checkout_query", "poll_answer")
+
+
+def shard_of(update: dict, workers: int) -> int:
+    """Номер воркера для апдейта: user_id % workers (нет пользователя — по чату, иначе 0)."""
+    for kind in _UPDATE_KINDS:
+        obj = update.get(kind)
+        if obj:
+            sender = obj.get("from") or obj.get("user") or obj.get("chat") \
+                or (obj.get("message") or {}).get("chat") or {}
+            return int(sender.get("id") or 0) % workers
+    return 0
+
+
+# ---------- процесс-воркер ----------
+def _drain_pool(bot, deadline: float) -> None:
+    """Дождаться задач, уже отданных в пул потоков TeleBot, и остановить его."""
+    pool = getattr(bot, "worker_pool", None)
+    if pool is None:
+        return
+    while not pool.tasks.empty() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    pool.close()   # выполняющиеся обработчики дорабатывают, close их дожидается
+
+
+def _next_batch(updates) -> tuple[list, bool]:
+    """До BATCH апдейтов подряд; второе — встретился None (пора останавливаться; дальше не читаем)."""
+    batch: list = []
+    try:
+        item = updates.recv()
+    except EOFError:                 # supervisor умер — выходим, а не висим сиротой
+        return batch, True
+    while item is not None:
+        batch.append(item)
+        if len(batch) >= BATCH or not updates.poll():
+            return batch, False
+        item = updates.recv()
+    return batch, True
+
+
+def _worker_main(module: str, index: int, workers: int, updates, ready) -> None:
+    # Ctrl+C приходит всей группе процессов; останавливает воркеры supervisor (None в очереди)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    base_port = int(os.getenv("METRICS_PORT", "0"))
+    if base_port:
+        os.environ["METRICS_PORT"] = str(base_port + index)
+    # ведро запросов к OpenRouter — одно на все воркеры (ratelimit.py), а не по ведру на процесс
+    os.environ.setdefault("RATE_LIMIT_DB_PATH", SUPERVISOR_RATE_LIMIT_DB_PATH)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format=f"%(asctime)s [{module}#{index}] %(levelname)s %(name)s: %(message)s")
+
+    mod = importlib.import_module(module)
+    bot = mod.bot
+    startup = getattr(mod, "startup", None)
+    if startup is not None:
+        startup(primary=index == 0, workers=workers)
+    ready.set()
+
+    stopping = False
+    while not stopping:
+        batch, stopping = _next_batch(updates)
+        if batch:
+            try:
+                bot.process_new_updates([telebot.types.Update.de_json(u) for u in batch])
+            except Exception as e:
+                log.exception("Worker %d: batch failed: %r", index, e)
+
+    deadline = time.monotonic() + SUPERVISOR_SHUTDOWN_S
+    _drain_pool(bot, deadline)
+    shutdown = getattr(mod, "shutdown", None)
+    if shutdown is not None:
+        shutdown()
+
+
+# ---------- supervisor ----------
+class _Shard:
+    """
+    Канал апдейтов одного воркера: очередь в supervisor (до SUPERVISOR_QUEUE_SIZE) и Pipe
+    в процесс. У каждого шарда свой поток-отправитель, поэтому занятой воркер тормозит
+    только свой шард. Pipe переживает воркер: перезапущенный читает то, что не успел
+    прежний. Не multiprocessing.Queue: воркер, убитый посреди get(), навсегда оставляет
+    её блокировку занятой.
+    """
+
+    def __init__(self, ctx, index: int, size: int) -> None:
+        self.buffer: "queue.Queue[dict | None]" = queue.Queue(maxsize=size)
+        self.reader, self.writer = ctx.Pipe(duplex=False)
+        threading.Thread(target=self._send_loop, name=f"shard-{index}", daemon=True).start()
+
+    def put(self, update: dict | None) -> None:
+        self.buffer.put(update)     # очередь полна — ждём: приём тормозит, апдейты не теряются
+
+    def _send_loop(self) -> None:
+        while True:
+            item = self.buffer.get()
+            self.writer.send(item)       # блокируется, пока воркер не дочитает канал
+
+
+class Supervisor:
+    """Держит воркеры и раздаёт им апдейты; process_new_updates — для runner.WebhookServer."""
+
+    def __init__(self, module: str, workers: int = SUPERVISOR_WORKERS) -> None:
+        self.module = module
+        self.workers = max(1, workers)
+        # spawn, а не fork: воркеры перезапускаются, когда в supervisor уже работают потоки
+        self._ctx = mp.get_context("spawn")
+        self.shards = [_Shard(self._ctx, i, SUPERVISOR_QUEUE_SIZE) for i in range(self.workers)]
+        self.procs: List[Any] = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        self._failures = [0] * self.workers
+        self._restart_at = [0.0] * self.workers
+        self.stats = {"routed": [0] * self.workers, "restarts": 0, "crashes": 0}
+        self._restart_requested = False
+        self._restarting: int | None = None   # воркер, который сейчас перезапускается поочерёдно
+        self._restart_thread: threading.Thread | None = None
+        self._monitor: threading.Thread | None = None
+        # _spawn и решение «кого перезапускать» — из монитора и из rolling_restart, по одному
+        self._spawn_lock = threading.RLock()
+        self.stop_event = threading.Event()
+
+    # --- воркеры ---
+    def _spawn(self, i: int) -> None:
+        with self._spawn_lock:
+            self._spawn_locked(i)
+
+    def _spawn_locked(self, i: int) -> None:
+        ready = self._ctx.Event()
+        p = self._ctx.Process(target=_worker_main, name=f"{self.module}-worker-{i}",
+                              args=(self.module, i, self.workers, self.shards[i].reader, ready))
+        self._started_at[i] = time.monotonic()
+        p.start()
+        self.procs[i] = p
+        while not ready.wait(0.5):
+            if not p.is_alive():
+                raise RuntimeError(f"Воркер {i} завершился при запуске (код {p.exitcode})")
+            if time.monotonic() - self._started_at[i] > STARTUP_TIMEOUT_S:
+                raise RuntimeError(f"Воркер {i} не запустился за {STARTUP_TIMEOUT_S:.0f} с")
+        log.info("Worker %d started (pid %d)", i, p.pid)
+
+    def _join_worker(self, i: int) -> None:
+        p = self.procs[i]
+        if p is None:
+            return
+        p.join(SUPERVISOR_SHUTDOWN_S + 5)
+        if p.is_alive():
+            log.warning("Worker %d did not stop in time, killing", i)
+            p.kill()
+            p.join()
+        self.procs[i] = None
+
+    def start(self) -> None:
+        for i in range(self.workers):   # строго по очереди: воркер 0 делает миграции
+            self._spawn(i)
+        self._monitor = threading.Thread(target=self._monitor_loop, name="supervisor-monitor", daemon=True)
+        self._monitor.start()
+
+    def _monitor_loop(self) -> None:
+        while not self.stop_event.wait(HEALTH_CHECK_S):
+            try:
+                self.check_workers()
+            except Exception as e:
+                log.exception("Worker health check failed: %r", e)
+
+    def rolling_restart(self) -> None:
+        """По одному: None в очередь шарда (после уже полученных апдейтов), ждём выхода, запускаем новый."""
+        log.info("Rolling restart of %d workers", self.workers)
+        try:
+            for i in range(self.workers):
+                if self.stop_event.is_set():
+                    return
+                with self._spawn_lock:
+                    self._restarting = i
+                if self.procs[i] is not None and self.procs[i].is_alive():
+                    self.shards[i].put(None)
+                self._join_worker(i)
+                self._spawn(i)
+                self.stats["restarts"] += 1
+        except RuntimeError as e:
+            log.error("Rolling restart aborted: %s", e)
+        finally:
+            self._restarting = None
+
+    def check_workers(self) -> None:
+        """SIGHUP — поочерёдный перезапуск в фоне; упавшие воркеры — заново, с растущей паузой."""
+        if self._restart_requested and not (self._restart_thread and self._restart_thread.is_alive()):
+            self._restart_requested = False
+            self._restart_thread = threading.Thread(target=self.rolling_restart, name="rolling-restart", daemon=True)
+            self._restart_thread.start()
+        now = time.monotonic()
+        for i, p in enumerate(self.procs):
+            if i == self._restarting:
+                continue
+            if p is None or p.is_alive():
+                if p is not None and now - self._started_at[i] > RESTART_BACKOFF_S[1]:
+                    self._failures[i] = 0       # проработал дольше максимальной паузы — здоров
+                continue
+            if not self._restart_at[i]:
+                self.stats["crashes"] += 1
+                self._failures[i] += 1
+                delay = min(RESTART_BACKOFF_S[1], RESTART_BACKOFF_S[0] * 2 ** (self._failures[i] - 1))
+                self._restart_at[i] = now + delay
+                log.error("Worker %d exited with code %s, restart in %.0f s", i, p.exitcode, delay)
+            elif now >= self._restart_at[i]:
+                with self._spawn_lock:
+                    if self.stop_event.is_set() or i == self._restarting or self.procs[i] is not p:
+                        continue        # воркером уже занимается rolling_restart или stop
+                    self._restart_at[i] = 0.0
+                    try:
+                        self._spawn(i)
+                    except RuntimeError as e:
+                        log.error("%s", e)
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        if self._restart_thread is not None:
+            self._restart_thread.join()
+        for i, p in enumerate(self.procs):
+            if p is not None and p.is_alive():
+                self.shards[i].put(None)     # все сразу: воркеры дорабатывают параллельно
+        for i in range(self.workers):
+            self._join_worker(i)
+
+    # --- маршрутизация ---
+    def process_new_updates(self, updates: List[dict]) -> None:
+        for update in updates:
+            i = shard_of(update, self.workers)
+            self.stats["routed"][i] += 1
+            self.shards[i].put(update)
+
+    def install_signals(self) -> None:
+        def on_stop(signum, frame):
+            log.info("Signal %d: stopping", signum)
+            self.stop_event.set()
+
+        def on_hup(signum, frame):
+            self._restart_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_hup)
+
+
+def run_polling(sup: Supervisor, token: str) -> None:
+    """Единственный getUpdates на всех воркеров (как infinity_polling(skip_pending=True))."""
+    pending = telebot.apihelper.get_updates(token, offset=-1, timeout=SUPERVISOR_POLL_TIMEOUT_S + 5)
+    offset = pending[-1]["update_id"] + 1 if pending else None
+    errors = 0
+    while not sup.stop_event.is_set():
+        try:
+            updates = telebot.apihelper.get_updates(token, offset=offset, timeout=SUPERVISOR_POLL_TIMEOUT_S + 5,
+                                                    long_polling_timeout=SUPERVISOR_POLL_TIMEOUT_S)
+            errors = 0
+        except Exception as e:
+            errors += 1
+            log.warning("getUpdates failed: %r", e)
+            sup.stop_event.wait(min(30, 2 ** errors))
+            continue
+        if updates:
+            offset = updates[-1]["update_id"] + 1
+            sup.process_new_updates(updates)
+
+
+def run_webhook(sup: Supervisor, token: str) -> None:
+    server = runner.WebhookServer(sup, parse=json.loads)
+    server.start_workers()
+    runner.register_webhook(telebot.TeleBot(token, threaded=False))
+    threading.Thread(target=server.serve_forever, name="webhook-server", daemon=True).start()
+    log.info("Webhook mode: listening on %s:%d%s", runner.WEBHOOK_LISTEN, runner.WEBHOOK_PORT, runner.WEBHOOK_PATH)
+    try:
+        while not sup.stop_event.wait(0.5):   # с таймаутом — чтобы сигналы обрабатывались вовремя
+            pass
+    finally:
+        server.shutdown()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Бот в нескольких процессах с шардированием по user_id")
+    ap.add_argument("module", help="модуль бота: main, main2, main3")
+    ap.add_argument("--workers", type=int, default=SUPERVISOR_WORKERS)
+    args = ap.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                        format="%(asctime)s [supervisor] %(levelname)s %(name)s: %(message)s")
+    token = os.getenv("TOKEN")
+    if not token:
+        raise RuntimeError("В .env файле нет TOKEN")
+    runner.configure_api_url()
+
+    sup = Supervisor(args.module, args.workers)
+    sup.install_signals()
+    try:
+        sup.start()
+        log.info("%s: %d workers, mode %s", args.module, sup.workers, runner.BOT_MODE)
+        if runner.BOT_MODE == "webhook":
+            run_webhook(sup, token)
+        else:
+            run_polling(sup, token)
+    finally:
+        sup.stop()
+    log.info("Stopped: routed %s, restarts %d, crashes %d",
+             sup.stats["routed"], sup.stats["restarts"], sup.stats["crashes"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
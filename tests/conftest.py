@@ -0,0 +1,26 @@
+"""
+Общая настройка тестов: модули бота лежат в корне репозитория и читают
+окружение при импорте, поэтому БД и внешние адреса подменяются до первого импорта.
+
+    python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="bot_tests_")
+os.environ.update(
+    TOKEN="123456:test",
+    DB_PATH=os.path.join(_tmp, "bot.db"),
+    LLM_CACHE_PATH=os.path.join(_tmp, "llm_cache.db"),
+    STATE_DB_PATH=os.path.join(_tmp, "state.db"),
+    OPENROUTER_API_URL="http://127.0.0.1:9/api/v1/chat/completions",
+    OPENROUTER_API_KEY="test",
+    METRICS_PORT="0",
+    RATE_LIMIT_LLM="off",
+    RATE_LIMIT_DB_PATH="",
+)
@@ -0,0 +1,13 @@
+"""Модуль-воркер для tests/test_supervisor.py: записывает update_id в файл своего процесса."""
+
+import os
+
+
+class _Bot:
+    def process_new_updates(self, updates) -> None:
+        with open(os.path.join(os.environ["FAKE_BOT_DIR"], f"{os.getpid()}.txt"), "a") as f:
+            for u in updates:
+                f.write(f"{u.update_id}\n")
+
+
+bot = _Bot()
@@ -0,0 +1,12 @@
+import runner
+
+
+def test_admin_commands_closed_without_admin_ids(monkeypatch):
+    monkeypatch.setattr(runner, "ADMIN_IDS", set())
+    assert not runner.is_admin(1)
+
+
+def test_only_listed_admins(monkeypatch):
+    monkeypatch.setattr(runner, "ADMIN_IDS", {42})
+    assert runner.is_admin(42)
+    assert not runner.is_admin(43)
@@ -0,0 +1,80 @@
+import json
+import sqlite3
+
+import pytest
+
+import ai_client
+from ai_client import ChatStream, OpenRouterError
+
+
+class _FakeResponse:
+    def __init__(self, *events) -> None:
+        self.lines = [b"data: " + json.dumps(e).encode() for e in events] + [b"data: [DONE]"]
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _delta(text: str) -> dict:
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+def test_stream_collects_text():
+    stream = ChatStream(_FakeResponse(_delta("при"), _delta("вет")), 0.0)
+    assert list(stream) == ["при", "вет"]
+    assert stream.text == "привет"
+
+
+@pytest.mark.parametrize("error, status", [
+    ({"code": 429, "message": "rate limited"}, 429),
+    ({"code": "502"}, 502),
+    ({"code": "rate_limit_exceeded", "message": "slow down"}, 500),
+    ({"message": "no code"}, 500),
+    ({"code": 99999}, 500),
+    ("plain string error", 500),
+])
+def test_stream_error_chunk_becomes_openrouter_error(error, status):
+    response = _FakeResponse(_delta("на"), {"error": error})
+    with pytest.raises(OpenRouterError) as exc:
+        list(ChatStream(response, 0.0))
+    assert exc.value.status == status
+    assert exc.value.msg == ai_client._friendly(status)
+
+
+def test_rate_limit_while_half_open_frees_the_probe(monkeypatch):
+    breaker = ai_client.get_breaker("test/half-open")
+    monkeypatch.setattr(breaker, "reset_timeout_s", 0.0)
+    for _ in range(breaker.failure_threshold):
+        breaker.on_failure()
+    assert breaker.state == "open"
+
+    monkeypatch.setattr(ai_client, "llm_slot", lambda: 7.0)
+    with pytest.raises(ai_client.RateLimitedError):
+        ai_client._guarded("test/half-open", lambda: "не должно вызываться", attempts=1)
+    assert breaker.state == "half_open"
+
+    monkeypatch.setattr(ai_client, "llm_slot", lambda: 0.0)
+    assert ai_client._guarded("test/half-open", lambda: "ok", attempts=1) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_slot_error_while_half_open_frees_the_probe(monkeypatch):
+    breaker = ai_client.get_breaker("test/half-open-error")
+    monkeypatch.setattr(breaker, "reset_timeout_s", 0.0)
+    for _ in range(breaker.failure_threshold):
+        breaker.on_failure()
+
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(ai_client, "llm_slot", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        ai_client._guarded("test/half-open-error", lambda: "не должно вызываться", attempts=1)
+
+    monkeypatch.setattr(ai_client, "llm_slot", lambda: 0.0)
+    assert ai_client._guarded("test/half-open-error", lambda: "ok", attempts=1) == "ok"
+    assert breaker.state == "closed"
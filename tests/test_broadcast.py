@@ -0,0 +1,77 @@
+import requests
+from telebot.apihelper import ApiTelegramException
+
+from broadcast import Broadcaster
+
+
+def _api_error(code: int, description: str, retry_after: int | None = None) -> ApiTelegramException:
+    result = {"ok": False, "error_code": code, "description": description}
+    if retry_after is not None:
+        result["parameters"] = {"retry_after": retry_after}
+    return ApiTelegramException("sendMessage", None, result)
+
+
+def _broadcaster(send, marked, **kwargs) -> Broadcaster:
+    return Broadcaster(send, on_done=marked.extend, rate=10_000, workers=2, batch_size=2,
+                       backoff_s=0, **kwargs)
+
+
+def test_permanent_errors_are_marked_done():
+    def send(uid, text):
+        if uid == 1:
+            raise _api_error(403, "Forbidden: bot was blocked by the user")
+        if uid == 2:
+            raise _api_error(400, "Bad Request: chat not found")
+
+    marked = []
+    stats = _broadcaster(send, marked).run([(1, "t"), (2, "t"), (3, "t")])
+    assert (stats.sent, stats.failed, stats.retried, stats.gave_up) == (1, 2, 0, 0)
+    assert sorted(marked) == [1, 2, 3]
+
+
+def test_transient_errors_are_retried_then_left_unmarked():
+    calls = {}
+
+    def send(uid, text):
+        calls[uid] = calls.get(uid, 0) + 1
+        if uid == 1 and calls[uid] == 1:
+            raise requests.exceptions.ConnectionError("reset")       # второй раз пройдёт
+        if uid == 2:
+            raise _api_error(502, "Bad Gateway")                     # не пройдёт никогда
+        if uid == 3:
+            raise requests.exceptions.ReadTimeout("timeout")
+
+    marked = []
+    stats = _broadcaster(send, marked, max_retries=2).run([(1, "t"), (2, "t"), (3, "t")])
+    assert stats.sent == 1 and stats.gave_up == 2 and stats.failed == 0
+    assert marked == [1]
+    assert calls == {1: 2, 2: 3, 3: 3}
+
+
+def test_too_many_requests_waits_retry_after():
+    calls = []
+
+    def send(uid, text):
+        calls.append(uid)
+        if len(calls) == 1:
+            raise _api_error(429, "Too Many Requests", retry_after=0)
+
+    marked = []
+    stats = _broadcaster(send, marked).run([(1, "t")])
+    assert stats.sent == 1 and stats.retried == 1 and marked == [1]
+
+
+def test_failed_marking_is_reported_not_dropped():
+    attempts = []
+
+    def on_done(batch):
+        attempts.append(list(batch))
+        raise RuntimeError("database is locked")
+
+    b = Broadcaster(lambda uid, text: None, on_done=on_done, rate=10_000, workers=1, batch_size=10,
+                    max_retries=1, backoff_s=0)
+    stats = b.run([(1, "t"), (2, "t")])
+    assert stats.sent == 2 and stats.unmarked == 2
+    assert sorted(b.unmarked) == [1, 2]
+    assert len(attempts) == 2                         # первая попытка + один повтор
+
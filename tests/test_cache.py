@@ -0,0 +1,62 @@
+import threading
+
+import db
+from cache import LRUCache, MISSING
+
+
+def _racing_load(cache: LRUCache, write) -> tuple[object, object]:
+    """get_or_load, во время которого (после чтения «из БД») происходит write()."""
+    started, proceed = threading.Event(), threading.Event()
+    result = {}
+
+    def loader():
+        started.set()
+        proceed.wait(5)
+        return "stale"
+
+    t = threading.Thread(target=lambda: result.setdefault("value", cache.get_or_load("k", loader)))
+    t.start()
+    started.wait(5)
+    write()
+    proceed.set()
+    t.join(5)
+    return result["value"], cache.get("k")
+
+
+def test_get_or_load_caches_value():
+    cache = LRUCache(maxsize=2)
+    assert cache.get_or_load("k", lambda: 1) == 1
+    assert cache.get_or_load("k", lambda: 2) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_load_racing_clear_is_not_cached():
+    cache = LRUCache(maxsize=2)
+    returned, cached = _racing_load(cache, cache.clear)
+    assert returned == "stale"
+    assert cached is MISSING
+    assert cache.stats()["stale_loads"] == 1
+
+
+def test_load_racing_set_keeps_written_value():
+    cache = LRUCache(maxsize=2)
+    returned, cached = _racing_load(cache, lambda: cache.set("k", "fresh"))
+    assert cached == "fresh"
+
+
+def test_active_model_not_stale_after_concurrent_switch(monkeypatch):
+    db.init_db()
+    first, second = [m["id"] for m in db.list_models()[:2]]
+    db.set_active_model(first)
+    db._models_cache.clear()
+    original = db._load_active_model
+
+    def racing_load():
+        stale = original()
+        monkeypatch.setattr(db, "_load_active_model", original)
+        db.set_active_model(second)    # переключили модель, пока читатель нёс старое значение
+        return stale
+
+    monkeypatch.setattr(db, "_load_active_model", racing_load)
+    assert db.get_active_model()["id"] == first
+    assert db.get_active_model()["id"] == second
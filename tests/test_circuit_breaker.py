@@ -0,0 +1,99 @@
+import pytest
+
+import ai_client
+from ai_client import CircuitOpenError, OpenRouterError
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def _tripped(reset_timeout_s: float = 0.0) -> CircuitBreaker:
+    cb = CircuitBreaker("test", failure_threshold=3, reset_timeout_s=reset_timeout_s)
+    for _ in range(3):
+        assert cb.allow()
+        cb.on_failure()
+    return cb
+
+
+def test_opens_after_threshold_consecutive_failures():
+    cb = CircuitBreaker("test", failure_threshold=3, reset_timeout_s=60)
+    cb.on_failure()
+    cb.on_failure()
+    cb.on_success()                     # успех обнуляет счётчик «подряд»
+    cb.on_failure()
+    cb.on_failure()
+    assert cb.state == CLOSED
+    cb.on_failure()
+    assert cb.state == OPEN
+    assert not cb.allow()
+    assert cb.rejected == 1
+    assert 0 < cb.retry_in() <= 60
+
+
+def test_half_open_lets_exactly_one_probe_through():
+    cb = _tripped()
+    assert cb.allow()
+    assert cb.state == HALF_OPEN
+    assert not cb.allow()               # второй вызов ждёт исхода пробного
+    cb.on_success()
+    assert cb.state == CLOSED
+    assert cb.allow() and cb.allow()
+    assert cb.stats()["transitions"] == {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1}
+
+
+def test_failed_probe_reopens():
+    cb = _tripped()
+    assert cb.allow()
+    cb.on_failure()
+    assert cb.state == OPEN
+    assert cb.allow()                   # reset_timeout_s=0: сразу новый пробный вызов
+    assert cb.state == HALF_OPEN
+
+
+def test_released_probe_goes_to_next_caller():
+    cb = _tripped()
+    assert cb.allow()
+    cb.release()
+    assert cb.state == HALF_OPEN
+    assert cb.allow()
+
+
+def test_guarded_short_circuits_open_breaker(monkeypatch):
+    breaker = ai_client.get_breaker("test/short-circuit")
+    monkeypatch.setattr(breaker, "failure_threshold", 2)
+    monkeypatch.setattr(breaker, "reset_timeout_s", 60.0)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise OpenRouterError(502, "bad gateway")
+
+    for _ in range(2):
+        with pytest.raises(OpenRouterError):
+            ai_client._guarded("test/short-circuit", failing, attempts=1)
+    with pytest.raises(CircuitOpenError) as exc:
+        ai_client._guarded("test/short-circuit", failing, attempts=1)
+    assert exc.value.status == 503
+    assert len(calls) == 2              # третий раз в сеть не ходили
+
+
+def test_guarded_client_errors_do_not_trip_breaker():
+    breaker = ai_client.get_breaker("test/client-error")
+
+    def rejected():
+        raise OpenRouterError(400, "bad request")
+
+    for _ in range(breaker.failure_threshold + 1):
+        with pytest.raises(OpenRouterError):
+            ai_client._guarded("test/client-error", rejected, attempts=1)
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.parametrize("attempts", [0, -2])
+def test_guarded_makes_at_least_one_attempt(attempts, monkeypatch):
+    monkeypatch.setattr(ai_client, "RETRY_ATTEMPTS", 0)
+
+    def failing():
+        raise OpenRouterError(502, "bad gateway")
+
+    assert ai_client._guarded("test/attempts", lambda: "ok", attempts=attempts) == "ok"
+    with pytest.raises(OpenRouterError):
+        ai_client._guarded("test/attempts", failing, attempts=attempts)
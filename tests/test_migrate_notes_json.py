@@ -0,0 +1,50 @@
+import json
+import os
+
+import db
+import migrate_notes_json
+from note_journal import read_notes
+
+
+def _legacy(tmp_path) -> str:
+    path = str(tmp_path / "notes.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"notes": {"1": "молоко", "2": "хлеб"}, "counter": 3}, f, ensure_ascii=False)
+    with open(path + ".log", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "set", "id": 3, "text": "встреча"}, ensure_ascii=False) + "\n")
+        f.write(json.dumps({"op": "del", "id": 1}) + "\n")
+        f.write('{"op": "set", "id": 4, "te')          # оборванная запись
+    return path
+
+
+def test_read_notes_replays_journal_without_touching_files(tmp_path):
+    path = _legacy(tmp_path)
+    size = os.path.getsize(path + ".log")
+    assert read_notes(path) == {2: "хлеб", 3: "встреча"}
+    assert os.path.getsize(path + ".log") == size
+
+
+def test_startup_migration_runs_once(tmp_path):
+    db.init_db()
+    path = _legacy(tmp_path)
+    stats = migrate_notes_json.migrate_on_startup(path, owner_id=501)
+    assert stats["inserted"] == 2
+    assert sorted(n["text"] for n in db.list_notes(501)) == ["встреча", "хлеб"]
+
+    note_id = db.list_notes(501)[0]["id"]
+    db.delete_note(501, note_id)
+    assert migrate_notes_json.migrate_on_startup(path, owner_id=501) is None
+    assert db.count_notes(501) == 1                 # удалённая заметка не вернулась
+
+
+def test_startup_migration_needs_owner(tmp_path, monkeypatch):
+    db.init_db()
+    monkeypatch.delenv("NOTES_JSON_OWNER_ID", raising=False)
+    monkeypatch.setenv("ADMIN_IDS", "1,2")
+    path = _legacy(tmp_path)
+    assert migrate_notes_json.migrate_on_startup(path) is None
+    assert db.get_legacy_import(os.path.abspath(path)) is None
+
+    monkeypatch.setenv("ADMIN_IDS", "777")
+    assert migrate_notes_json.migrate_on_startup(path)["inserted"] == 2
+    assert db.count_notes(777) == 2
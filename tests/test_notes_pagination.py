@@ -0,0 +1,59 @@
+import db
+
+
+def _notes(user_id: int, texts) -> list[int]:
+    db.init_db()
+    return [db.add_note(user_id, text) for text in texts]
+
+
+def _ids(rows) -> list[int]:
+    return [r["id"] for r in rows]
+
+
+def test_list_pages_walk_back_and_forth():
+    ids = _notes(701, [f"заметка {i}" for i in range(7)])
+    newest_first = ids[::-1]
+
+    rows, older, newer = db.list_notes_page(701, limit=3)
+    assert _ids(rows) == newest_first[:3] and older and not newer
+
+    rows, older, newer = db.list_notes_page(701, before_id=rows[-1]["id"], limit=3)
+    assert _ids(rows) == newest_first[3:6] and older and newer
+
+    last, older, newer = db.list_notes_page(701, before_id=rows[-1]["id"], limit=3)
+    assert _ids(last) == newest_first[6:] and not older and newer
+
+    rows, older, newer = db.list_notes_page(701, after_id=last[0]["id"], limit=3)
+    assert _ids(rows) == newest_first[3:6] and older and newer
+
+    rows, older, newer = db.list_notes_page(701, after_id=rows[0]["id"], limit=3)
+    assert _ids(rows) == newest_first[:3] and older and not newer
+
+
+def test_exact_page_boundary_has_no_phantom_page():
+    ids = _notes(702, ["a", "b", "c", "d"])
+    rows, older, newer = db.list_notes_page(702, limit=2)
+    rows, older, newer = db.list_notes_page(702, before_id=rows[-1]["id"], limit=2)
+    assert _ids(rows) == ids[1::-1] and not older and newer
+
+
+def test_after_cursor_past_newest_falls_back_to_first_page():
+    ids = _notes(703, ["x", "y"])
+    db.delete_note(703, ids[1])
+    rows, older, newer = db.list_notes_page(703, after_id=ids[0], limit=5)
+    assert _ids(rows) == [ids[0]] and not older and not newer
+
+
+def test_pages_are_per_user():
+    _notes(704, ["чужая"])
+    assert db.list_notes_page(705, limit=5) == ([], False, False)
+
+
+def test_find_pages_stay_within_matches():
+    ids = _notes(706, ["купить молоко", "позвонить", "молоко и хлеб", "молоко снова", "ещё молоко"])
+    matching = [ids[0], *ids[2:]]
+    rows, older, newer = db.find_notes_page(706, "молоко", limit=3)
+    assert _ids(rows) == matching[::-1][:3] and older and not newer
+    assert all("молоко" in r["snippet"] for r in rows)
+    rows, older, newer = db.find_notes_page(706, "молоко", before_id=rows[-1]["id"], limit=3)
+    assert _ids(rows) == matching[:1] and not older and newer
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+from telebot import types
+from telebot.handler_backends import CancelUpdate
+
+import ratelimit
+from ratelimit import BucketTable, RateLimiter, RateLimitMiddleware, command_of, parse_limit
+
+SLOW = 1 / 3600        # токен в час: за время теста ведро не наполняется
+
+
+def _message(user_id: int, text: str) -> types.Message:
+    return types.Message.de_json({
+        "message_id": 1, "date": 0, "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+    })
+
+
+@pytest.mark.parametrize("spec, limit", [
+    ("3/60", (0.05, 3.0)), ("10", (10.0, 10.0)), ("off", None), ("", None), ("0/60", None),
+])
+def test_parse_limit(spec, limit):
+    assert parse_limit(spec) == limit
+
+
+def test_command_of():
+    assert command_of("/Ask_Model@my_bot вопрос") == "ask_model"
+    assert command_of("просто текст") is None
+    assert command_of("/") is None
+
+
+def test_command_rejection_refunds_user_token():
+    limiter = RateLimiter({"ask": (SLOW, 1)}, user=(SLOW, 2))
+    assert limiter.check(1, "ask") == (0.0, False)
+    wait, notify = limiter.check(1, "ask")
+    assert wait > 0 and notify
+    assert limiter.check(1, "ask")[1] is False           # второй отказ за период — молча
+    assert limiter.check(1) == (0.0, False)              # общий запас не потрачен отказами
+    assert limiter.check(1)[0] > 0
+    assert limiter.stats()["rejected_by"] == {"ask": 2, "*": 1}
+
+
+def test_buckets_survive_restart(tmp_path):
+    path = str(tmp_path / "rate.db")
+    first = RateLimiter({}, user=(SLOW, 1), db_path=path)
+    assert first.check(7) == (0.0, False)
+    assert first.flush() == 1
+    second = RateLimiter({}, user=(SLOW, 1), db_path=path)
+    assert second.check(7)[0] > 0
+    assert second.check(8) == (0.0, False)
+
+
+def test_shared_llm_bucket_across_tables(tmp_path):
+    path = str(tmp_path / "rate.db")
+    a, b = BucketTable(path), BucketTable(path)       # как два процесса supervisor.py
+    assert a.take("llm", SLOW, 2) == 0.0
+    assert b.take("llm", SLOW, 2) == 0.0
+    assert a.take("llm", SLOW, 2) > 0
+
+
+def test_middleware_cancels_and_notifies_once():
+    class _Bot:
+        def __init__(self) -> None:
+            self.replies = []
+
+        def reply_to(self, message, text):
+            self.replies.append(text)
+
+    bot = _Bot()
+    mw = RateLimitMiddleware(bot, RateLimiter({"ask_model": (SLOW, 1)}, user=None))
+    assert mw.pre_process_message(_message(1, "/ask_model привет"), {}) is None
+    assert isinstance(mw.pre_process_message(_message(1, "/ask_model ещё"), {}), CancelUpdate)
+    assert isinstance(mw.pre_process_message(_message(1, "/ask_model и ещё"), {}), CancelUpdate)
+    assert mw.pre_process_message(_message(2, "/ask_model привет"), {}) is None
+    assert len(bot.replies) == 1 and bot.replies[0].startswith("⏳")
+
+
+def test_llm_slot_falls_back_to_process_bucket(monkeypatch):
+    class _LockedTable:
+        def take(self, key, rate, capacity):
+            raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(ratelimit, "_LLM_LIMIT", (SLOW, 1.0))
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_DB_PATH", "unused.db")
+    monkeypatch.setattr(ratelimit, "_llm_table", _LockedTable())
+    monkeypatch.setattr(ratelimit, "_llm_bucket", None)
+    assert ratelimit.llm_slot(max_wait_s=0) == 0.0
+    assert ratelimit.llm_slot(max_wait_s=0) > 0        # лимит при этом всё равно действует
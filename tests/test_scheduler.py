@@ -0,0 +1,36 @@
+import threading
+from datetime import datetime
+
+from scheduler import DailyScheduler
+
+NOW = datetime(2026, 5, 1, 10, 30)
+
+
+def _scheduler(schedule, run_hour=lambda now: None) -> DailyScheduler:
+    return DailyScheduler(schedule=schedule, run_hour=run_hour, clock=lambda: NOW)
+
+
+def test_next_fire_is_nearest_hour():
+    sch = _scheduler(lambda day: {8: 3, 12: 1, 23: 5})
+    assert sch.next_fire() == (datetime(2026, 5, 1, 12), 12)
+
+
+def test_current_hour_with_pending_fires_now_else_tomorrow():
+    assert _scheduler(lambda day: {10: 2, 12: 1}).next_fire() == (NOW, 10)
+    assert _scheduler(lambda day: {10: 0}).next_fire() == (datetime(2026, 5, 2, 10), 10)
+    assert _scheduler(lambda day: {}).next_fire() is None
+
+
+def test_no_refire_once_hour_is_done():
+    pending = {10: 1}
+
+    def run_hour(now):
+        pending[10] = 0             # всем отправлено (или ждут только отметки в БД)
+
+    sch = _scheduler(lambda day: dict(pending), run_hour)
+    t = threading.Thread(target=sch.run_forever)
+    t.start()
+    threading.Timer(0.3, sch.stop).start()
+    t.join(5)
+    assert not t.is_alive()
+    assert sch.runs == 1
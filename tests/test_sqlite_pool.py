@@ -0,0 +1,57 @@
+import gc
+import threading
+
+import sqlite_pool
+
+
+def test_connection_is_reused_within_thread(tmp_path):
+    pool = sqlite_pool.ConnectionPool(str(tmp_path / "a.db"))
+    assert pool.connection() is pool.connection()
+    assert pool.stats()["connections"] == 1
+    pool.close_all()
+
+
+def test_connection_closed_when_thread_exits(tmp_path):
+    pool = sqlite_pool.ConnectionPool(str(tmp_path / "a.db"))
+    pool.connection()                       # соединение главного потока остаётся
+    opened = []
+
+    def work():
+        conn = pool.connection()
+        conn.execute("SELECT 1").fetchone()
+        opened.append(conn)
+
+    for _ in range(20):
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+    gc.collect()
+    assert len(opened) == 20
+    assert pool.stats()["connections"] == 1
+    for conn in opened:
+        try:
+            conn.execute("SELECT 1")
+        except Exception as e:
+            assert "closed" in str(e)
+        else:
+            raise AssertionError("соединение завершившегося потока не закрыто")
+    pool.close_all()
+
+
+def test_close_all_then_thread_exit_is_harmless(tmp_path):
+    pool = sqlite_pool.ConnectionPool(str(tmp_path / "a.db"))
+    ready, done = threading.Event(), threading.Event()
+
+    def work():
+        pool.connection()
+        ready.set()
+        done.wait()
+
+    t = threading.Thread(target=work)
+    t.start()
+    ready.wait()
+    pool.close_all()
+    done.set()
+    t.join()
+    gc.collect()
+    assert pool.stats() == {"path": pool.path, "connections": 0, "closed": True}
@@ -0,0 +1,85 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+import stream_reply
+
+MSGS = [{"role": "user", "content": "одинаковый вопрос"}]
+
+
+class _Stream:
+    def __init__(self, text: str) -> None:
+        self.text, self.ttft_ms, self.total_ms = "", 5, 10
+        self._chunks = [text]
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            self.text += chunk
+            yield chunk
+
+
+class _Bot:
+    def __init__(self) -> None:
+        self.edits = []
+
+    def reply_to(self, message, text):
+        return SimpleNamespace(chat=SimpleNamespace(id=1), message_id=len(self.edits))
+
+    def edit_message_text(self, text, chat_id, message_id):
+        self.edits.append(text)
+
+
+@pytest.fixture
+def leader(monkeypatch):
+    """Ведущий /ask (fallback=True) висит в open_stream, пока не отпустят; ответила запасная модель."""
+    release, entered = threading.Event(), threading.Event()
+    calls = []
+
+    def open_stream(msgs, preferred, **kw):
+        entered.set()
+        release.wait(10)
+        return _Stream("ответ запасной"), "backup/model"
+
+    def chat_stream(msgs, model, **kw):
+        calls.append(model)
+        return _Stream("ответ основной")
+
+    monkeypatch.setattr(llm_cache, "lookup", lambda *a, **kw: None)
+    monkeypatch.setattr(llm_cache, "store", lambda *a, **kw: None)
+    monkeypatch.setattr(stream_reply.router, "open_stream", open_stream)
+    monkeypatch.setattr(stream_reply.router, "record", lambda *a, **kw: None)
+    monkeypatch.setattr(stream_reply, "chat_stream", chat_stream)
+    bot = _Bot()
+    t = threading.Thread(target=stream_reply.reply_streaming,
+                         args=(bot, None, MSGS), kwargs={"model": "main/model", "footer": str})
+    t.start()
+    assert entered.wait(10)
+    yield SimpleNamespace(release=release, calls=calls, bot=bot)
+    release.set()
+    t.join(10)
+
+
+def test_ask_model_does_not_join_fallback_request(leader):
+    bot = _Bot()
+    stream_reply.reply_streaming(bot, None, MSGS, model="main/model", footer=str, fallback=False)
+    assert leader.calls == ["main/model"]
+    assert bot.edits[-1].startswith("ответ основной")
+
+
+def test_follower_footer_names_fallback_model(leader):
+    bot = _Bot()
+    before = llm_cache.flights.coalesced
+    follower = threading.Thread(target=stream_reply.reply_streaming,
+                                args=(bot, None, MSGS), kwargs={"model": "main/model", "footer": str})
+    follower.start()
+    deadline = time.monotonic() + 10
+    while llm_cache.flights.coalesced == before:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    leader.release.set()
+    follower.join(10)
+    assert bot.edits[-1].startswith("ответ запасной")
+    assert "(общий запрос); ответила запасная модель backup/model" in bot.edits[-1]
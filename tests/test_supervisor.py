@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+import pytest
+
+import supervisor
+from supervisor import Supervisor, shard_of
+
+
+def _update(update_id: int, user_id: int) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi",
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+    }}
+
+
+def test_shard_of_uses_sender_then_chat():
+    assert shard_of(_update(1, 7), 4) == 3
+    call = {"update_id": 2, "callback_query": {"id": "1", "from": {"id": 9}, "data": "x"}}
+    assert shard_of(call, 4) == 1
+    post = {"update_id": 3, "channel_post": {"chat": {"id": 10}}}
+    assert shard_of(post, 4) == 2
+    assert shard_of({"update_id": 4}, 4) == 0
+
+
+def _seen(tmp_path) -> dict[int, set[int]]:
+    """pid -> update_id, которые обработал этот процесс."""
+    out = {}
+    for name in os.listdir(tmp_path):
+        with open(tmp_path / name) as f:
+            out[int(name.split(".")[0])] = {int(line) for line in f if line.strip()}
+    return out
+
+
+def _wait(predicate, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "не дождались"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def sup(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_BOT_DIR", str(tmp_path))
+    monkeypatch.setattr(supervisor, "RESTART_BACKOFF_S", (0.2, 1.0))
+    monkeypatch.setattr(supervisor, "HEALTH_CHECK_S", 0.05)
+    s = Supervisor("supervisor_fake_bot", workers=2)
+    s.start()
+    yield s
+    s.stop()
+
+
+def test_updates_of_one_user_go_to_one_worker(sup, tmp_path):
+    sup.process_new_updates([_update(i, user) for i, user in enumerate([1, 2, 3, 4, 5, 6], 1)])
+    _wait(lambda: sum(len(v) for v in _seen(tmp_path).values()) == 6)
+    by_pid = {p.pid: i for i, p in enumerate(sup.procs)}
+    assert {by_pid[pid]: ids for pid, ids in _seen(tmp_path).items()} == {1: {1, 3, 5}, 0: {2, 4, 6}}
+
+
+def test_crashed_worker_restarts_without_blocking_intake(sup, tmp_path):
+    old = sup.procs[0]
+    old.kill()
+    old.join()
+    t0 = time.monotonic()
+    sup.process_new_updates([_update(10, 2), _update(11, 1)])   # шард 0 сейчас без воркера
+    assert time.monotonic() - t0 < 0.5
+    _wait(lambda: sup.procs[0] is not old and sup.procs[0] is not None and sup.procs[0].is_alive())
+    assert sup.stats["crashes"] == 1
+    _wait(lambda: {10, 11} <= set().union(*_seen(tmp_path).values()))
+    assert 10 in _seen(tmp_path)[sup.procs[0].pid]
+
+
+def test_spawns_are_serialized(sup, monkeypatch):
+    active, overlap = [0], []
+    original = sup._spawn_locked
+
+    def tracking(i):
+        active[0] += 1
+        overlap.append(active[0])
+        try:
+            original(i)
+        finally:
+            active[0] -= 1
+
+    monkeypatch.setattr(sup, "_spawn_locked", tracking)
+    threads = [threading.Thread(target=sup.rolling_restart)]
+    sup.procs[1].kill()                     # монитор перезапустит его параллельно с rolling_restart
+    threads[0].start()
+    threads[0].join(60)
+    _wait(lambda: all(p is not None and p.is_alive() for p in sup.procs))
+    assert max(overlap) == 1
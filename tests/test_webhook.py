@@ -0,0 +1,87 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import runner
+from runner import WebhookServer
+
+SECRET = "s3cret"
+
+
+class _Bot:
+    def __init__(self) -> None:
+        self.updates = []
+
+    def process_new_updates(self, updates) -> None:
+        self.updates.extend(updates)
+
+
+@pytest.fixture
+def server():
+    bot = _Bot()
+    srv = WebhookServer(bot, host="127.0.0.1", port=0, path="/telegram", secret=SECRET,
+                        queue_size=1, workers=1, max_body=1024, parse=json.loads)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv, bot
+    srv.shutdown()
+    srv.server_close()
+
+
+def _post(srv, *, path="/telegram", secret=SECRET, body=b'{"update_id": 1}', length=None) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", srv.server_address[1], timeout=5)
+    headers = {"Content-Length": str(len(body) if length is None else length)}
+    if secret is not None:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    conn.putrequest("POST", path)
+    for k, v in headers.items():
+        conn.putheader(k, v)
+    conn.endheaders()
+    if length is None:
+        conn.send(body)
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def test_accepts_update_with_secret(server):
+    srv, bot = server
+    srv.start_workers()
+    assert _post(srv) == 200
+    for _ in range(50):
+        if bot.updates:
+            break
+        time.sleep(0.02)
+    assert bot.updates == [{"update_id": 1}]
+
+
+def test_rejects_wrong_path_and_secret_without_reading_body(server):
+    srv, _ = server
+    assert _post(srv, path="/other", length=10**9) == 404
+    assert _post(srv, secret="wrong", length=10**9) == 403
+    assert _post(srv, secret=None, length=10**9) == 403
+    assert srv.stats["forbidden"] == 2
+
+
+def test_rejects_oversized_body(server):
+    srv, _ = server
+    assert _post(srv, length=10**9) == 413
+    assert _post(srv, body=b"x" * 2048) == 413
+    assert _post(srv, length="abc") == 400
+    assert srv.stats["too_large"] == 2
+
+
+def test_full_queue_answers_503(server):
+    srv, _ = server                     # воркеры не запущены: очередь на 1 апдейт
+    assert _post(srv) == 200
+    assert _post(srv) == 503
+    assert srv.stats["rejected"] == 1
+
+
+def test_register_webhook_requires_secret(monkeypatch):
+    monkeypatch.setattr(runner, "WEBHOOK_URL", "https://example.com")
+    monkeypatch.setattr(runner, "WEBHOOK_SECRET", "")
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        runner.register_webhook(object())